@@ -0,0 +1,58 @@
+#
+# Align the predictions with the references, on the file name
+# hash join: a linear pass, no sort, works with partial results
+#
+
+
+def to_text(value):
+    # a file with no speech can have an empty (NaN) transcription
+    return value if isinstance(value, str) else ""
+
+
+def align_results(result_df, expected_df, key="file_name", text="txt"):
+    """
+    join the two DataFrames on key
+
+    return a dict with:
+    keys, preds, expected: the rows in both, in the order of expected_df
+    missing: keys in expected_df not in result_df
+    extra: keys in result_df not in expected_df
+    duplicates: keys repeated in one of the two (the first one is used)
+    """
+    # key -> prediction
+    preds_by_key = {}
+    duplicates = set()
+    for k, txt in zip(result_df[key].tolist(), result_df[text].tolist()):
+        if k in preds_by_key:
+            duplicates.add(k)
+        else:
+            preds_by_key[k] = txt
+
+    keys = []
+    preds = []
+    expected = []
+    missing = []
+    seen = set()
+    for k, txt in zip(expected_df[key].tolist(), expected_df[text].tolist()):
+        if k in seen:
+            duplicates.add(k)
+            continue
+        seen.add(k)
+
+        if k in preds_by_key:
+            keys.append(k)
+            preds.append(to_text(preds_by_key[k]))
+            expected.append(to_text(txt))
+        else:
+            missing.append(k)
+
+    extra = [k for k in preds_by_key if k not in seen]
+
+    return {
+        "keys": keys,
+        "preds": preds,
+        "expected": expected,
+        "missing": missing,
+        "extra": extra,
+        "duplicates": sorted(duplicates),
+    }
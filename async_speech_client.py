@@ -0,0 +1,148 @@
+#
+# asyncio version of SpeechClient
+# to submit and wait for many jobs from one event loop
+#
+import asyncio
+import threading
+import time
+
+from speech_client import SpeechClient
+from polling import PollingSchedule, estimate_job_duration
+
+from config import JOB_TIMEOUT
+
+# states in which the job is still running
+RUNNING_STATES = ["ACCEPTED", "IN_PROGRESS"]
+
+
+class AsyncSpeechClient:
+    """
+    wraps a SpeechClient
+    the calls to the OCI SDK are blocking, so they run in a thread
+
+    progress: dict job_id -> (status, percent_complete), updated at every poll
+    """
+
+    def __init__(self, speech_client=None, **kwargs):
+        if speech_client is None:
+            speech_client = SpeechClient(**kwargs)
+
+        self.speech_client = speech_client
+        self.progress = {}
+
+    async def create_transcription_job(self, transcription_job_details):
+        transcription_job = await asyncio.to_thread(
+            self.speech_client.create_transcription_job, transcription_job_details
+        )
+        self.progress[transcription_job.data.id] = (
+            transcription_job.data.lifecycle_state,
+            0,
+        )
+
+        return transcription_job
+
+    async def get_transcription_job(self, job_id):
+        return await asyncio.to_thread(self.speech_client.get_job, job_id)
+
+    async def wait_for_job_completion(
+        self, job_id, audio_duration=None, timeout=JOB_TIMEOUT, progress_callback=None
+    ):
+        """
+        wait for the job to complete and return the final status
+        same polling as SpeechClient.wait_for_job_completion
+
+        progress_callback: called as progress_callback(job_id, status, percent)
+        if the task is cancelled, the job is canceled too
+        """
+        status = "ACCEPTED"
+
+        eta = estimate_job_duration(audio_duration) if audio_duration else None
+        schedule = PollingSchedule(eta=eta)
+
+        t_start = time.time()
+        try:
+            while status in RUNNING_STATES:
+                elapsed = time.time() - t_start
+
+                if elapsed >= timeout:
+                    print(f"Timeout for JOB {job_id} after {round(elapsed)} s.")
+                    await asyncio.to_thread(self.speech_client.cancel_job, job_id)
+                    status = "CANCELED"
+                    break
+
+                await asyncio.sleep(
+                    min(schedule.next_interval(elapsed), timeout - elapsed)
+                )
+
+                current_job = await self.get_transcription_job(job_id)
+                status = current_job.data.lifecycle_state
+                percent = current_job.data.percent_complete or 0
+
+                self.progress[job_id] = (status, percent)
+                if progress_callback is not None:
+                    progress_callback(job_id, status, percent)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.speech_client.cancel_job, job_id)
+            self.progress[job_id] = ("CANCELED", self.progress.get(job_id, ("", 0))[1])
+            raise
+
+        return status
+
+    async def submit_and_wait(self, transcription_job_details, **kwargs):
+        """
+        create the job and wait for it
+        return the job and the final status
+        """
+        transcription_job = await self.create_transcription_job(
+            transcription_job_details
+        )
+        status = await self.wait_for_job_completion(transcription_job.data.id, **kwargs)
+
+        return transcription_job, status
+
+    async def wait_all(self, job_ids, **kwargs):
+        """
+        wait for all the jobs, concurrently
+        return the list of final statuses
+        """
+        return await asyncio.gather(
+            *[self.wait_for_job_completion(job_id, **kwargs) for job_id in job_ids]
+        )
+
+
+class BackgroundLoop:
+    """
+    an event loop running in a daemon thread
+
+    used from Streamlit: the script submits a coroutine and gets back
+    a concurrent.futures.Future, so it can keep updating the UI while waiting
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        # blocking, returns the result of the coroutine
+        return self.submit(coro).result()
+
+
+_background_loop = None
+_background_lock = threading.Lock()
+
+
+def get_background_loop():
+    """
+    the BackgroundLoop shared by the whole process
+    """
+    global _background_loop
+
+    with _background_lock:
+        if _background_loop is None:
+            _background_loop = BackgroundLoop()
+
+    return _background_loop
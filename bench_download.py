@@ -0,0 +1,125 @@
+#
+# Benchmark: download of JSON results, serial loop vs parallel
+# runs against a local mock Object Storage (no OCI credentials needed)
+#
+import argparse
+import json
+import os
+from os import path
+from os.path import basename
+import shutil
+import tempfile
+import time
+
+from mock_oci import MockFileSystem
+from utils import clean_directory, copy_json_from_oss, iter_json_from_oss
+
+from config import NAMESPACE, JSON_EXT
+
+OUTPUT_BUCKET = "speech_output"
+OUTPUT_PREFIX = "bench"
+
+
+def parser_add_args(parser):
+    parser.add_argument(
+        "--n_files",
+        type=int,
+        default=200,
+        help="Number of JSON files in the mock bucket",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.02,
+        help="Latency (sec.) added to every mock call",
+    )
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=16,
+        help="Number of parallel workers",
+    )
+
+    return parser
+
+
+def populate_bucket(fs, n_files):
+    # a minimal OCI Speech output for every file
+    for i in range(n_files):
+        d_json = {"transcriptions": [{"transcription": f"transcription {i}"}]}
+
+        with fs.open(
+            f"{OUTPUT_BUCKET}@{NAMESPACE}/{OUTPUT_PREFIX}/file{i}.{JSON_EXT}", "w"
+        ) as f:
+            json.dump(d_json, f)
+
+
+def serial_copy(fs, local_json_dir):
+    # the original loop: one fs.get at a time
+    list_json = fs.glob(f"{OUTPUT_BUCKET}@{NAMESPACE}/{OUTPUT_PREFIX}/*.{JSON_EXT}")
+
+    for f_name in list_json:
+        fs.get(f_name, path.join(local_json_dir, basename(f_name)))
+
+    return list_json
+
+
+def timed(func, *args):
+    t_start = time.time()
+    result = func(*args)
+
+    return result, time.time() - t_start
+
+
+#
+# Main
+#
+parser = argparse.ArgumentParser()
+parser = parser_add_args(parser)
+args = parser.parse_args()
+
+work_dir = tempfile.mkdtemp()
+local_json_dir = path.join(work_dir, "json")
+os.makedirs(local_json_dir)
+
+try:
+    # populate without latency
+    populate_bucket(MockFileSystem(path.join(work_dir, "oss")), args.n_files)
+
+    fs = MockFileSystem(path.join(work_dir, "oss"), latency=args.latency)
+
+    _, t_serial = timed(serial_copy, fs, local_json_dir)
+    clean_directory(local_json_dir, JSON_EXT)
+
+    _, t_parallel = timed(
+        copy_json_from_oss,
+        fs,
+        local_json_dir,
+        JSON_EXT,
+        OUTPUT_PREFIX,
+        OUTPUT_BUCKET,
+        args.max_workers,
+    )
+
+    _, t_stream = timed(
+        lambda: list(
+            iter_json_from_oss(
+                fs, JSON_EXT, OUTPUT_PREFIX, OUTPUT_BUCKET, args.max_workers
+            )
+        )
+    )
+
+    print()
+    print(f"Files: {args.n_files}, latency: {args.latency} s.")
+    print(f"Serial download: {round(t_serial, 2)} sec.")
+    print(
+        f"Parallel download ({args.max_workers} workers): {round(t_parallel, 2)} sec., "
+        f"speedup: {round(t_serial / t_parallel, 1)}x"
+    )
+    print(
+        f"Parallel streaming, no disk ({args.max_workers} workers): "
+        f"{round(t_stream, 2)} sec., speedup: {round(t_serial / t_stream, 1)}x"
+    )
+    print()
+finally:
+    shutil.rmtree(work_dir)
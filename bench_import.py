@@ -0,0 +1,143 @@
+#
+# Benchmark: startup time of the entry points
+# wall time of every command and the slowest imports, from python -X importtime
+#
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# demo1 must start without the heavy packages
+SCRIPTS = ["demo1.py --help"]
+
+# the modules imported by demo2 and demo3 (streamlit is not measured)
+MODULES = [
+    "utils",
+    "speech_client",
+    "async_speech_client",
+    "result_stream",
+    "transcription_cache",
+    "transcription_store",
+    "output_sinks",
+    "evaluation_cache",
+    "alignment",
+    "normalization",
+]
+
+
+def parser_add_args(parser):
+    parser.add_argument(
+        "--scripts",
+        type=str,
+        nargs="+",
+        default=SCRIPTS,
+        help="Commands to measure (script and args, in quotes)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Runs for every command",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        help="Number of imports to show, the slowest",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="If provided, JSON file for the results",
+    )
+
+    return parser
+
+
+def parse_importtime(stderr):
+    """
+    the lines of -X importtime, only the top level imports
+    return a list of (name, cumulative time in ms.), slowest first
+    """
+    imports = []
+
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line.split("|")
+
+        # nested imports are indented
+        if name.startswith("  "):
+            continue
+
+        imports.append((name.strip(), int(cumulative) / 1000))
+
+    return sorted(imports, key=lambda item: item[1], reverse=True)
+
+
+def measure(cmd_args, repeat):
+    """
+    median wall time (sec.) of the command, and its imports
+    """
+    times = []
+    for _ in range(repeat):
+        t_start = time.perf_counter()
+        subprocess.run(
+            [sys.executable] + cmd_args, capture_output=True, check=True, text=True
+        )
+        times.append(time.perf_counter() - t_start)
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + cmd_args,
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    return statistics.median(times), parse_importtime(result.stderr)
+
+
+def print_result(name, wall_time, imports, top):
+    print(f"{name}: {round(wall_time, 3)} sec. (median)")
+
+    for import_name, cumulative in imports[:top]:
+        print(f"    {import_name:<30} {round(cumulative, 1):>8} ms.")
+    print()
+
+
+#
+# Main
+#
+parser = argparse.ArgumentParser()
+parser = parser_add_args(parser)
+args = parser.parse_args()
+
+commands = [(script, script.split()) for script in args.scripts]
+commands.append(("import modules", ["-c", "import " + ", ".join(MODULES)]))
+
+results = []
+for name, cmd_args in commands:
+    wall_time, imports = measure(cmd_args, args.repeat)
+    print_result(name, wall_time, imports, args.top)
+
+    results.append(
+        {
+            "command": name,
+            "wall_time": wall_time,
+            "imports": [
+                {"name": import_name, "cumulative_ms": cumulative}
+                for import_name, cumulative in imports[: args.top]
+            ],
+        }
+    )
+
+if args.output is not None:
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"Results saved in {args.output}")
+    print()
@@ -0,0 +1,294 @@
+#
+# Benchmark: the whole pipeline, stage by stage
+# clean -> upload -> submit -> poll -> download -> parse -> csv
+# runs against the local mocks (no OCI credentials needed)
+# the results (latency percentiles, throughput) are saved as JSON
+#
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+from os import path
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+from mock_oci import MockFileSystem, MockAIServiceSpeechClient
+from speech_client import SpeechClient
+from transcription_store import TranscriptionStore
+from output_sinks import CSVSink
+from utils import (
+    clean_bucket,
+    clean_directory,
+    copy_files_to_oss,
+    copy_json_from_oss,
+)
+
+from config import JSON_EXT, SAMPLE_RATE
+
+INPUT_BUCKET = "speech_input"
+OUTPUT_BUCKET = "speech_output"
+JOB_PREFIX = "bench"
+
+STAGES = ["clean", "upload", "submit", "poll", "download", "parse", "csv"]
+PERCENTILES = [50, 90, 99]
+
+
+def parser_add_args(parser):
+    parser.add_argument(
+        "--n_files",
+        type=int,
+        nargs="+",
+        default=[10, 100],
+        help="Number of audio files (one or more values)",
+    )
+    parser.add_argument(
+        "--file_mb",
+        type=float,
+        nargs="+",
+        default=[0.5],
+        help="Size (MB) of every audio file (one or more values)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1, 8],
+        help="Workers for upload and download (one or more values)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Runs for every combination",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.02,
+        help="Latency (sec.) added to every mock call",
+    )
+    parser.add_argument(
+        "--bandwidth",
+        type=float,
+        default=100,
+        help="Bandwidth (MB/s) of the mock Object Storage",
+    )
+    parser.add_argument(
+        "--failure_rate",
+        type=float,
+        default=0.0,
+        help="Probability that a mock call fails (503), to measure the retries",
+    )
+    parser.add_argument(
+        "--job_duration",
+        type=float,
+        default=1.0,
+        help="Duration (sec.) of every mock transcription job",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="bench_pipeline.json",
+        help="JSON file for the results",
+    )
+
+    return parser
+
+
+def create_files(audio_dir, n_files, file_mb):
+    # 16 bit mono wav, 2 bytes for every sample
+    rng = np.random.default_rng(42)
+    n_samples = int(file_mb * 1024 * 1024 / 2)
+
+    for i in range(n_files):
+        data = (0.1 * rng.standard_normal(n_samples)).astype(np.float32)
+        sf.write(path.join(audio_dir, f"file{i}.wav"), data, SAMPLE_RATE)
+
+
+def run_pipeline(fs, speech_client, audio_dir, json_dir, csv_name, workers):
+    """
+    run all the stages once
+    return a dict stage -> elapsed time (sec.)
+    """
+    timings = {}
+
+    def stage(name, func, *args, **kwargs):
+        t_start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings[name] = time.perf_counter() - t_start
+
+        return result
+
+    stage("clean", clean_bucket, fs, INPUT_BUCKET)
+    file_names = stage(
+        "upload", copy_files_to_oss, fs, audio_dir, INPUT_BUCKET, max_workers=workers
+    )
+
+    job_details = speech_client.create_transcription_job_details(
+        INPUT_BUCKET, OUTPUT_BUCKET, file_names, JOB_PREFIX, JOB_PREFIX, "en-GB"
+    )
+    job = stage("submit", speech_client.create_transcription_job, job_details)
+    status = stage("poll", speech_client.wait_for_job_completion, job.data.id)
+
+    if status != "SUCCEEDED":
+        raise RuntimeError(f"Job ended {status}")
+
+    clean_directory(json_dir, JSON_EXT)
+    stage(
+        "download",
+        copy_json_from_oss,
+        fs,
+        json_dir,
+        JSON_EXT,
+        job.data.output_location.prefix,
+        OUTPUT_BUCKET,
+        max_workers=workers,
+    )
+
+    store = TranscriptionStore(INPUT_BUCKET)
+    stage("parse", store.update_from_dir, json_dir)
+
+    def write_csv():
+        with CSVSink(csv_name) as sink:
+            for record in store.sorted_records():
+                sink.write(record)
+
+    stage("csv", write_csv)
+
+    return timings
+
+
+def summarize(runs, n_files, file_mb):
+    """
+    percentiles for every stage, throughput of the whole pipeline
+    """
+    result = {"stages": {}}
+
+    for name in STAGES + ["total"]:
+        values = np.array([run[name] for run in runs])
+
+        result["stages"][name] = {
+            "mean": float(values.mean()),
+            **{f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES},
+        }
+
+    total = result["stages"]["total"]["p50"]
+    result["files_per_sec"] = n_files / total
+    result["mb_per_sec"] = n_files * file_mb / total
+
+    return result
+
+
+#
+# Main
+#
+parser = argparse.ArgumentParser()
+parser = parser_add_args(parser)
+args = parser.parse_args()
+
+work_dir = tempfile.mkdtemp()
+results = []
+
+try:
+    for n_files, file_mb in itertools.product(args.n_files, args.file_mb):
+        audio_dir = path.join(work_dir, f"audio_{n_files}_{file_mb}")
+        os.makedirs(audio_dir)
+        create_files(audio_dir, n_files, file_mb)
+
+        for workers in args.workers:
+            oss_dir = path.join(work_dir, "oss")
+            json_dir = path.join(work_dir, "json")
+            os.makedirs(json_dir, exist_ok=True)
+
+            fs = MockFileSystem(
+                oss_dir,
+                latency=args.latency,
+                bandwidth=args.bandwidth * 1024 * 1024,
+                failure_rate=args.failure_rate,
+            )
+            ai_client = MockAIServiceSpeechClient(
+                fs,
+                job_duration=args.job_duration,
+                latency=args.latency,
+                failure_rate=args.failure_rate,
+            )
+            speech_client = SpeechClient(ai_client=ai_client)
+
+            runs = []
+            n_failed = 0
+            for _ in range(args.repeat):
+                # the output of the pipeline is not interesting here
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        with contextlib.redirect_stderr(io.StringIO()):
+                            run = run_pipeline(
+                                fs,
+                                speech_client,
+                                audio_dir,
+                                json_dir,
+                                path.join(work_dir, "result.csv"),
+                                workers,
+                            )
+                except Exception as e:
+                    # a failure not recovered by the retries
+                    print(f"Run failed: {e}")
+                    n_failed += 1
+                    continue
+
+                run["total"] = sum(run.values())
+                runs.append(run)
+
+            shutil.rmtree(oss_dir)
+
+            # injected by the mocks, most of them recovered by the retries
+            n_injected = sum(fs.injector.failures.values()) + sum(
+                ai_client.injector.failures.values()
+            )
+
+            result = {
+                "n_files": n_files,
+                "file_mb": file_mb,
+                "workers": workers,
+                "repeat": args.repeat,
+                "latency": args.latency,
+                "bandwidth_mb": args.bandwidth,
+                "job_duration": args.job_duration,
+                "failure_rate": args.failure_rate,
+                "failed_runs": n_failed,
+                "injected_failures": n_injected,
+            }
+            if not runs:
+                results.append(result)
+                print(
+                    f"files: {n_files}, {file_mb} MB, workers: {workers}: all runs failed"
+                )
+                continue
+
+            result.update(summarize(runs, n_files, file_mb))
+            results.append(result)
+
+            print(
+                f"files: {n_files}, {file_mb} MB, workers: {workers}: "
+                + ", ".join(
+                    f"{name} {round(result['stages'][name]['p50'], 3)}"
+                    for name in STAGES
+                )
+                + f" (p50, sec.), {round(result['files_per_sec'], 1)} files/sec., "
+                f"failed runs: {n_failed}/{args.repeat}, "
+                f"injected failures: {n_injected}"
+            )
+finally:
+    shutil.rmtree(work_dir)
+
+with open(args.output, "w") as f:
+    json.dump(results, f, indent=2)
+
+print()
+print(f"Results saved in {args.output}")
+print()
@@ -0,0 +1,162 @@
+#
+# Benchmark: latency added by polling, to detect the end of a job
+# fixed SLEEP_TIME vs adaptive polling, on the local mock
+# uses a simulated clock, so it runs in a few seconds
+#
+import argparse
+import random
+
+import mock_oci
+import speech_client
+from mock_oci import MockFileSystem, MockAIServiceSpeechClient
+from speech_client import SpeechClient
+from polling import PollingSchedule, estimate_job_duration
+
+from config import SLEEP_TIME, JOB_OVERHEAD, JOB_TIME_RATIO
+
+
+class SimulatedClock:
+    # replaces the time module: sleep() only moves the clock forward
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, secs):
+        self.now += secs
+
+
+class FixedSchedule:
+    # the original loop: always SLEEP_TIME
+    def __init__(self, eta=None):
+        pass
+
+    def next_interval(self, elapsed):
+        return SLEEP_TIME
+
+
+class CountingSpeechClient(MockAIServiceSpeechClient):
+    # counts the calls to get_transcription_job
+    n_calls = 0
+
+    def get_transcription_job(self, transcription_job_id):
+        self.n_calls += 1
+
+        return super().get_transcription_job(transcription_job_id)
+
+
+def parser_add_args(parser):
+    parser.add_argument(
+        "--n_jobs",
+        type=int,
+        default=200,
+        help="Number of simulated jobs",
+    )
+    parser.add_argument(
+        "--max_audio",
+        type=float,
+        default=3600,
+        help="Max total audio duration (sec.) of a job",
+    )
+    parser.add_argument(
+        "--eta_error",
+        type=float,
+        default=0.3,
+        help="Real job duration is the estimate +/- this fraction",
+    )
+
+    return parser
+
+
+def run_jobs(schedule_class, job_durations, use_eta):
+    """
+    return, for every job, the detection latency (sec.) and the number of API calls
+    """
+    clock = SimulatedClock()
+    speech_client.time = clock
+    mock_oci.time = clock
+    speech_client.PollingSchedule = schedule_class
+
+    results = []
+    for audio_duration, job_duration in job_durations:
+        ai_client = CountingSpeechClient(MockFileSystem("mock_oss"), job_duration)
+        client = SpeechClient(ai_client=ai_client)
+
+        job = ai_client.create_transcription_job(job_details)
+        # the mock writes the outputs when the job ends, here we don't need them
+        ai_client._write_outputs = lambda job, n_files: None
+
+        t_start = clock.time()
+        client.wait_for_job_completion(
+            job.data.id, audio_duration=audio_duration if use_eta else None
+        )
+
+        results.append((clock.time() - t_start - job_duration, ai_client.n_calls))
+
+    return results
+
+
+def print_stats(name, results, job_durations, selected):
+    latencies = [results[i][0] for i in selected]
+    n_calls = [results[i][1] for i in selected]
+
+    print(
+        f"{name:>16}: mean detection latency {round(sum(latencies) / len(latencies), 2)} s., "
+        f"mean API calls per job {round(sum(n_calls) / len(n_calls), 1)}"
+    )
+
+
+#
+# Main
+#
+parser = argparse.ArgumentParser()
+parser = parser_add_args(parser)
+args = parser.parse_args()
+
+# the request, as built by SpeechClient (the mock reads only a few fields)
+job_details = SpeechClient(
+    ai_client=MockAIServiceSpeechClient(MockFileSystem("mock_oss"))
+).create_transcription_job_details("", "", ["a.wav"], "bench", "bench", "en-GB")
+
+random.seed(42)
+job_durations = []
+for _ in range(args.n_jobs):
+    audio_duration = random.uniform(5, args.max_audio)
+    # real job duration: the estimate +/- eta_error
+    job_duration = estimate_job_duration(audio_duration) * random.uniform(
+        1 - args.eta_error, 1 + args.eta_error
+    )
+    job_durations.append((audio_duration, job_duration))
+
+# silence the prints of wait_for_job_completion
+speech_client.print = lambda *a, **k: None
+
+results = {
+    f"fixed {SLEEP_TIME} s": run_jobs(FixedSchedule, job_durations, False),
+    "adaptive": run_jobs(PollingSchedule, job_durations, False),
+    "adaptive + ETA": run_jobs(PollingSchedule, job_durations, True),
+}
+
+print()
+print(f"Jobs: {args.n_jobs}, audio up to {args.max_audio} s.")
+print(
+    f"Job duration: ({JOB_OVERHEAD} s. + audio * {JOB_TIME_RATIO}) "
+    f"+/- {int(args.eta_error * 100)}%"
+)
+
+all_jobs = list(range(len(job_durations)))
+short_jobs = [i for i in all_jobs if job_durations[i][1] < 60]
+
+for title, selected in [
+    ("All jobs", all_jobs),
+    ("Jobs shorter than 60 s.", short_jobs),
+]:
+    if not selected:
+        continue
+
+    print()
+    print(f"{title} ({len(selected)}):")
+    for name, result in results.items():
+        print_stats(name, result, job_durations, selected)
+print()
@@ -0,0 +1,100 @@
+#
+# Benchmark: check of the sample rate
+# decoding the whole file (sf.read) vs reading only the header (sf.info)
+#
+import argparse
+import glob
+from os import path
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+from utils import probe_audio, scan_audio_dir
+
+from config import SAMPLE_RATE
+
+
+def parser_add_args(parser):
+    parser.add_argument(
+        "--n_files",
+        type=int,
+        default=20,
+        help="Number of synthetic flac files",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=120,
+        help="Duration (sec.) of every file",
+    )
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=8,
+        help="Number of parallel workers for the scan",
+    )
+
+    return parser
+
+
+def create_files(audio_dir, n_files, duration):
+    rng = np.random.default_rng(42)
+    n_samples = int(duration * SAMPLE_RATE)
+
+    for i in range(n_files):
+        data = (0.1 * rng.standard_normal(n_samples)).astype(np.float32)
+        sf.write(path.join(audio_dir, f"file{i}.flac"), data, SAMPLE_RATE)
+
+
+def check_with_read(list_files):
+    # the original implementation: the whole file is decoded
+    results = []
+    for f_name in list_files:
+        vet, s_rate = sf.read(f_name)
+        results.append(s_rate == SAMPLE_RATE)
+
+    return results
+
+
+def check_with_probe(list_files):
+    return [probe_audio(f_name)["sample_rate"] == SAMPLE_RATE for f_name in list_files]
+
+
+def timed(func, *args, **kwargs):
+    t_start = time.time()
+    func(*args, **kwargs)
+
+    return time.time() - t_start
+
+
+#
+# Main
+#
+parser = argparse.ArgumentParser()
+parser = parser_add_args(parser)
+args = parser.parse_args()
+
+audio_dir = tempfile.mkdtemp()
+
+try:
+    create_files(audio_dir, args.n_files, args.duration)
+    list_files = sorted(glob.glob(path.join(audio_dir, "*.flac")))
+
+    t_read = timed(check_with_read, list_files)
+    t_probe = timed(check_with_probe, list_files)
+    t_scan = timed(scan_audio_dir, audio_dir, "flac", max_workers=args.max_workers)
+
+    print()
+    print(f"Files: {args.n_files} flac, {args.duration} s. each")
+    print(f"sf.read (decode all): {round(t_read, 3)} sec.")
+    print(f"header only: {round(t_probe, 3)} sec., speedup: {round(t_read / t_probe)}x")
+    print(
+        f"header only, {args.max_workers} workers: {round(t_scan, 3)} sec., "
+        f"speedup: {round(t_read / t_scan)}x"
+    )
+    print()
+finally:
+    shutil.rmtree(audio_dir)
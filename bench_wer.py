@@ -0,0 +1,128 @@
+#
+# Benchmark: WER on a synthetic corpus
+# wer.py (serial and parallel) vs jiwer and evaluate, if installed
+#
+import argparse
+import time
+
+import numpy as np
+
+from wer import compute_wer
+
+
+def parser_add_args(parser):
+    parser.add_argument(
+        "--n_utterances",
+        type=int,
+        default=100000,
+        help="Number of synthetic utterances",
+    )
+    parser.add_argument(
+        "--max_words",
+        type=int,
+        default=30,
+        help="Max number of words in an utterance",
+    )
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=4,
+        help="Number of processes for the parallel run",
+    )
+
+    return parser
+
+
+def create_corpus(n_utterances, max_words, error_rate=0.15):
+    """
+    references with random words, predictions with random
+    substitutions, deletions and insertions
+    """
+    rng = np.random.default_rng(42)
+    vocab = [f"word{i}" for i in range(1000)]
+
+    references = []
+    predictions = []
+    for _ in range(n_utterances):
+        words = list(rng.choice(vocab, rng.integers(1, max_words + 1)))
+
+        pred = []
+        for word in words:
+            x = rng.random()
+            if x < error_rate / 3:
+                # deletion
+                continue
+            if x < 2 * error_rate / 3:
+                pred.append(rng.choice(vocab))
+                continue
+            pred.append(word)
+            if x > 1 - error_rate / 3:
+                pred.append(rng.choice(vocab))
+
+        references.append(" ".join(words))
+        # evaluate and jiwer don't accept empty predictions
+        predictions.append(" ".join(pred) or "empty")
+
+    return predictions, references
+
+
+def timed(func, *args, **kwargs):
+    t_start = time.time()
+    result = func(*args, **kwargs)
+
+    return time.time() - t_start, result
+
+
+def print_result(name, t_ela, wer_score, n_utterances):
+    print(
+        f"{name}: {round(t_ela, 2)} sec., "
+        f"{round(n_utterances / t_ela)} utterances/sec., WER: {round(wer_score, 4)}"
+    )
+
+
+#
+# Main
+#
+parser = argparse.ArgumentParser()
+parser = parser_add_args(parser)
+args = parser.parse_args()
+
+predictions, references = create_corpus(args.n_utterances, args.max_words)
+
+print()
+print(f"Utterances: {args.n_utterances}, max {args.max_words} words")
+
+t_ela, wer_score = timed(compute_wer, predictions, references, max_workers=1)
+print_result("wer.py, serial", t_ela, wer_score, args.n_utterances)
+
+t_ela, wer_score = timed(
+    compute_wer,
+    predictions,
+    references,
+    max_workers=args.max_workers,
+    parallel_min=0,
+)
+print_result(
+    f"wer.py, {args.max_workers} processes", t_ela, wer_score, args.n_utterances
+)
+
+try:
+    import jiwer
+
+    t_ela, wer_score = timed(jiwer.wer, references, predictions)
+    print_result("jiwer", t_ela, wer_score, args.n_utterances)
+except ImportError:
+    print("jiwer not installed, skipped")
+
+try:
+    from evaluate import load
+
+    t_load, wer_metric = timed(load, "wer")
+    t_ela, wer_score = timed(
+        wer_metric.compute, predictions=predictions, references=references
+    )
+    print_result("evaluate", t_ela, wer_score, args.n_utterances)
+    print(f"evaluate, load('wer'): {round(t_load, 2)} sec.")
+except ImportError:
+    print("evaluate not installed, skipped")
+print()
@@ -2,10 +2,8 @@
 # Check the sample rate for all files in a dir
 #
 import argparse
-from os import path
-import glob
 
-from utils import check_sample_rate
+from utils import scan_audio_dir
 
 from config import (
     COMPARTMENT_ID,
@@ -13,6 +11,7 @@ from config import (
     EXT,
     JSON_EXT,
     WAV_DIR,
+    PROBE_WORKERS,
 )
 
 
@@ -29,6 +28,12 @@ def parser_add_args(parser):
         required=True,
         help="Expected sample rate (es: 16000)",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=PROBE_WORKERS,
+        help="Number of files checked in parallel",
+    )
 
     return parser
 
@@ -45,10 +50,25 @@ print("Checking the sampling rate of audio files..")
 print(f"Expected sample_rate is: {SAMPLE_RATE}")
 print()
 
-list_wav = sorted(glob.glob(path.join(WAV_DIR, f"*.{EXT}")))
+# only the headers are read, in parallel
+list_info = scan_audio_dir(WAV_DIR, EXT, max_workers=args.workers)
+
+n_ok = 0
+for info in list_info:
+    f_name = info["file_name"]
+
+    if "error" in info:
+        print(f"Checking {f_name}, error: {info['error']}")
+        continue
 
-for f_name in list_wav:
-    is_ok = check_sample_rate(f_name, SAMPLE_RATE)
-    print(f"Checking {f_name}, OK: {is_ok}")
+    is_ok = info["sample_rate"] == SAMPLE_RATE
+    n_ok += int(is_ok)
 
+    print(
+        f"Checking {f_name}, OK: {is_ok} ({info['sample_rate']} Hz, "
+        f"{info['channels']} ch., {round(info['duration'], 1)} s., {info['subtype']})"
+    )
+
+print()
+print(f"{n_ok} of {len(list_info)} files have the expected sample rate.")
 print()
@@ -0,0 +1,159 @@
+#
+# Process-wide registry of the OCI clients
+# the signer, the Speech client and the OCIFileSystem are created once
+# and shared by all the threads; HTTP connections are kept alive and reused
+#
+import threading
+
+from mock_oci import MockFileSystem, MockAIServiceSpeechClient, is_mock_enabled
+from tracing import tracer
+
+from config import (
+    OCI_CONFIG_FILE,
+    OCI_PROFILE,
+    POOL_MAXSIZE,
+    MOCK_ROOT_DIR,
+    MOCK_JOBS_DIR,
+    MOCK_JOB_DURATION,
+    MOCK_LATENCY,
+    MOCK_FAILURE_RATE,
+)
+
+
+def configure_pool(client, pool_maxsize=POOL_MAXSIZE):
+    """
+    a bigger connection pool for an OCI SDK client
+    (by default 10 connections, fewer than the upload/download workers:
+    the connections over the limit are closed, not reused)
+    """
+    from oci.base_client import OCIHTTPAdapter
+
+    # the OCI adapter keeps the SDK behaviour (Expect header, hostnames)
+    client.base_client.session.mount(
+        "https://", OCIHTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+    )
+
+    return client
+
+
+class ClientRegistry:
+    """
+    every object is created once, on first use, then shared (thread safe)
+    with the mocks enabled (see mock_oci) the mocks are returned
+    """
+
+    def __init__(self, config_file=OCI_CONFIG_FILE, profile=OCI_PROFILE):
+        self.config_file = config_file
+        self.profile = profile
+
+        # reentrant: a factory can ask for other objects (ex: the signer)
+        self.lock = threading.RLock()
+        self.objects = {}
+
+    def get(self, key, factory):
+        """
+        the object for key, created with factory() only the first time
+        """
+        # fast path, no lock when already created (the signer can be None)
+        objects = self.objects
+        if key in objects:
+            return objects[key]
+
+        with self.lock:
+            if key not in self.objects:
+                self.objects[key] = factory()
+                tracer.count("clients_created_total", client=key)
+
+            return self.objects[key]
+
+    def clear(self):
+        # the next calls create new objects (ex: after a change of credentials)
+        with self.lock:
+            self.objects = {}
+
+    def get_signer(self):
+        """
+        the Resource Principal signer, None if not available (API key is used)
+        """
+
+        def create_signer():
+            import oci
+
+            try:
+                return oci.auth.signers.get_resource_principals_signer()
+            except Exception:
+                return None
+
+        return self.get("signer", create_signer)
+
+    def get_config(self):
+        """
+        the OCI config: from the file with API key, only the region with RP
+        """
+
+        def create_config():
+            import oci
+
+            signer = self.get_signer()
+            if signer is not None:
+                return {"region": signer.region}
+
+            return oci.config.from_file(self.config_file, self.profile)
+
+        return self.get("config", create_config)
+
+    def get_speech_client(self):
+        """
+        the AIServiceSpeechClient
+        """
+
+        def create_speech_client():
+            if is_mock_enabled():
+                # local mock, writes the outputs where get_ocifs() reads them
+                return MockAIServiceSpeechClient(
+                    self.get_ocifs(),
+                    job_duration=MOCK_JOB_DURATION,
+                    latency=MOCK_LATENCY,
+                    failure_rate=MOCK_FAILURE_RATE,
+                    jobs_dir=MOCK_JOBS_DIR,
+                )
+
+            import oci
+
+            client = oci.ai_speech.AIServiceSpeechClient(
+                self.get_config(), signer=self.get_signer()
+            )
+
+            return configure_pool(client)
+
+        return self.get("speech_client", create_speech_client)
+
+    def get_ocifs(self):
+        """
+        the OCIFileSystem
+        """
+
+        def create_ocifs():
+            if is_mock_enabled():
+                # local mock, no OCI credentials needed
+                return MockFileSystem(
+                    MOCK_ROOT_DIR, latency=MOCK_LATENCY, failure_rate=MOCK_FAILURE_RATE
+                )
+
+            from ocifs import OCIFileSystem
+
+            signer = self.get_signer()
+            if signer is not None:
+                fs = OCIFileSystem(signer=signer, region=signer.region)
+            else:
+                fs = OCIFileSystem(config=self.get_config())
+
+            configure_pool(fs.oci_client)
+
+            return fs
+
+        return self.get("ocifs", create_ocifs)
+
+
+# the registry used by the whole process
+registry = ClientRegistry()
@@ -4,6 +4,82 @@
 DEBUG = True
 SLEEP_TIME = 10
 
+# adaptive polling of the job status
+# without an ETA: first polls every POLL_MIN_INTERVAL sec., then interval
+# grows by POLL_BACKOFF_FACTOR up to POLL_MAX_INTERVAL, +/- POLL_JITTER (fraction)
+# tuned with bench_polling.py: the longer intervals of the old ramp (20 s.)
+# doubled the detection latency of the long jobs
+POLL_MIN_INTERVAL = 5
+POLL_MAX_INTERVAL = 10
+POLL_BACKOFF_FACTOR = 2
+POLL_JITTER = 0.1
+# if the ETA of the job is known: one poll after POLL_MIN_INTERVAL, then
+# none until POLL_ETA_FRACTION * ETA, then a poll every POLL_ETA_INTERVAL
+POLL_ETA_FRACTION = 0.7
+POLL_ETA_INTERVAL = 6
+# max interval (sec.) between checks for new outputs, when streaming results
+STREAM_MAX_INTERVAL = 5
+# max time (sec.) we wait for a job, then it is canceled
+JOB_TIMEOUT = 4 * 3600
+# to estimate the job duration: fixed overhead (sec.) + audio duration * ratio
+JOB_OVERHEAD = 30
+JOB_TIME_RATIO = 0.1
+
+# local mock of OCI Speech and Object Storage (see mock_oci.py)
+# used instead of OCI if the env variable MOCK_ENV_VAR is "1"
+MOCK_ENV_VAR = "OCI_SPEECH_MOCK"
+MOCK_ROOT_DIR = "mock_oss"
+# the mock jobs are saved here, to re-attach after a restart
+MOCK_JOBS_DIR = "mock_jobs"
+MOCK_JOB_DURATION = 5
+# (sec.) latency of every mock call and probability that a call fails (503)
+MOCK_LATENCY = 0.0
+MOCK_FAILURE_RATE = 0.0
+
+# tracing and metrics (see tracing.py), enabled if the env variable is "1"
+TRACING_ENV_VAR = "OCI_SPEECH_TRACING"
+# spans, one for every line, and metrics in Prometheus text format
+TRACE_LOG = "trace.jsonl"
+METRICS_FILE = "metrics.prom"
+# upper bounds (sec.) of the histogram buckets
+HISTOGRAM_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# max number of transcription jobs running at the same time
+MAX_JOBS_IN_FLIGHT = 4
+
+# local registry of the jobs submitted (see job_registry.py)
+JOBS_DB = "jobs.db"
+# jobs read for every page of the listing, workers for the single reads
+JOB_LIST_PAGE_SIZE = 100
+JOB_REFRESH_WORKERS = 8
+
+# transcription service (see transcription_service.py)
+# persistent queue of the requests, in SQLite (see work_queue.py)
+SERVICE_DB = "work_queue.db"
+# buckets shared by all the requests, every request has its own prefix
+SERVICE_INPUT_BUCKET = "speech_input"
+SERVICE_OUTPUT_BUCKET = "speech_output"
+SERVICE_JOB_PREFIX = "service"
+# the json of every request are saved in RESULTS_DIR/tenant/request_id
+SERVICE_RESULTS_DIR = "service_results"
+# number of workers, each one runs one request (one job) at a time
+SERVICE_WORKERS = 4
+# backpressure: new requests are refused over these limits (queued + running)
+SERVICE_MAX_PENDING = 100
+SERVICE_MAX_PENDING_PER_TENANT = 20
+# max requests of a tenant running at the same time, to share the workers
+SERVICE_MAX_RUNNING_PER_TENANT = 2
+# a request that fails is queued again, up to SERVICE_MAX_ATTEMPTS times
+SERVICE_MAX_ATTEMPTS = 3
+# (sec.) a request is owned by a worker until the lease expires (renewed
+# while it works on it), then another worker (or service) takes it again
+SERVICE_LEASE = 300
+# (sec.) the lease is renewed every SERVICE_HEARTBEAT, in a thread: also
+# during long uploads and downloads
+SERVICE_HEARTBEAT = 60
+# (sec.) interval between checks of the queue, when empty
+SERVICE_POLL_INTERVAL = 2
+
 # OCI compartment you're working in
 COMPARTMENT_ID = "ocid1.compartment.oc1..aaaaaaaag2cpni5qj6li5ny6ehuahhepbpveopobooayqfeudqygdtfe6h3a"
 
@@ -22,8 +98,78 @@ WAV_DIR = "wav"
 # local directory for JSON output from OCI Speech
 JSON_DIR = "json"
 
+# model used by OCI Speech
+MODEL_DOMAIN = "GENERIC"
+
 SAMPLE_RATE = 16000
 AUDIO_FORMAT_SUPPORTED = ["wav", "flac"]
+# number of parallel workers used to read the audio headers
+PROBE_WORKERS = 8
+
+# preprocessing: output dir, block size (samples), number of processes
+PREPROCESS_DIR = "preprocessed"
+# new name -> original name of the files converted (x.wav -> x.flac)
+PREPROCESS_MAP_NAME = "preprocess_names.json"
+PREPROCESS_BLOCK_SIZE = 65536
+PREPROCESS_WORKERS = 4
+
+# voice activity detection: silence is removed, long files split in chunks
+VAD_DIR = "vad_chunks"
+# offset map: chunk time -> original file time
+VAD_MAP_NAME = "vad_offsets.json"
+# frame length (ms.), a frame is speech if VAD_MARGIN_DB over the noise floor
+VAD_FRAME_MS = 30
+VAD_MARGIN_DB = 12
+# (dBFS) frames under this level are never speech
+VAD_SILENCE_DB = -60
+# if the loud and the quiet frames differ less than this (dB) there are no
+# pauses to estimate the noise floor: only VAD_SILENCE_DB is used
+VAD_MIN_RANGE_DB = 6
+# (sec.) shorter silences are kept, shorter speech is dropped
+VAD_MIN_SILENCE = 0.5
+VAD_MIN_SPEECH = 0.1
+# (sec.) kept before and after every speech segment
+VAD_PADDING = 0.2
+# max length of a chunk (sec.)
+VAD_MAX_CHUNK = 300
+
+# WER: number of processes, used only with at least WER_PARALLEL_MIN
+# utterances, each process gets batches of WER_CHUNK_SIZE utterances
+WER_WORKERS = 4
+WER_PARALLEL_MIN = 5000
+WER_CHUNK_SIZE = 2000
+# max size (cells) of the DP matrices computed together
+WER_BATCH_CELLS = 4 * 1024 * 1024
+# max entries in the caches of normalized texts and scores (demo3)
+EVAL_CACHE_MAX_ENTRIES = 1000000
 
 # to save to csv
 CSV_NAME = "result.csv"
+# output sinks (csv, parquet, jsonl) write every SINK_BATCH_SIZE records
+SINK_BATCH_SIZE = 1000
+
+# transfer to/from Object Storage
+# number of parallel workers used for upload and download
+UPLOAD_WORKERS = 8
+DOWNLOAD_WORKERS = 8
+# files bigger than this are uploaded using multipart
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+MULTIPART_PART_SIZE = 16 * 1024 * 1024
+# local manifest of the files uploaded, to skip unchanged files
+MANIFEST_NAME = "upload_manifest.json"
+# journal of the last run of demo1, to resume it (see run_journal.py)
+JOURNAL_NAME = "run_journal.jsonl"
+# retries for each file, backoff (sec.) is doubled at every attempt
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1
+
+# OCI clients (see client_registry.py): config file and profile for API key
+OCI_CONFIG_FILE = "~/.oci/config"
+OCI_PROFILE = "DEFAULT"
+# max HTTP connections kept alive for every client (>= upload/download workers)
+POOL_MAXSIZE = 32
+
+# local cache of transcriptions
+CACHE_DB = "transcription_cache.db"
+CACHE_MAX_MB = 512
+CACHE_MAX_AGE_DAYS = 30
@@ -0,0 +1,4 @@
+#
+# pytest configuration: the tests are in tests/
+# the modules are in the root dir (not a package), this file puts it in sys.path
+#
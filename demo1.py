@@ -11,21 +11,32 @@ from os.path import basename
 import time
 import glob
 import json
-import pandas as pd
-
-import oci
-from ocifs import OCIFileSystem
 
+# only light modules are imported here, to start fast (ex: --help)
+# numpy, soundfile, oci, pyarrow are imported when (and if) needed
 # the class incapsulate the Speech API, to simplify
 from speech_client import SpeechClient
+from job_scheduler import JobScheduler, shard_files, RETRY_STATES
+from result_stream import JobResultStream
+from manifest import UploadManifest
+from transcription_cache import TranscriptionCache
+from run_journal import RunJournal
+from job_registry import JobRegistry
+from transcription_store import TranscriptionStore, get_only_name
+from output_sinks import open_sink
+from tracing import tracer
 
 from utils import (
     check_lang_code,
     clean_directory,
     clean_bucket,
+    prune_bucket,
     get_ocifs,
     copy_files_to_oss,
     copy_json_from_oss,
+    save_json,
+    get_audio_duration,
+    get_total_duration,
 )
 
 #
@@ -33,13 +44,21 @@ from utils import (
 #
 from config import (
     COMPARTMENT_ID,
-    NAMESPACE,
     EXT,
     JSON_EXT,
     WAV_DIR,
     JSON_DIR,
     DEBUG,
     CSV_NAME,
+    MANIFEST_NAME,
+    MAX_JOBS_IN_FLIGHT,
+    PREPROCESS_DIR,
+    PREPROCESS_MAP_NAME,
+    VAD_DIR,
+    VAD_MAP_NAME,
+    JOURNAL_NAME,
+    TRACE_LOG,
+    METRICS_FILE,
 )
 
 # to check the param for the lang_code
@@ -89,6 +108,74 @@ def parser_add_args(parser):
         choices={"yes", "no"},
         help="If yes, create csv with output",
     )
+    parser.add_argument(
+        "--output",
+        type=str,
+        nargs="+",
+        required=False,
+        help="Save the transcriptions also in these files (.csv, .parquet, .jsonl)",
+    )
+    parser.add_argument(
+        "--incremental",
+        type=str,
+        required=False,
+        choices={"yes", "no"},
+        help="If yes, upload only new or changed files",
+    )
+    parser.add_argument(
+        "--use_cache",
+        type=str,
+        required=False,
+        choices={"yes", "no"},
+        help="If yes, transcriptions already in the local cache are not recomputed",
+    )
+    parser.add_argument(
+        "--preprocess",
+        type=str,
+        required=False,
+        choices={"yes", "no"},
+        help="If yes, convert the files to mono, 16 kHz, FLAC before upload",
+    )
+    parser.add_argument(
+        "--vad",
+        type=str,
+        required=False,
+        choices={"yes", "no"},
+        help="If yes, remove silence and split long files in chunks before upload",
+    )
+    parser.add_argument(
+        "--stream",
+        type=str,
+        required=False,
+        choices={"yes", "no"},
+        help="If yes, show every transcription as soon as it is ready (one job only)",
+    )
+    parser.add_argument(
+        "--resume",
+        type=str,
+        required=False,
+        choices={"yes", "no"},
+        help="If yes, resume the last run: phases, jobs and downloads done are skipped",
+    )
+    parser.add_argument(
+        "--num_shards",
+        type=int,
+        default=1,
+        help="Split the files in N shards, one transcription job for every shard",
+    )
+    parser.add_argument(
+        "--shard_by",
+        type=str,
+        default="files",
+        choices={"files", "duration"},
+        help="Balance the shards on number of files or total audio duration",
+    )
+    parser.add_argument(
+        "--max_in_flight",
+        type=int,
+        default=MAX_JOBS_IN_FLIGHT,
+        help="Max number of jobs running at the same time",
+    )
 
     return parser
 
@@ -103,54 +190,33 @@ def print_args(args):
     print()
 
 
-def visualize_transcriptions():
-    list_local_json = sorted(glob.glob(path.join(JSON_DIR, f"*.{JSON_EXT}")))
-
-    for f_name in list_local_json:
-        only_name = basename(f_name)
-
-        # build a nicer name, remove PREFIX and .json
-        # OCI speech add this PREFIX, we remove it
-        PREFIX = NAMESPACE + "_" + INPUT_BUCKET + "_"
-        only_name = only_name.replace(PREFIX, "")
-        only_name = only_name.replace(f".{JSON_EXT}", "")
-
-        print(f"Audio file: {only_name}")
-        with open(f_name) as f:
-            d = json.load(f)
-            # print only the transcription
-            print(d["transcriptions"][0]["transcription"])
-            print()
-
-
-def save_csv():
-    list_local_json = sorted(glob.glob(path.join(JSON_DIR, f"*.{JSON_EXT}")))
+def print_transcription(json_name, d_json):
+    # build a nicer name, remove PREFIX and .json
+    # OCI speech add this PREFIX, we remove it
+    only_name = get_only_name(json_name, INPUT_BUCKET)
 
-    file_names = []
-    list_txts = []
-
-    for f_name in list_local_json:
-        only_name = basename(f_name)
+    print(f"Audio file: {only_name}")
+    # print only the transcription
+    print(d_json["transcriptions"][0]["transcription"])
+    print()
 
-        # build a nicer name, remove PREFIX and .json
-        # OCI speech add this PREFIX, we remove it
-        PREFIX = NAMESPACE + "_" + INPUT_BUCKET + "_"
-        only_name = only_name.replace(PREFIX, "")
-        only_name = only_name.replace(f".{JSON_EXT}", "")
 
-        file_names.append(only_name)
-        with open(f_name) as f:
-            d = json.load(f)
-            # print only the transcription
-            list_txts.append(d["transcriptions"][0]["transcription"])
+def visualize_transcriptions(store):
+    for file_name, txt in store.iter_texts():
+        print(f"Audio file: {file_name}")
+        # print only the transcription
+        print(txt)
+        print()
 
-    # create a pandas DataFrame for easy save to csv
-    dict_result = {"file_name": file_names, "txt": list_txts}
 
-    df_result = pd.DataFrame(dict_result)
+def write_to_sinks(json_names):
+    # the records not already written, in order
+    for json_name in json_names:
+        if json_name not in WRITTEN and json_name in store.records:
+            for sink in SINKS:
+                sink.write(store.records[json_name])
 
-    # save csv
-    df_result.to_csv(CSV_NAME, index=None)
+            WRITTEN.add(json_name)
 
 
 #
@@ -183,97 +249,400 @@ else:
     # EXIT
     sys.exit(-1)
 
+if args.stream == "yes" and args.num_shards > 1:
+    # the results of every shard are downloaded when all the jobs have ended
+    print("--stream yes is not supported with --num_shards > 1")
+    print()
+
+    # EXIT
+    sys.exit(-1)
+
 if args.audio_dir is not None:
     # get wav_dir from command line
     AUDIO_DIR = args.audio_dir
 
-if args.save_csv is not None:
-    if args.save_csv == "yes":
-        SAVE_CSV = True
+SAVE_CSV = args.save_csv == "yes"
+
+# output files, written in batches as the transcriptions arrive
+OUTPUT_FILES = list(args.output or [])
+if SAVE_CSV:
+    OUTPUT_FILES.append(CSV_NAME)
+
+SINKS = [open_sink(f_name) for f_name in OUTPUT_FILES]
+# json names already written to the sinks
+WRITTEN = set()
+
+# every phase is recorded in the journal, to resume after a crash
+PARAMS = {
+    "job_prefix": JOB_PREFIX,
+    "input_bucket": INPUT_BUCKET,
+    "output_bucket": OUTPUT_BUCKET,
+    "language_code": LANGUAGE_CODE,
+    "preprocess": args.preprocess,
+    "vad": args.vad,
+    "num_shards": args.num_shards,
+    "shard_by": args.shard_by,
+}
+RESUME = args.resume == "yes"
+journal = RunJournal(JOURNAL_NAME, resume=RESUME)
+
+if RESUME and (journal.params is None or journal.completed):
+    print("*** No run to resume, starting a new run ***")
+    print()
+
+    journal.close()
+    journal = RunJournal(JOURNAL_NAME)
+    RESUME = False
+
+if RESUME:
+    CHANGED = journal.check_params(PARAMS)
 
-print("*** Starting JOB ***")
+    if CHANGED:
+        print(f"Can't resume, different from the last run: {', '.join(CHANGED)}")
+        print()
+
+        # EXIT
+        sys.exit(-1)
+
+    print("*** Resuming the last run ***")
+else:
+    journal.start(PARAMS)
+    print("*** Starting JOB ***")
 print()
 
+OFFSET_MAP = None
+# new name -> original name of the files converted by the preprocessing
+NAME_MAP = {}
+
+if RESUME and journal.audio_dir is not None:
+    # the files prepared before the restart
+    AUDIO_DIR = journal.audio_dir
+
+    if args.preprocess == "yes":
+        from preprocess import restore_names
+
+        with open(PREPROCESS_MAP_NAME) as f:
+            NAME_MAP = json.load(f)
+
+    if args.vad == "yes":
+        from vad import merge_chunk_transcriptions
+
+        with open(VAD_MAP_NAME) as f:
+            OFFSET_MAP = json.load(f)
+else:
+    if args.preprocess == "yes":
+        from preprocess import preprocess_files, name_map, restore_names
+
+        # mono, SAMPLE_RATE, FLAC: the files in PREPROCESS_DIR are used from here
+        # the results are reported with the original names (see NAME_MAP)
+        clean_directory(PREPROCESS_DIR)
+        NAME_MAP = name_map(
+            preprocess_files(
+                sorted(glob.glob(path.join(AUDIO_DIR, "*.*"))),
+                PREPROCESS_DIR,
+                map_file=PREPROCESS_MAP_NAME,
+            )
+        )
+
+        AUDIO_DIR = PREPROCESS_DIR
+
+    if args.vad == "yes":
+        from vad import vad_split_files, merge_chunk_transcriptions
+
+        # only the speech is sent, timestamps are rebased on the original files
+        clean_directory(VAD_DIR)
+        OFFSET_MAP = vad_split_files(
+            sorted(glob.glob(path.join(AUDIO_DIR, "*.*"))), VAD_DIR
+        )
+
+        AUDIO_DIR = VAD_DIR
+
+    journal.set_prepared(AUDIO_DIR)
+
+# the class that incapsulate OCI Speech API
+# every job created is recorded in the local registry (see get_job.py)
+if args.use_cache == "yes":
+    speech_client = SpeechClient(cache=TranscriptionCache(), job_registry=JobRegistry())
+else:
+    speech_client = SpeechClient(job_registry=JobRegistry())
+
+# transcriptions found in the cache are not sent to the service
+AUDIO_NAMES = sorted(
+    basename(f_name) for f_name in glob.glob(path.join(AUDIO_DIR, "*.*"))
+)
+
+CACHED, TO_TRANSCRIBE = speech_client.get_cached_transcriptions(
+    AUDIO_DIR, AUDIO_NAMES, LANGUAGE_CODE
+)
+
+if RESUME:
+    # keep the json downloaded before the restart (only the complete ones)
+    journal.remove_partial_downloads(JSON_DIR, JSON_EXT)
+else:
+    # clean local dir, then add the json from the cache
+    clean_directory(JSON_DIR, JSON_EXT)
+
+# every json is parsed once, here, then read from the store
+store = TranscriptionStore(INPUT_BUCKET)
+
+for f_name, d_json in CACHED.items():
+    store.add(save_json(JSON_DIR, INPUT_BUCKET, f_name, d_json), d_json)
+
+if RESUME:
+    store.update_from_dir(JSON_DIR)
+
+if OFFSET_MAP is None and not NAME_MAP:
+    # with VAD (or files renamed), only the final json are written, at the end
+    write_to_sinks(sorted(store.records))
+
 # copy all files contained in DIR_WAV in INPUT_BUCKET
 #
 
 # This code try to get an instance of OCIFileSystem
 fs = get_ocifs()
 
-# first: clean bucket destination
-clean_bucket(fs, INPUT_BUCKET)
+if RESUME and journal.uploaded is not None:
+    # uploaded before the restart
+    FILE_NAMES = journal.uploaded
+
+    print(f"*** {len(FILE_NAMES)} files already uploaded ***")
+    print()
+elif args.incremental == "yes":
+    # upload only new or changed files, then delete only stale objects
+    manifest = UploadManifest(MANIFEST_NAME, INPUT_BUCKET)
+
+    FILE_NAMES = copy_files_to_oss(
+        fs, AUDIO_DIR, INPUT_BUCKET, manifest=manifest, file_names=TO_TRANSCRIBE
+    )
+
+    prune_bucket(fs, INPUT_BUCKET, FILE_NAMES, manifest)
+    journal.set_uploaded(FILE_NAMES)
+else:
+    # first: clean bucket destination
+    clean_bucket(fs, INPUT_BUCKET)
 
-# copy files to process to input bucket
-FILE_NAMES = copy_files_to_oss(fs, AUDIO_DIR, INPUT_BUCKET)
+    # copy files to process to input bucket
+    FILE_NAMES = copy_files_to_oss(
+        fs, AUDIO_DIR, INPUT_BUCKET, file_names=TO_TRANSCRIBE
+    )
+    journal.set_uploaded(FILE_NAMES)
 
 #
 # Launch the job
 #
-
-# the class that incapsulate OCI Speech API
-speech_client = SpeechClient()
-
-# prepare the request
-transcription_job_details = speech_client.create_transcription_job_details(
-    INPUT_BUCKET,
-    OUTPUT_BUCKET,
-    FILE_NAMES,
-    JOB_PREFIX,
-    DISPLAY_NAME,
-    LANGUAGE_CODE,
-)
-
-# create and launch the transcription job
-transcription_job = None
-print("*** Create transcription JOB ***")
 t_start = time.time()
+scheduler = None
+# if the transcriptions have been downloaded and shown while the job runs
+STREAMED = False
+
+if len(FILE_NAMES) > 0 and args.num_shards > 1:
+    # split in shards, one job for every shard
+    # the durations are used also to estimate when every job will end
+    DURATIONS = {
+        f_name: get_audio_duration(path.join(AUDIO_DIR, f_name))
+        for f_name in FILE_NAMES
+    }
+
+    if RESUME and journal.shards is not None:
+        # the same shards, the jobs already submitted are re-attached
+        SHARDS = journal.shards
+    else:
+        SHARDS = shard_files(
+            FILE_NAMES,
+            n_shards=args.num_shards,
+            durations=DURATIONS if args.shard_by == "duration" else None,
+        )
+        journal.set_shards(SHARDS)
+
+    print(f"*** Create {len(SHARDS)} transcription JOBS ***")
+
+    scheduler = JobScheduler(
+        speech_client, max_in_flight=args.max_in_flight, journal=journal
+    )
+    scheduler.run(
+        INPUT_BUCKET,
+        OUTPUT_BUCKET,
+        SHARDS,
+        JOB_PREFIX,
+        DISPLAY_NAME,
+        LANGUAGE_CODE,
+        durations=DURATIONS,
+    )
 
-try:
-    transcription_job = speech_client.create_transcription_job(
-        transcription_job_details
+    # the run is completed only if all the shards succeeded, otherwise
+    # it can be resumed: only the shards failed are submitted again
+    if scheduler.all_succeeded():
+        final_status = "SUCCEEDED"
+    else:
+        final_status = "FAILED"
+elif len(FILE_NAMES) > 0:
+    # prepare the request
+    transcription_job_details = speech_client.create_transcription_job_details(
+        INPUT_BUCKET,
+        OUTPUT_BUCKET,
+        FILE_NAMES,
+        JOB_PREFIX,
+        DISPLAY_NAME,
+        LANGUAGE_CODE,
     )
 
-    # get the job id for later
-    JOB_ID = transcription_job.data.id
+    # create and launch the transcription job
+    transcription_job = None
 
-    print(f"JOB ID is: {transcription_job.data.id}")
-    print()
-except Exception as e:
-    print(e)
+    if RESUME and 0 in journal.jobs and journal.jobs[0]["status"] not in RETRY_STATES:
+        # submitted before the restart: re-attach
+        JOB_ID = journal.jobs[0]["job_id"]
+        transcription_job = speech_client.get_job(JOB_ID)
+
+        print(f"*** Re-attached to transcription JOB {JOB_ID} ***")
+        print()
+    else:
+        print("*** Create transcription JOB ***")
 
-# WAIT while JOB is in progress
-final_status = speech_client.wait_for_job_completion(JOB_ID)
+        try:
+            transcription_job = speech_client.create_transcription_job(
+                transcription_job_details
+            )
+
+            # get the job id for later
+            JOB_ID = transcription_job.data.id
+            journal.job_submitted(
+                0, JOB_ID, transcription_job.data.output_location.prefix
+            )
+
+            print(f"JOB ID is: {transcription_job.data.id}")
+            print()
+        except Exception as e:
+            print(e)
+
+    if args.stream == "yes":
+        # visualize every transcription as soon as it is ready
+        print("*** Visualizing transcriptions as they arrive ***")
+        print()
+
+        # from the cache (and downloaded before the restart)
+        visualize_transcriptions(store)
+
+        stream = JobResultStream(
+            speech_client,
+            fs,
+            JOB_ID,
+            local_json_dir=JSON_DIR,
+            skip_names=journal.downloaded,
+        )
+
+        for json_name, d_json in stream:
+            print_transcription(json_name, d_json)
+            store.add(json_name, d_json)
+            journal.file_downloaded(json_name)
+
+            if OFFSET_MAP is None and not NAME_MAP:
+                write_to_sinks([json_name])
+
+        final_status = stream.status
+        STREAMED = True
+    else:
+        # total audio duration, to estimate when the job will end
+        AUDIO_DURATION = get_total_duration(AUDIO_DIR, FILE_NAMES)
+
+        # WAIT while JOB is in progress
+        final_status = speech_client.wait_for_job_completion(
+            JOB_ID, audio_duration=AUDIO_DURATION
+        )
+
+    journal.job_done(0, final_status)
+else:
+    # everything was in the cache
+    print("*** All transcriptions found in cache, no JOB needed ***")
+    final_status = "SUCCEEDED"
 
 t_ela = time.time() - t_start
 
 #
 # Download the output from JSON files
 #
-# clean local dir
 if final_status == "SUCCEEDED":
-    clean_directory(JSON_DIR, JSON_EXT)
+    if scheduler is not None:
+        # merge the output of all the shards
+        scheduler.collect_outputs(fs, JSON_DIR, JSON_EXT, OUTPUT_BUCKET)
+    elif len(FILE_NAMES) > 0 and not STREAMED:
+        # get from JOB
+        OUTPUT_PREFIX = transcription_job.data.output_location.prefix
+
+        # the files downloaded before the restart are skipped
+        copy_json_from_oss(
+            fs,
+            JSON_DIR,
+            JSON_EXT,
+            OUTPUT_PREFIX,
+            OUTPUT_BUCKET,
+            skip_names=journal.downloaded,
+            on_download=journal.file_downloaded,
+        )
+
+    # save the new transcriptions in the cache
+    speech_client.cache_transcriptions(
+        AUDIO_DIR, JSON_DIR, INPUT_BUCKET, FILE_NAMES, LANGUAGE_CODE
+    )
 
-    # get from JOB
-    OUTPUT_PREFIX = transcription_job.data.output_location.prefix
+    if OFFSET_MAP is not None:
+        # one json for every original file, with its timestamps
+        # journaled: the merged json are kept on resume (the chunks are gone)
+        merge_chunk_transcriptions(
+            JSON_DIR, INPUT_BUCKET, OFFSET_MAP, on_merge=journal.file_merged
+        )
 
-    copy_json_from_oss(fs, JSON_DIR, JSON_EXT, OUTPUT_PREFIX, OUTPUT_BUCKET)
+    if NAME_MAP:
+        # the json of the files converted get back the original names
+        restore_names(JSON_DIR, INPUT_BUCKET, NAME_MAP, on_rename=journal.file_merged)
 
-    # visualizing all the transcriptions
-    # get the file list
-    print()
-    print("*** Visualizing transcriptions ***")
-    print()
-    visualize_transcriptions()
+    # parse only the json not already in the store
+    store.update_from_dir(JSON_DIR)
+
+    if not STREAMED:
+        # visualizing all the transcriptions
+        # get the file list
+        print()
+        print("*** Visualizing transcriptions ***")
+        print()
+        visualize_transcriptions(store)
+
+    # file_names, transcriptions (with tokens in Parquet, JSONL)
+    write_to_sinks(sorted(store.records))
+
+    for sink in SINKS:
+        sink.close()
+        print(f"Saved {sink.n_written} transcriptions in {sink.file_name}")
 
-    if SAVE_CSV:
-        # save file_names, transcriptions in csv (result.csv)
-        save_csv()
+    journal.complete()
 
     print()
-    print(f"Processed {len(FILE_NAMES)} files...")
+    print(f"Processed {len(AUDIO_NAMES)} files...")
     print(f"Total execution time: {round(t_ela, 1)} sec.")
     print()
 else:
     print()
     print("Error in JOB execution, failed!")
+    if scheduler is not None:
+        for i in scheduler.failed_shards():
+            print(f"Shard {i}: status {scheduler.results[i]['status']}")
     print()
+
+    # keep what has been written so far (ex: cached transcriptions)
+    for sink in SINKS:
+        sink.close()
+
+    print(f"The run can be resumed with --resume yes (see {JOURNAL_NAME})")
+    print()
+
+journal.close()
+
+if tracer.enabled:
+    # spans and metrics of this run
+    tracer.export_json(TRACE_LOG)
+    tracer.export_prometheus(METRICS_FILE)
+
+    print(f"Trace saved in {TRACE_LOG}, metrics in {METRICS_FILE}")
+
+if final_status != "SUCCEEDED":
+    sys.exit(1)
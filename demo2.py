@@ -3,33 +3,38 @@
 # upload a set of wav/flac files using Streamlit and get transcription
 #
 import streamlit as st
+import os
 from os import path
-from os.path import basename
 import time
-import glob
-import json
-import pandas as pd
 from PIL import Image
 
-import oci
-
 # the class incapsulate the Speech API, to simplify
 from speech_client import SpeechClient
+from async_speech_client import AsyncSpeechClient, get_background_loop
+from result_stream import JobResultStream
+from transcription_cache import TranscriptionCache
+from job_registry import JobRegistry
+from transcription_store import (
+    TranscriptionStore,
+    get_only_name,
+    original_json_name,
+)
+from output_sinks import CSVSink
 
 from utils import (
     clean_directory,
     clean_bucket,
-    check_sample_rate,
+    scan_audio_dir,
+    get_total_duration,
     get_ocifs,
     copy_files_to_oss,
-    copy_json_from_oss,
+    save_json,
 )
 
 # global config
 #
 from config import (
     COMPARTMENT_ID,
-    NAMESPACE,
     EXT,
     JSON_EXT,
     JSON_DIR,
@@ -39,6 +44,8 @@ from config import (
 )
 
 LOCAL_DIR = "appo_local"
+# how often (sec.) the UI checks for new transcriptions
+REFRESH_TIME = 2
 INPUT_BUCKET = "speech_input"
 OUTPUT_BUCKET = "speech_output"
 
@@ -63,53 +70,40 @@ LANG_SUPPORTED = DICT_LANG_CODES.keys()
 #
 
 
-# extract transcriptions from json
-def get_transcriptions():
-    list_local_json = sorted(glob.glob(path.join(JSON_DIR, f"*.{JSON_EXT}")))
-
-    list_txts = []
-
-    for f_name in list_local_json:
-        # with basename should be os independent
-        only_name = basename(f_name)
-
-        with open(f_name) as f:
-            d_json = json.load(f)
-            # get only the transcription text
-            txt = d_json["transcriptions"][0]["transcription"]
-            list_txts.append(txt)
+@st.cache_resource
+def get_speech_client(use_cache):
+    # created once (for every value of use_cache)
+    # the OCI clients inside are shared, see client_registry
+    # every job created is recorded in the local registry (see get_job.py)
+    if use_cache == "yes":
+        return SpeechClient(cache=TranscriptionCache(), job_registry=JobRegistry())
 
-    return list_txts
+    return SpeechClient(job_registry=JobRegistry())
 
 
-def save_csv():
-    list_local_json = sorted(glob.glob(path.join(JSON_DIR, f"*.{JSON_EXT}")))
+def show_transcription(col, json_name, d_json):
+    # remove the PREFIX added by OCI speech and .json
+    only_name = get_only_name(json_name, INPUT_BUCKET)
 
-    file_names = []
-    list_txts = []
+    txt = d_json["transcriptions"][0]["transcription"]
 
-    for f_name in list_local_json:
-        only_name = basename(f_name)
+    print(txt)
+    col.markdown(f"**{only_name}**: {txt}")
 
-        # build a nicer name, remove PREFIX and .json
-        # OCI speech add this PREFIX, we remove it
-        PREFIX = NAMESPACE + "_" + INPUT_BUCKET + "_"
-        only_name = only_name.replace(PREFIX, "")
-        only_name = only_name.replace(f".{JSON_EXT}", "")
 
-        file_names.append(only_name)
-        with open(f_name) as f:
-            d = json.load(f)
-            # print only the transcription
-            list_txts.append(d["transcriptions"][0]["transcription"])
+def add_transcription(col, store, json_name, d_json, names):
+    # shown and saved with the name of the original file (see preprocess)
+    json_name = original_json_name(json_name, INPUT_BUCKET, names)
 
-    # create a pandas DataFrame for easy save to csv
-    dict_result = {"file_name": file_names, "txt": list_txts}
+    show_transcription(col, json_name, d_json)
+    store.add(json_name, d_json)
 
-    df_result = pd.DataFrame(dict_result)
 
-    # save csv
-    df_result.to_csv(CSV_NAME, index=None)
+def save_csv(store):
+    # file_names, transcriptions
+    with CSVSink(CSV_NAME) as sink:
+        for record in store.sorted_records():
+            sink.write(record)
 
 
 #
@@ -148,6 +142,8 @@ with st.sidebar.form("input_form"):
 
     do_csv = st.radio(label="Save to csv", horizontal=True, options=["no", "yes"])
 
+    use_cache = st.radio(label="Use cache", horizontal=True, options=["yes", "no"])
+
     transcribe = st.form_submit_button(label="Transcribe")
 
 if transcribe:
@@ -161,6 +157,7 @@ if transcribe:
             clean_directory(LOCAL_DIR)
 
             # clean remote bucket
+            # the same OCIFileSystem (and connections) for every run
             fs = get_ocifs()
             clean_bucket(fs, INPUT_BUCKET)
 
@@ -172,82 +169,161 @@ if transcribe:
                     f.write(v_file.read())
 
             # first check sample rate is ok
+            # the files not mono or with a different sample rate are converted
             with st.spinner("Checking sampling rate..."):
-                for v_file in input_files:
-                    # added check of the sample rate
-                    audio_path = path.join(LOCAL_DIR, v_file.name)
-                    assert check_sample_rate(audio_path, SAMPLE_RATE)
-                st.info("Sampling rate OK.")
-
-            # copy all files from LOCAL_DIR to Object Storage
-            FILE_NAMES = copy_files_to_oss(fs, LOCAL_DIR, INPUT_BUCKET)
-
-            # transcribe JOB
-            JOB_PREFIX = "test_ui"
-            DISPLAY_NAME = JOB_PREFIX
-
-            speech_client = SpeechClient()
-
-            # prepare the request
-            transcription_job_details = speech_client.create_transcription_job_details(
-                INPUT_BUCKET,
-                OUTPUT_BUCKET,
-                FILE_NAMES,
-                JOB_PREFIX,
-                DISPLAY_NAME,
-                LANGUAGE_CODE,
-            )
+                to_convert = [
+                    info["file_name"]
+                    for info in scan_audio_dir(LOCAL_DIR)
+                    if "error" not in info
+                    and (info["sample_rate"] != SAMPLE_RATE or info["channels"] != 1)
+                ]
+
+                # new name -> original name of the files converted
+                NAME_MAP = {}
+
+                if len(to_convert) > 0:
+                    # numpy and soundfile are imported only if needed
+                    from preprocess import preprocess_files, name_map
+
+                    results = preprocess_files(to_convert, LOCAL_DIR)
+                    for src, dst, converted in results:
+                        # a wav is converted to a new flac file (never an
+                        # existing one, see plan_names)
+                        if converted and dst != src:
+                            os.remove(src)
+
+                    NAME_MAP = name_map(results)
+
+                    st.info(
+                        f"Converted {len(to_convert)} files to {SAMPLE_RATE} Hz, mono."
+                    )
+                else:
+                    st.info("Sampling rate OK.")
+
+            # names can be changed by the conversion
+            AUDIO_NAMES = sorted(os.listdir(LOCAL_DIR))
 
-            # create and launch the transcription job
-            print("*** Create transcription JOB ***")
-
-            try:
-                transcription_job = speech_client.create_transcription_job(
-                    transcription_job_details
-                )
-
-                # get the job id for later
-                JOB_ID = transcription_job.data.id
+            # Visualize output:
+            # visualize transcriptions and audio widget
+            transcription_col.subheader("Audio transcriptions:")
+            media_col.subheader("Audio:")
 
-                print(f"JOB ID is: {transcription_job.data.id}")
-                print()
+            # prepare audio widgets
+            for v_file in input_files:
+                # add audio widget to enable to listen to audio
+                media_col.audio(data=v_file)
 
-                st.info(f"Launched transcription job: {JOB_ID}")
-            except Exception as e:
-                print(e)
+            # transcriptions found in the cache are not sent to the service
+            speech_client = get_speech_client(use_cache)
 
-            # WAIT while JOB is in progress
-            speech_client.wait_for_job_completion(JOB_ID)
+            CACHED, TO_TRANSCRIBE = speech_client.get_cached_transcriptions(
+                LOCAL_DIR, AUDIO_NAMES, LANGUAGE_CODE
+            )
 
             # prepare to copy json
             clean_directory(JSON_DIR, JSON_EXT)
 
-            # get from JOB
-            OUTPUT_PREFIX = transcription_job.data.output_location.prefix
+            # every json is parsed once, then read from the store
+            store = TranscriptionStore(INPUT_BUCKET)
 
-            # copy json with transcriptions from Object Storage
-            copy_json_from_oss(fs, JSON_DIR, JSON_EXT, OUTPUT_PREFIX, OUTPUT_BUCKET)
+            for f_name, d_json in sorted(CACHED.items()):
+                add_transcription(
+                    transcription_col,
+                    store,
+                    save_json(JSON_DIR, INPUT_BUCKET, f_name, d_json),
+                    d_json,
+                    NAME_MAP,
+                )
 
-            # extract only txt from json
-            list_transcriptions = get_transcriptions()
+            # copy files not in cache from LOCAL_DIR to Object Storage
+            FILE_NAMES = copy_files_to_oss(
+                fs, LOCAL_DIR, INPUT_BUCKET, file_names=TO_TRANSCRIBE
+            )
 
-            # Visualize output:
-            # visualize transcriptions and audio widget
-            transcription_col.subheader("Audio transcriptions:")
-            media_col.subheader("Audio:")
+            if len(FILE_NAMES) > 0:
+                # transcribe JOB
+                JOB_PREFIX = "test_ui"
+                DISPLAY_NAME = JOB_PREFIX
+
+                # prepare the request
+                transcription_job_details = (
+                    speech_client.create_transcription_job_details(
+                        INPUT_BUCKET,
+                        OUTPUT_BUCKET,
+                        FILE_NAMES,
+                        JOB_PREFIX,
+                        DISPLAY_NAME,
+                        LANGUAGE_CODE,
+                    )
+                )
 
-            print()
-            for txt in list_transcriptions:
-                print(txt)
-                transcription_col.markdown(txt)
+                # create and launch the transcription job
+                print("*** Create transcription JOB ***")
+
+                try:
+                    transcription_job = speech_client.create_transcription_job(
+                        transcription_job_details
+                    )
+
+                    # get the job id for later
+                    JOB_ID = transcription_job.data.id
+
+                    print(f"JOB ID is: {transcription_job.data.id}")
+                    print()
+
+                    st.info(f"Launched transcription job: {JOB_ID}")
+                except Exception as e:
+                    print(e)
+
+                # WAIT while JOB is in progress
+                # the wait runs in a background event loop, here we update the UI
+                # and show every transcription as soon as it is ready
+                async_client = AsyncSpeechClient(speech_client)
+                future = get_background_loop().submit(
+                    async_client.wait_for_job_completion(
+                        JOB_ID,
+                        audio_duration=get_total_duration(LOCAL_DIR, FILE_NAMES),
+                    )
+                )
+                stream = JobResultStream(
+                    speech_client, fs, JOB_ID, local_json_dir=JSON_DIR
+                )
 
-            # prepare audio widgets
-            for v_file in input_files:
-                # add audio widget to enable to listen to audio
-                media_col.audio(data=v_file)
+                progress_bar = st.progress(0, text="Transcription job accepted...")
+                t_last_fetch = time.time()
+                while not future.done():
+                    status, percent = async_client.progress.get(JOB_ID, ("ACCEPTED", 0))
+                    progress_bar.progress(
+                        percent, text=f"Transcription job {status}, {percent}%"
+                    )
+
+                    if time.time() - t_last_fetch > REFRESH_TIME:
+                        for json_name, d_json in stream.fetch_new():
+                            add_transcription(
+                                transcription_col, store, json_name, d_json, NAME_MAP
+                            )
+                        t_last_fetch = time.time()
+
+                    time.sleep(0.5)
+
+                final_status = future.result()
+                progress_bar.progress(100, text=f"Transcription job {final_status}")
+
+                # the last ones
+                for json_name, d_json in stream.fetch_new():
+                    add_transcription(
+                        transcription_col, store, json_name, d_json, NAME_MAP
+                    )
+
+                # save the new transcriptions in the cache
+                speech_client.cache_transcriptions(
+                    LOCAL_DIR, JSON_DIR, INPUT_BUCKET, FILE_NAMES, LANGUAGE_CODE
+                )
+            else:
+                st.info("All transcriptions found in cache.")
 
             if do_csv == "yes":
-                save_csv()
+                save_csv(store)
 
             t_ela = round(time.time() - t_start, 1)
 
@@ -1,7 +1,6 @@
 #
 # To compute WER
 #
-import string
 import streamlit as st
 from os import path
 from os.path import basename
@@ -10,8 +9,12 @@ import glob
 import pandas as pd
 from PIL import Image
 
-# to load WER
-from evaluate import load
+# WER, with per utterance scores
+from wer import summarize
+from output_sinks import load_results
+from evaluation_cache import EvaluationCache
+from alignment import align_results
+from normalization import PROFILES, get_profile
 
 from utils import (
     clean_directory,
@@ -31,59 +34,30 @@ from config import (
 )
 
 LOCAL_DIR = "appo_local"
+# in the example expected text is all uppercase (LibriSpeech)
+# the other profiles are per language, see normalization.py
+DEFAULT_PROFILE = "librispeech"
 
 
 #
 # Functions
 #
-def do_checks(result_file, expected_file):
-    result_df = pd.read_csv(result_file)
-    expected_df = pd.read_csv(expected_file)
-
-    result_file_names = result_df["file_name"]
-    expected_file_names = expected_df["file_name"]
-
-    if set(result_file_names) == set(expected_file_names):
-        is_ok = True
-    else:
-        is_ok = False
-
-    return is_ok
-
-
-def get_txts(result_file, expected_file):
-    result_df = pd.read_csv(result_file)
-    expected_df = pd.read_csv(expected_file)
-
-    # sort on the file name
-    result_df = result_df.sort_values("file_name", ascending=True)
-    expected_df = expected_df.sort_values("file_name", ascending=True)
-
-    # extract the transcriptions
-    preds = list(result_df["txt"].values)
-    expected = list(expected_df["txt"].values)
-
-    return preds, expected
-
-
-#
-# This function must be customized
-# apply some normalization to transcriptions
-#
-# In the example expected text is all uppercase
-#
-def normalize(preds):
-    # make uppercase
-    preds = [txt.upper() for txt in preds]
-
-    # remove punctuation
-    preds = [txt.translate(str.maketrans("", "", string.punctuation)) for txt in preds]
-
-    return preds
-
-
-def build_result_df(preds, expected):
-    dict_res = {"Transcription": preds, "Expected": expected}
+@st.cache_resource
+def get_evaluation_cache():
+    # shared between the runs: only the rows changed are recomputed
+    return EvaluationCache()
+
+
+def build_result_df(keys, preds, expected, scores):
+    dict_res = {
+        "File": keys,
+        "Transcription": preds,
+        "Expected": expected,
+        "WER": [score["error_rate"] for score in scores],
+        "S": [score["substitutions"] for score in scores],
+        "D": [score["deletions"] for score in scores],
+        "I": [score["insertions"] for score in scores],
+    }
     df_result = pd.DataFrame(dict_res)
 
     return df_result
@@ -105,12 +79,19 @@ st.set_page_config(
 image = Image.open("oracle.png")
 img_widg = st.sidebar.image(image)
 
-# metric
-wer = load("wer")
-
 with st.sidebar.form("input_form"):
-    result_csv = st.file_uploader("Choose result file", type=["csv"])
-    expected_csv = st.file_uploader("Choose expected result file", type=["csv"])
+    result_csv = st.file_uploader(
+        "Choose result file", type=["csv", "parquet", "jsonl"]
+    )
+    expected_csv = st.file_uploader(
+        "Choose expected result file", type=["csv", "parquet", "jsonl"]
+    )
+
+    profile_name = st.selectbox(
+        "Normalization",
+        options=list(PROFILES),
+        index=list(PROFILES).index(DEFAULT_PROFILE),
+    )
 
     compute = st.form_submit_button(label="Compute")
 
@@ -126,23 +107,51 @@ if compute:
         with open(file_path, "wb") as f:
             f.write(v_file.read())
 
-    if do_checks(result_csv.name, expected_csv.name):
+    # each file is read only once
+    result_df = load_results(result_csv.name)
+    expected_df = load_results(expected_csv.name)
+
+    # rows matched on file_name, missing and extra files are reported
+    aligned = align_results(result_df, expected_df)
+
+    for kind in ["missing", "extra", "duplicates"]:
+        if len(aligned[kind]) > 0:
+            examples = ", ".join(str(k) for k in aligned[kind][:5])
+            st.warning(f"{len(aligned[kind])} files {kind}, ex: {examples}")
+
+    if len(aligned["keys"]) > 0:
         print()
-        print("Compute WER")
+        print(f"Compute WER on {len(aligned['keys'])} files")
+
+        preds, expected = aligned["preds"], aligned["expected"]
+
+        evaluation_cache = get_evaluation_cache()
 
-        preds, expected = get_txts(result_csv.name, expected_csv.name)
+        # normalization, all the column in one batch
+        profile = get_profile(profile_name)
 
-        # normalization: all preds uppercase
-        preds = normalize(preds)
+        preds = evaluation_cache.normalize(
+            preds, profile.fingerprint, profile.normalize
+        )
+        if profile.normalize_references:
+            expected = evaluation_cache.normalize(
+                expected, profile.fingerprint, profile.normalize
+            )
 
-        wer_score = wer.compute(predictions=preds, references=expected)
+        scores = evaluation_cache.score(preds, expected)
+        totals = summarize(scores)
+        wer_score = totals["error_rate"]
 
         print(f"WER score is: {round(wer_score, 2)}")
         print()
 
-        st.info(f"The computed WER score is: {round(wer_score, 2)}")
+        st.info(
+            f"The computed WER score is: {round(wer_score, 2)} "
+            f"(substitutions: {totals['substitutions']}, "
+            f"deletions: {totals['deletions']}, insertions: {totals['insertions']})"
+        )
 
         # display reults and expected
-        st.dataframe(build_result_df(preds, expected))
+        st.dataframe(build_result_df(aligned["keys"], preds, expected, scores))
     else:
-        st.error("The two files are not OK")
+        st.error("No file in common between the two files")
@@ -0,0 +1,127 @@
+#
+# Client of the transcription service: adds a request to the work queue
+# (the audio files of a local dir) and, with --wait yes, waits for the results
+#
+import argparse
+import sys
+import glob
+import time
+from os import path
+
+from work_queue import WorkQueue, QueueFullError, PENDING_STATES
+from utils import check_lang_code
+
+from config import EXT, SERVICE_DB, SERVICE_POLL_INTERVAL
+
+# to check the param for the lang_code
+DICT_LANG_CODES = {"it": "it-IT", "en": "en-GB", "es": "es-ES", "fr": "fr-FR"}
+
+
+def parser_add_args(parser):
+    parser.add_argument(
+        "--tenant",
+        type=str,
+        required=True,
+        help="Name of the client (letters, digits, _ and -)",
+    )
+    parser.add_argument(
+        "--audio_dir",
+        type=str,
+        required=True,
+        help="Input dir for wav or flac files, readable by the service",
+    )
+    parser.add_argument(
+        "--language_code",
+        type=str,
+        required=True,
+        help="Language code (ex: it-IT)",
+    )
+    parser.add_argument(
+        "--ext",
+        type=str,
+        default=EXT,
+        help="Extension of the audio files",
+    )
+    parser.add_argument(
+        "--wait",
+        type=str,
+        required=False,
+        choices={"yes", "no"},
+        help="If yes, when the queue is full retry, then wait for the results",
+    )
+    parser.add_argument(
+        "--db",
+        type=str,
+        default=SERVICE_DB,
+        help="The work queue",
+    )
+
+    return parser
+
+
+#
+# Main
+#
+parser = argparse.ArgumentParser()
+parser = parser_add_args(parser)
+args = parser.parse_args()
+
+if not check_lang_code(args.language_code, DICT_LANG_CODES):
+    print("Invalid LANGUAGE_CODE, valid values are:")
+
+    for key, value in DICT_LANG_CODES.items():
+        print(value)
+    print()
+
+    sys.exit(-1)
+
+WAIT = args.wait == "yes"
+
+# the service reads the files from here
+AUDIO_DIR = path.abspath(args.audio_dir)
+FILE_NAMES = sorted(
+    path.basename(f_name) for f_name in glob.glob(path.join(AUDIO_DIR, f"*.{args.ext}"))
+)
+
+if not FILE_NAMES:
+    print(f"No .{args.ext} files in {AUDIO_DIR}")
+    sys.exit(-1)
+
+queue = WorkQueue(args.db)
+
+while True:
+    try:
+        request_id = queue.enqueue(
+            args.tenant, AUDIO_DIR, FILE_NAMES, args.language_code
+        )
+        break
+    except QueueFullError as e:
+        # backpressure: the client slows down (or gives up)
+        print(e)
+
+        if not WAIT:
+            sys.exit(1)
+
+        time.sleep(SERVICE_POLL_INTERVAL)
+
+print(f"Request {request_id} queued, {len(FILE_NAMES)} files.")
+
+if WAIT:
+    status = None
+    while True:
+        request = queue.get(request_id)
+
+        if request["status"] != status:
+            status = request["status"]
+            print(f"Request {request_id}: {status}")
+
+        if status not in PENDING_STATES:
+            break
+
+        time.sleep(SERVICE_POLL_INTERVAL)
+
+    if status == "SUCCEEDED":
+        print(f"{request['n_results']} results in {request['result_dir']}")
+    else:
+        print(f"Error: {request['error']}")
+        sys.exit(1)
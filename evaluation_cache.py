@@ -0,0 +1,75 @@
+#
+# Cache for the WER evaluation
+# normalized texts are memoized per (text, profile),
+# scores per (prediction, reference): when only a few rows change,
+# only those utterances are recomputed
+#
+from wer import compute_scores
+
+from config import EVAL_CACHE_MAX_ENTRIES
+
+
+class EvaluationCache:
+    """
+    in memory, shared between runs (ex: with st.cache_resource)
+    when a dict has more than max_entries, the oldest half is dropped
+    """
+
+    def __init__(self, max_entries=EVAL_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+
+        # (text, profile fingerprint) -> normalized text
+        self.normalized = {}
+        # (prediction, reference, unit) -> score
+        self.scores = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def _trim(self, d):
+        if len(d) > self.max_entries:
+            # dicts keep insertion order: the first keys are the oldest
+            for key in list(d)[: len(d) // 2]:
+                del d[key]
+
+    def normalize(self, texts, profile, normalize_func):
+        """
+        profile: the fingerprint of the NormalizationProfile (not the name:
+        after an edit of the rules the texts are normalized again)
+        normalize_func: list of texts -> list of normalized texts
+        called only on the texts not in the cache, for this profile
+        """
+        to_do = list({text for text in texts if (text, profile) not in self.normalized})
+
+        for text, normalized in zip(to_do, normalize_func(to_do) if to_do else []):
+            self.normalized[(text, profile)] = normalized
+
+        result = [self.normalized[(text, profile)] for text in texts]
+        self._trim(self.normalized)
+
+        return result
+
+    def score(self, predictions, references, unit="word"):
+        """
+        per utterance scores (see wer.compute_scores),
+        computed only for the pairs not in the cache
+        """
+        keys = [
+            (prediction, reference, unit)
+            for prediction, reference in zip(predictions, references)
+        ]
+        to_do = list({key for key in keys if key not in self.scores})
+
+        self.misses += len(to_do)
+        self.hits += len(keys) - len(to_do)
+
+        if to_do:
+            new_scores = compute_scores(
+                [key[0] for key in to_do], [key[1] for key in to_do], unit=unit
+            )
+            self.scores.update(zip(to_do, new_scores))
+
+        result = [self.scores[key] for key in keys]
+        self._trim(self.scores)
+
+        return result
@@ -1,21 +1,171 @@
-from os import path
-import sys
+#
+# Status of the transcription jobs
+# the jobs are read from the local registry (written by SpeechClient),
+# the state of the active ones is refreshed in one sweep (see job_registry.py)
+#
+import argparse
+import time
 
-import oci
-from oci.config import from_file
-from ocifs import OCIFileSystem
-from tqdm import tqdm
-import glob
+from client_registry import registry
+from job_registry import JobRegistry, ACTIVE_STATES
 
-ai_client = oci.ai_speech.AIServiceSpeechClient(oci.config.from_file())
+from config import JOBS_DB
 
-JOB_ID = "ocid1.aispeechtranscriptionjob.oc1.eu-frankfurt-1.amaaaaaangencdya7ao5sopbf3uyc3q4too6xwf4kat3ylrlx6e3y6vzx4fq"
 
-try:
-    transcription_job = ai_client.get_transcription_job(JOB_ID)
+def parser_add_args(parser):
+    parser.add_argument(
+        "--job_id",
+        type=str,
+        nargs="+",
+        required=False,
+        help="Show only these jobs",
+    )
+    parser.add_argument(
+        "--all",
+        type=str,
+        required=False,
+        choices={"yes", "no"},
+        help="If yes, show also the jobs completed (default: only the active)",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=50,
+        help="Max number of jobs to show, the most recent",
+    )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        default=0,
+        help="If > 0, refresh every N sec. until all the jobs are completed",
+    )
+    parser.add_argument(
+        "--db",
+        type=str,
+        default=JOBS_DB,
+        help="The job registry",
+    )
 
-    print(transcription_job.data)
+    return parser
+
+
+def job_stats(job, now):
+    """
+    progress, durations (sec.) and throughput (files/min.) of a job
+    """
+    total = job["total_tasks"] or job["n_files"] or 0
+    outstanding = job["outstanding_tasks"]
+    done = total - outstanding if outstanding is not None else 0
+
+    t_accepted = job["time_accepted"] or job["time_created"]
+    t_started = job["time_started"]
+    t_end = job["time_finished"] or now
+
+    queued = (t_started or t_end) - t_accepted
+    running = t_end - t_started if t_started is not None else 0
+
+    return {
+        "percent": job["percent_complete"] or 0,
+        "done": done,
+        "total": total,
+        "queued": queued,
+        "running": running,
+        "files_per_min": 60 * done / running if running > 0 else 0,
+    }
+
+
+def print_jobs(jobs, now):
+    print(
+        f"{'JOB':<28} {'STATE':<12} {'PROGRESS':>8} {'FILES':>11} "
+        f"{'QUEUED':>8} {'RUNNING':>8} {'FILES/MIN':>9}"
+    )
+
+    for job in jobs:
+        stats = job_stats(job, now)
+
+        print(
+            f"{(job['display_name'] or job['job_id'])[:28]:<28} "
+            f"{job['lifecycle_state'] or '?':<12} "
+            f"{stats['percent']:>7}% "
+            f"{str(stats['done']) + '/' + str(stats['total']):>11} "
+            f"{round(stats['queued']):>7}s "
+            f"{round(stats['running']):>7}s "
+            f"{round(stats['files_per_min'], 1):>9}"
+        )
     print()
-    print(transcription_job.data.lifecycle_state)
-except Exception as e:
-    print(e)
+
+
+def print_summary(jobs, now):
+    states = {}
+    for job in jobs:
+        states[job["lifecycle_state"]] = states.get(job["lifecycle_state"], 0) + 1
+
+    stats = [job_stats(job, now) for job in jobs]
+    n_done = sum(stat["done"] for stat in stats)
+
+    # throughput of all the jobs together, on the wall clock
+    starts = [job["time_started"] for job in jobs if job["time_started"]]
+    ends = [job["time_finished"] or now for job in jobs]
+    elapsed = max(ends) - min(starts) if starts else 0
+
+    print(", ".join(f"{state}: {n}" for state, n in sorted(states.items())))
+    print(
+        f"Files transcribed: {n_done}/{sum(stat['total'] for stat in stats)}"
+        + (f", {round(60 * n_done / elapsed, 1)} files/min." if elapsed > 0 else "")
+    )
+    print()
+
+
+#
+# Main
+#
+parser = argparse.ArgumentParser()
+parser = parser_add_args(parser)
+args = parser.parse_args()
+
+job_registry = JobRegistry(args.db)
+ai_client = registry.get_speech_client()
+
+if args.job_id is not None:
+    JOB_IDS = args.job_id
+
+    # jobs not created from here
+    FOUND = {job["job_id"] for job in job_registry.get_jobs(job_ids=JOB_IDS)}
+    for job_id in JOB_IDS:
+        if job_id not in FOUND:
+            print(f"JOB {job_id} not in the registry {args.db}")
+elif args.all == "yes":
+    JOB_IDS = None
+else:
+    # the jobs active now, shown until they complete
+    JOB_IDS = [job["job_id"] for job in job_registry.active_jobs()]
+
+while True:
+    t_start = time.time()
+    n_calls = job_registry.refresh(ai_client)
+
+    print(
+        f"Refreshed the active jobs with {n_calls} API calls "
+        f"in {round(time.time() - t_start, 2)} sec."
+    )
+    print()
+
+    if JOB_IDS is None:
+        jobs = job_registry.get_jobs(limit=args.limit)
+    else:
+        jobs = job_registry.get_jobs(job_ids=JOB_IDS, limit=args.limit)
+
+    now = time.time()
+    if jobs:
+        print_jobs(jobs, now)
+        print_summary(jobs, now)
+    else:
+        print("No jobs to show.")
+        print()
+
+    if args.watch <= 0 or all(
+        job["lifecycle_state"] not in ACTIVE_STATES for job in jobs
+    ):
+        break
+
+    time.sleep(args.watch)
@@ -0,0 +1,249 @@
+#
+# Local registry of the transcription jobs, in SQLite
+# written by SpeechClient when a job is created, the state of the active
+# jobs is refreshed in batch (one listing of the compartment)
+#
+import datetime
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import tracer
+
+from config import JOBS_DB, JOB_REFRESH_WORKERS, JOB_LIST_PAGE_SIZE
+
+# states in which the job can still change
+ACTIVE_STATES = ["ACCEPTED", "IN_PROGRESS", "CANCELING"]
+
+# the state of a job, as in TranscriptionJob and TranscriptionJobSummary
+STATE_FIELDS = [
+    "lifecycle_state",
+    "percent_complete",
+    "total_tasks",
+    "outstanding_tasks",
+    "time_accepted",
+    "time_started",
+    "time_finished",
+]
+
+COLUMNS = [
+    "job_id",
+    "display_name",
+    "compartment_id",
+    "input_bucket",
+    "output_bucket",
+    "output_prefix",
+    "language_code",
+    "n_files",
+    "time_created",
+    "time_updated",
+] + STATE_FIELDS
+
+
+def to_timestamp(value):
+    # the SDK returns datetime, the mocks float (sec.)
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+
+    return value
+
+
+class JobRegistry:
+    """
+    one row for every job submitted from here
+    """
+
+    def __init__(self, db_file=JOBS_DB):
+        self.db_file = db_file
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+
+        with self.conn:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    display_name TEXT,
+                    compartment_id TEXT,
+                    input_bucket TEXT,
+                    output_bucket TEXT,
+                    output_prefix TEXT,
+                    language_code TEXT,
+                    n_files INTEGER,
+                    time_created REAL,
+                    time_updated REAL,
+                    lifecycle_state TEXT,
+                    percent_complete INTEGER,
+                    total_tasks INTEGER,
+                    outstanding_tasks INTEGER,
+                    time_accepted REAL,
+                    time_started REAL,
+                    time_finished REAL)""")
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_state ON jobs (lifecycle_state)"
+            )
+
+    def add(self, job, job_details):
+        """
+        job: the TranscriptionJob returned by create_transcription_job
+        job_details: the CreateTranscriptionJobDetails of the request
+        """
+        object_location = job_details.input_location.object_locations[0]
+        now = time.time()
+
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO jobs VALUES ({', '.join('?' * len(COLUMNS))})",
+                (
+                    job.id,
+                    job_details.display_name,
+                    job_details.compartment_id,
+                    object_location.bucket_name,
+                    job_details.output_location.bucket_name,
+                    job.output_location.prefix,
+                    job_details.model_details.language_code,
+                    len(object_location.object_names),
+                    now,
+                    now,
+                )
+                + self.state_values(job),
+            )
+
+    @staticmethod
+    def state_values(job):
+        return tuple(to_timestamp(getattr(job, name, None)) for name in STATE_FIELDS)
+
+    def update(self, jobs):
+        """
+        update the state, jobs: TranscriptionJob or TranscriptionJobSummary
+        only the jobs in the registry are updated
+        """
+        now = time.time()
+        rows = [(now,) + self.state_values(job) + (job.id,) for job in jobs]
+
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE jobs SET time_updated = ?, "
+                + ", ".join(f"{name} = ?" for name in STATE_FIELDS)
+                + " WHERE job_id = ?",
+                rows,
+            )
+
+    def get_jobs(self, states=None, job_ids=None, limit=None):
+        """
+        list of dict, the most recent first
+        states: if provided, only the jobs in these states
+        job_ids: if provided, only these jobs
+        """
+        query = f"SELECT {', '.join(COLUMNS)} FROM jobs"
+        conditions = []
+        params = []
+
+        if states is not None:
+            conditions.append(f"lifecycle_state IN ({', '.join('?' * len(states))})")
+            params += list(states)
+        if job_ids is not None:
+            conditions.append(f"job_id IN ({', '.join('?' * len(job_ids))})")
+            params += list(job_ids)
+
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY time_created DESC"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def active_jobs(self):
+        return self.get_jobs(states=ACTIVE_STATES)
+
+    def list_sweep(self, ai_client, compartment_id, to_find, oldest, page_size):
+        """
+        list the jobs of the compartment, most recent first, until the oldest
+        active job, and update the ones in to_find (removed from it)
+        return the number of API calls
+        """
+        n_calls = 0
+        page = None
+
+        while to_find:
+            response = ai_client.list_transcription_jobs(
+                compartment_id=compartment_id,
+                sort_by="timeCreated",
+                sort_order="DESC",
+                limit=page_size,
+                page=page,
+            )
+            n_calls += 1
+            tracer.count("api_calls_total", service="speech", operation="list_jobs")
+
+            items = response.data.items
+            found = [item for item in items if item.id in to_find]
+            self.update(found)
+            to_find -= {item.id for item in found}
+
+            # the next pages have only jobs older than the oldest active
+            page = response.next_page
+            if (
+                page is None
+                or not items
+                or to_timestamp(items[-1].time_accepted) < oldest
+            ):
+                break
+
+        return n_calls
+
+    def refresh(
+        self,
+        ai_client,
+        max_workers=JOB_REFRESH_WORKERS,
+        page_size=JOB_LIST_PAGE_SIZE,
+    ):
+        """
+        refresh the state of all the active jobs, in one sweep:
+        one listing for every compartment (instead of a get for every job),
+        only the jobs not found are read one by one, in parallel
+
+        return the number of API calls
+        """
+        active = self.active_jobs()
+        to_find = {job["job_id"] for job in active}
+
+        n_calls = 0
+        for compartment_id in sorted({job["compartment_id"] for job in active}):
+            jobs = [job for job in active if job["compartment_id"] == compartment_id]
+            # times of the service, not of the local clock
+            oldest = min(job["time_accepted"] or job["time_created"] for job in jobs)
+
+            try:
+                n_calls += self.list_sweep(
+                    ai_client, compartment_id, to_find, oldest, page_size
+                )
+            except Exception as e:
+                # the jobs are read one by one
+                print(f"Error listing the jobs of {compartment_id}: {e}")
+
+        # not found in the listings (ex: no permission to list the compartment)
+        if to_find:
+
+            def get_job(job_id):
+                tracer.count("api_calls_total", service="speech", operation="get_job")
+                try:
+                    return ai_client.get_transcription_job(job_id).data
+                except Exception as e:
+                    print(f"Error reading JOB {job_id}: {e}")
+                    return None
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                jobs = list(executor.map(get_job, sorted(to_find)))
+
+            self.update([job for job in jobs if job is not None])
+            n_calls += len(jobs)
+
+        return n_calls
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,301 @@
+#
+# Split a large set of audio files in shards
+# and run one transcription job for each shard, concurrently
+#
+import heapq
+import time
+
+from utils import copy_json_from_oss
+from polling import PollingSchedule, estimate_job_duration
+
+from config import MAX_JOBS_IN_FLIGHT, JOB_TIMEOUT
+
+# job states from which the job doesn't move anymore
+FINAL_STATES = ["SUCCEEDED", "FAILED", "CANCELED"]
+# the shards of the jobs ended in these states are submitted again on resume
+RETRY_STATES = ["FAILED", "CANCELED"]
+
+
+def shard_files(file_names, n_shards=None, max_files=None, durations=None):
+    """
+    split file_names in shards
+
+    n_shards: number of shards
+    max_files: max number of files in a shard (used if n_shards is None)
+    durations: dict file_name -> duration (sec.), if provided the shards
+    are balanced on the total audio duration, otherwise on the number of files
+
+    return a list of lists of file names
+    """
+    if n_shards is None:
+        n_shards = -(-len(file_names) // max_files) if max_files else 1
+
+    n_shards = max(1, min(n_shards, len(file_names)))
+
+    if durations is None:
+        # round robin on the sorted list, sizes differ at most by one
+        shards = [sorted(file_names)[i::n_shards] for i in range(n_shards)]
+    else:
+        # longest first, each file goes to the shard with less audio
+        heap = [(0.0, i) for i in range(n_shards)]
+        shards = [[] for _ in range(n_shards)]
+
+        for f_name in sorted(file_names, key=lambda f: durations[f], reverse=True):
+            total, i = heapq.heappop(heap)
+            shards[i].append(f_name)
+            heapq.heappush(heap, (total + durations[f_name], i))
+
+        shards = [sorted(shard) for shard in shards]
+
+    return [shard for shard in shards if len(shard) > 0]
+
+
+class JobScheduler:
+    """
+    submit a job for every shard, keeping at most max_in_flight jobs
+    running at the same time, and track all of them together
+    a job running for more than timeout sec. is canceled
+    """
+
+    def __init__(
+        self,
+        speech_client,
+        max_in_flight=MAX_JOBS_IN_FLIGHT,
+        journal=None,
+        timeout=JOB_TIMEOUT,
+        **poll_args,
+    ):
+        self.speech_client = speech_client
+        self.max_in_flight = max_in_flight
+        # optional RunJournal: jobs and downloads are recorded,
+        # the jobs already submitted are not submitted again
+        # (the ones failed or canceled are)
+        self.journal = journal
+        self.timeout = timeout
+        # passed to PollingSchedule
+        self.poll_args = poll_args
+
+        # one dict for every shard: file_names, job, status
+        self.results = []
+
+    def submit(
+        self,
+        i,
+        shard,
+        input_bucket,
+        output_bucket,
+        job_prefix,
+        display_name,
+        language_code,
+    ):
+        job_details = self.speech_client.create_transcription_job_details(
+            input_bucket,
+            output_bucket,
+            shard["file_names"],
+            job_prefix,
+            display_name,
+            language_code,
+        )
+
+        try:
+            shard["job"] = self.speech_client.create_transcription_job(job_details)
+            shard["status"] = shard["job"].data.lifecycle_state
+
+            if self.journal is not None:
+                self.journal.job_submitted(
+                    i, shard["job"].data.id, shard["job"].data.output_location.prefix
+                )
+
+            print(f"Launched {display_name}, JOB ID is: {shard['job'].data.id}")
+        except Exception as e:
+            print(f"Error launching {display_name}: {e}")
+            shard["status"] = "FAILED"
+
+    def run(
+        self,
+        input_bucket,
+        output_bucket,
+        shards,
+        job_prefix,
+        display_name,
+        language_code,
+        durations=None,
+    ):
+        """
+        run all the shards, wait for all the jobs to complete
+        durations: dict file_name -> duration (sec.), to estimate when
+        every job will end (see PollingSchedule)
+        return the list of results, one for every shard
+        """
+        self.results = [
+            {"file_names": shard, "job": None, "status": None} for shard in shards
+        ]
+
+        to_submit = list(range(len(self.results)))
+        in_flight = []
+        # every job has its own schedule and time of the next poll
+        polls = {}
+
+        def start_polling(i, eta, t_submitted):
+            polls[i] = {
+                "schedule": PollingSchedule(eta=eta, **self.poll_args),
+                "t_start": t_submitted,
+            }
+            schedule_poll(i)
+
+        def schedule_poll(i):
+            elapsed = time.time() - polls[i]["t_start"]
+            next_poll = time.time() + polls[i]["schedule"].next_interval(elapsed)
+
+            # wake up also for the timeout
+            polls[i]["next_poll"] = min(next_poll, polls[i]["t_start"] + self.timeout)
+
+        def get_eta(i):
+            if durations is None:
+                return None
+
+            return estimate_job_duration(sum(durations[f] for f in shards[i]))
+
+        if self.journal is not None:
+            # jobs submitted before the restart: re-attach
+            for i, job in self.journal.jobs.items():
+                if job["status"] in RETRY_STATES:
+                    # failed in the last run: submitted again
+                    continue
+
+                self.reattach(i, job["job_id"])
+                status = self.results[i]["status"]
+
+                if job["status"] is None and status in FINAL_STATES:
+                    # ended while nobody was watching
+                    self.journal.job_done(i, status)
+
+                    if status in RETRY_STATES:
+                        self.results[i].update(job=None, status=None)
+                        continue
+
+                to_submit.remove(i)
+
+                if status not in FINAL_STATES:
+                    in_flight.append(i)
+                    start_polling(i, get_eta(i), job["time_submitted"])
+
+        t_start = time.time()
+        while to_submit or in_flight:
+            # submit new jobs, up to max_in_flight
+            while to_submit and len(in_flight) < self.max_in_flight:
+                i = to_submit.pop(0)
+
+                self.submit(
+                    i,
+                    self.results[i],
+                    input_bucket,
+                    output_bucket,
+                    job_prefix,
+                    f"{display_name}_shard{i}",
+                    language_code,
+                )
+                if self.results[i]["status"] not in FINAL_STATES:
+                    in_flight.append(i)
+                    start_polling(i, get_eta(i), time.time())
+
+            if not in_flight:
+                continue
+
+            # wait for the first job to poll
+            time.sleep(
+                max(min(polls[i]["next_poll"] for i in in_flight) - time.time(), 0)
+            )
+
+            # check the status of the jobs due
+            for i in list(in_flight):
+                if polls[i]["next_poll"] > time.time():
+                    continue
+
+                job_id = self.results[i]["job"].data.id
+
+                if time.time() >= polls[i]["t_start"] + self.timeout:
+                    # a job stuck would block the whole run
+                    print(f"Timeout for shard {i}, JOB ID: {job_id}")
+                    self.speech_client.cancel_job(job_id)
+                    status = "CANCELED"
+                else:
+                    current_job = self.speech_client.get_job(job_id)
+                    status = current_job.data.lifecycle_state
+
+                self.results[i]["status"] = status
+                if status in FINAL_STATES:
+                    in_flight.remove(i)
+
+                    if self.journal is not None:
+                        self.journal.job_done(i, status)
+                else:
+                    schedule_poll(i)
+
+            n_done = len(self.results) - len(to_submit) - len(in_flight)
+            print(
+                f"Jobs completed: {n_done}/{len(self.results)}, running: {len(in_flight)}, "
+                f"elapsed: {round(time.time() - t_start)} s...."
+            )
+
+        print()
+        for i, shard in enumerate(self.results):
+            print(
+                f"Shard {i}: {len(shard['file_names'])} files, status: {shard['status']}"
+            )
+        print()
+
+        return self.results
+
+    def reattach(self, i, job_id):
+        """
+        get the state of a job submitted by a previous run
+        """
+        current_job = self.speech_client.get_job(job_id)
+
+        self.results[i]["job"] = current_job
+        self.results[i]["status"] = current_job.data.lifecycle_state
+
+        print(
+            f"Re-attached to shard {i}, JOB ID: {job_id}, status: {self.results[i]['status']}"
+        )
+
+    def all_succeeded(self):
+        return all(shard["status"] == "SUCCEEDED" for shard in self.results)
+
+    def failed_shards(self):
+        """
+        the index of the shards not succeeded
+        """
+        return [
+            i for i, shard in enumerate(self.results) if shard["status"] != "SUCCEEDED"
+        ]
+
+    def collect_outputs(self, fs, local_json_dir, json_ext, output_bucket):
+        """
+        copy to local_json_dir the json from all the jobs succeeded
+        return the list of json file names
+        """
+        file_names = []
+
+        for shard in self.results:
+            if shard["status"] == "SUCCEEDED":
+                output_prefix = shard["job"].data.output_location.prefix
+
+                if self.journal is not None:
+                    # only the files not downloaded before the restart
+                    file_names += copy_json_from_oss(
+                        fs,
+                        local_json_dir,
+                        json_ext,
+                        output_prefix,
+                        output_bucket,
+                        skip_names=self.journal.downloaded,
+                        on_download=self.journal.file_downloaded,
+                    )
+                else:
+                    file_names += copy_json_from_oss(
+                        fs, local_json_dir, json_ext, output_prefix, output_bucket
+                    )
+
+        return sorted(file_names)
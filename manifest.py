@@ -0,0 +1,94 @@
+#
+# Local manifest of the files uploaded to a bucket
+# used to skip the upload of files not changed since the last run
+#
+import os
+from os import path
+import base64
+import hashlib
+import json
+
+
+def compute_md5(f_name):
+    """
+    return the md5 of the file, base64 encoded (as Object Storage does)
+    """
+    md5 = hashlib.md5()
+
+    with open(f_name, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(chunk)
+
+    return base64.b64encode(md5.digest()).decode("utf-8")
+
+
+class UploadManifest:
+    """
+    for each bucket and object records:
+    md5, size and mtime of the local file, etag of the remote object
+    """
+
+    def __init__(self, manifest_file, bucket_name):
+        self.manifest_file = manifest_file
+        self.bucket_name = bucket_name
+
+        self.data = {}
+        if path.exists(manifest_file):
+            with open(manifest_file) as f:
+                self.data = json.load(f)
+
+        self.entries = self.data.setdefault(bucket_name, {})
+
+    def local_md5(self, f_name):
+        """
+        md5 of the local file
+        not recomputed if size and mtime are the ones in the manifest
+        """
+        stat = os.stat(f_name)
+        entry = self.entries.get(path.basename(f_name))
+
+        if (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime"] == stat.st_mtime
+        ):
+            return entry["md5"]
+
+        return compute_md5(f_name)
+
+    def is_unchanged(self, f_name, md5, remote_info):
+        """
+        true if the object in the bucket has the same content of the local file
+
+        remote_info: the dict from fs.ls(detail=True), None if not in bucket
+        """
+        entry = self.entries.get(path.basename(f_name))
+
+        if entry is None or remote_info is None:
+            return False
+
+        if entry["md5"] != md5 or remote_info.get("size") != entry["size"]:
+            return False
+
+        # md5 is not available for multipart uploads, in that case use etag
+        if remote_info.get("md5"):
+            return remote_info["md5"] == md5
+
+        return remote_info.get("etag") == entry["etag"]
+
+    def update(self, f_name, md5, etag):
+        stat = os.stat(f_name)
+
+        self.entries[path.basename(f_name)] = {
+            "md5": md5,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "etag": etag,
+        }
+
+    def remove(self, only_name):
+        self.entries.pop(only_name, None)
+
+    def save(self):
+        with open(self.manifest_file, "w") as f:
+            json.dump(self.data, f, indent=2)
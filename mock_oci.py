@@ -0,0 +1,550 @@
+#
+# Local stand-ins for OCI services
+# to run and test the code without OCI credentials
+#
+import os
+from os import path
+from collections import Counter
+import fnmatch
+import hashlib
+import json
+import random
+import shutil
+import threading
+import time
+from types import SimpleNamespace
+
+from manifest import compute_md5
+
+from config import MOCK_ENV_VAR
+
+# words used for the synthetic transcriptions
+WORDS = (
+    "the speech service transcribes audio files into text with timestamps "
+    "and confidence for every word in many languages"
+).split()
+
+
+def is_mock_enabled():
+    """
+    True if the mocks must be used instead of OCI
+    """
+    return os.environ.get(MOCK_ENV_VAR) == "1"
+
+
+class MockServiceError(Exception):
+    """
+    injected failure, as a transient error (503) of the OCI services
+    """
+
+    def __init__(self, operation):
+        super().__init__(f"Injected failure in {operation}")
+        self.status = 503
+        self.operation = operation
+
+
+class FailureInjector:
+    """
+    latency and failures of the calls to a mock service
+
+    latency: seconds added to every call, +/- jitter (fraction)
+    bandwidth: bytes/sec., the transfer time is added (None: no limit)
+    failure_rate: probability that a call raises MockServiceError
+    calls: number of calls for every operation
+    """
+
+    def __init__(
+        self, latency=0.0, jitter=0.0, bandwidth=None, failure_rate=0.0, seed=None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.failures = Counter()
+
+    def __call__(self, operation, n_bytes=0):
+        with self.lock:
+            self.calls[operation] += 1
+            factor = 1 + self.jitter * (2 * self.rng.random() - 1)
+            fail = self.rng.random() < self.failure_rate
+            if fail:
+                self.failures[operation] += 1
+
+        wait_time = self.latency * factor
+        if self.bandwidth:
+            wait_time += n_bytes / self.bandwidth
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+        if fail:
+            raise MockServiceError(operation)
+
+
+def synthetic_transcription(f_name, n_words=20, word_duration=0.4):
+    """
+    a json as produced by OCI Speech, with tokens and timestamps
+    the words depend only on f_name, so results are reproducible
+    """
+    rng = random.Random(f_name)
+    words = [rng.choice(WORDS) for _ in range(n_words)]
+
+    tokens = []
+    t = 0.0
+    for word in words:
+        tokens.append(
+            {
+                "token": word,
+                "startTime": f"{t:.2f}s",
+                "endTime": f"{t + word_duration:.2f}s",
+                "confidence": f"{rng.uniform(0.8, 1.0):.4f}",
+                "type": "WORD",
+            }
+        )
+        t += word_duration + 0.1
+
+    return {
+        "status": "SUCCESS",
+        "audioFormatDetails": {"format": f_name.split(".")[-1]},
+        "transcriptions": [
+            {
+                "transcription": " ".join(words).capitalize() + ".",
+                "confidence": f"{rng.uniform(0.85, 0.99):.4f}",
+                "speakerCount": 1,
+                "tokens": tokens,
+            }
+        ],
+    }
+
+
+class MockFileSystem:
+    """
+    mimics the subset of OCIFileSystem used in this project
+    objects are stored as local files in root_dir/bucket/object_name
+    remote paths have the form: bucket@namespace/object_name
+
+    latency, jitter, bandwidth, failure_rate, seed: see FailureInjector
+    """
+
+    def __init__(
+        self,
+        root_dir="mock_oss",
+        latency=0.0,
+        jitter=0.0,
+        bandwidth=None,
+        failure_rate=0.0,
+        seed=None,
+    ):
+        self.root_dir = root_dir
+        self.injector = FailureInjector(latency, jitter, bandwidth, failure_rate, seed)
+
+        os.makedirs(root_dir, exist_ok=True)
+
+    @property
+    def latency(self):
+        return self.injector.latency
+
+    def _wait(self, operation="call", n_bytes=0):
+        self.injector(operation, n_bytes)
+
+    def _split_path(self, remote_path):
+        # returns (bucket, namespace, object_name)
+        remote_path = remote_path.replace("oci://", "").rstrip("/")
+        bucket_ns, _, object_name = remote_path.partition("/")
+        bucket, _, namespace = bucket_ns.partition("@")
+
+        return bucket, namespace, object_name
+
+    def _local_path(self, remote_path):
+        bucket, _, object_name = self._split_path(remote_path)
+
+        return path.join(self.root_dir, bucket, object_name)
+
+    def _list_objects(self, bucket):
+        # all object names in the bucket
+        bucket_dir = path.join(self.root_dir, bucket)
+
+        object_names = []
+        for dir_path, _, files in os.walk(bucket_dir):
+            for f_name in files:
+                full_name = path.join(dir_path, f_name)
+                object_names.append(
+                    path.relpath(full_name, bucket_dir).replace(os.sep, "/")
+                )
+
+        return sorted(object_names)
+
+    def _object_info(self, bucket, namespace, object_name):
+        local_path = path.join(self.root_dir, bucket, object_name)
+        md5 = compute_md5(local_path)
+
+        return {
+            "name": f"{bucket}@{namespace}/{object_name}",
+            "type": "file",
+            "size": path.getsize(local_path),
+            "etag": hashlib.sha1(md5.encode("utf-8")).hexdigest(),
+            "md5": md5,
+        }
+
+    def put(self, lpath, rpath):
+        self._wait("put", path.getsize(lpath))
+
+        local_path = self._local_path(rpath)
+        os.makedirs(path.dirname(local_path), exist_ok=True)
+
+        shutil.copyfile(lpath, local_path)
+
+    def get(self, rpath, lpath):
+        local_path = self._local_path(rpath)
+
+        self._wait("get", path.getsize(local_path) if path.exists(local_path) else 0)
+        shutil.copyfile(local_path, lpath)
+
+    def open(self, rpath, mode="rb", block_size=None, **kwargs):
+        self._wait("open")
+
+        local_path = self._local_path(rpath)
+
+        if "w" in mode:
+            os.makedirs(path.dirname(local_path), exist_ok=True)
+
+        return open(local_path, mode)
+
+    def exists(self, rpath):
+        self._wait("exists")
+        return path.exists(self._local_path(rpath))
+
+    def info(self, rpath):
+        self._wait("info")
+
+        bucket, namespace, object_name = self._split_path(rpath)
+
+        if not path.isfile(self._local_path(rpath)):
+            raise FileNotFoundError(rpath)
+
+        return self._object_info(bucket, namespace, object_name)
+
+    def ls(self, rpath, detail=False, **kwargs):
+        """
+        list the objects and "directories" directly under rpath
+        """
+        self._wait("ls")
+
+        bucket, namespace, prefix = self._split_path(rpath)
+        if prefix:
+            prefix = prefix + "/"
+
+        entries = {}
+        for object_name in self._list_objects(bucket):
+            if not object_name.startswith(prefix):
+                continue
+
+            child = object_name[len(prefix) :].split("/")[0]
+            full_name = f"{bucket}@{namespace}/{prefix}{child}"
+
+            if "/" in object_name[len(prefix) :]:
+                entries[full_name] = {"name": full_name, "type": "directory", "size": 0}
+            elif detail:
+                entries[full_name] = self._object_info(bucket, namespace, object_name)
+            else:
+                entries[full_name] = None
+
+        if detail:
+            return list(entries.values())
+
+        return list(entries.keys())
+
+    def glob(self, pattern):
+        self._wait("glob")
+        bucket, namespace, key_pattern = self._split_path(pattern)
+
+        return [
+            f"{bucket}@{namespace}/{object_name}"
+            for object_name in self._list_objects(bucket)
+            if fnmatch.fnmatch(object_name, key_pattern)
+        ]
+
+    def rm(self, rpath, recursive=False):
+        self._wait("rm")
+
+        local_path = self._local_path(rpath)
+
+        if path.isdir(local_path):
+            shutil.rmtree(local_path)
+        else:
+            os.remove(local_path)
+
+    def invalidate_cache(self, rpath=None):
+        # nothing is cached here
+        pass
+
+
+class MockResponse:
+    # as the responses of the OCI SDK, the result is in data
+    # next_page: for the list calls, the token of the next page (None if last)
+    def __init__(self, data, next_page=None):
+        self.data = data
+        self.next_page = next_page
+
+
+class MockAIServiceSpeechClient:
+    """
+    mimics the subset of oci.ai_speech.AIServiceSpeechClient used in this project
+
+    a job is ACCEPTED, then IN_PROGRESS, then SUCCEEDED after job_duration sec.
+    while the job is in progress, a synthetic json for every file completed
+    is written to the output bucket in fs (a MockFileSystem)
+
+    job_failure_rate: probability that a job ends FAILED
+    words_per_file: words in every synthetic transcription
+    latency, jitter, failure_rate, seed: of the API calls, see FailureInjector
+    jobs_dir: if provided, the jobs are saved there (one json for every job)
+    and survive a restart of the process, as the real jobs do
+    """
+
+    def __init__(
+        self,
+        fs,
+        job_duration=1.0,
+        job_failure_rate=0.0,
+        words_per_file=20,
+        latency=0.0,
+        jitter=0.0,
+        failure_rate=0.0,
+        seed=None,
+        jobs_dir=None,
+    ):
+        self.fs = fs
+        self.job_duration = job_duration
+        self.job_failure_rate = job_failure_rate
+        self.words_per_file = words_per_file
+        self.injector = FailureInjector(latency, jitter, None, failure_rate, seed)
+
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.n_jobs = 0
+
+        self.jobs_dir = jobs_dir
+        if jobs_dir is not None:
+            os.makedirs(jobs_dir, exist_ok=True)
+            # the ids of new jobs must not collide with the saved ones
+            self.n_jobs = len(os.listdir(jobs_dir))
+
+    def _save(self, job):
+        if self.jobs_dir is None:
+            return
+
+        object_location = job.input_location.object_locations[0]
+        state = {
+            name: getattr(job, name)
+            for name in [
+                "id",
+                "display_name",
+                "compartment_id",
+                "lifecycle_state",
+                "percent_complete",
+                "total_tasks",
+                "outstanding_tasks",
+                "time_accepted",
+                "time_started",
+                "time_finished",
+                "n_written",
+                "will_fail",
+            ]
+        }
+        state["language_code"] = job.model_details.language_code
+        state["domain"] = job.model_details.domain
+        state["input_location"] = {
+            "namespace_name": object_location.namespace_name,
+            "bucket_name": object_location.bucket_name,
+            "object_names": list(object_location.object_names),
+        }
+        state["output_location"] = vars(job.output_location)
+
+        # written and renamed: a reader never sees a partial file
+        f_name = path.join(self.jobs_dir, f"{job.id}.json")
+        with open(f_name + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f_name + ".tmp", f_name)
+
+    def _load(self, job_id):
+        with open(path.join(self.jobs_dir, f"{job_id}.json")) as f:
+            state = json.load(f)
+
+        return SimpleNamespace(
+            **{
+                name: value
+                for name, value in state.items()
+                if name
+                not in ["language_code", "domain", "input_location", "output_location"]
+            },
+            model_details=SimpleNamespace(
+                language_code=state["language_code"], domain=state["domain"]
+            ),
+            input_location=SimpleNamespace(
+                object_locations=[SimpleNamespace(**state["input_location"])]
+            ),
+            output_location=SimpleNamespace(**state["output_location"]),
+        )
+
+    def _get_job(self, job_id):
+        # created by this process or, if jobs_dir, by a previous one
+        if job_id not in self.jobs and self.jobs_dir is not None:
+            self.jobs[job_id] = self._load(job_id)
+
+        return self.jobs[job_id]
+
+    def create_transcription_job(self, create_transcription_job_details):
+        self.injector("create_transcription_job")
+
+        details = create_transcription_job_details
+        object_location = details.input_location.object_locations[0]
+
+        with self.lock:
+            self.n_jobs += 1
+            job_id = f"ocid1.aispeechtranscriptionjob.oc1..mock{self.n_jobs:06d}"
+            will_fail = self.rng.random() < self.job_failure_rate
+
+        job = SimpleNamespace(
+            id=job_id,
+            display_name=details.display_name,
+            compartment_id=details.compartment_id,
+            lifecycle_state="ACCEPTED",
+            percent_complete=0,
+            total_tasks=len(object_location.object_names),
+            outstanding_tasks=len(object_location.object_names),
+            model_details=details.model_details,
+            input_location=details.input_location,
+            output_location=SimpleNamespace(
+                namespace_name=details.output_location.namespace_name,
+                bucket_name=details.output_location.bucket_name,
+                prefix=f"{details.output_location.prefix}/job-{job_id}",
+            ),
+            time_accepted=time.time(),
+            time_started=None,
+            time_finished=None,
+            # number of json already written
+            n_written=0,
+            will_fail=will_fail,
+        )
+        self.jobs[job_id] = job
+        self._save(job)
+
+        return MockResponse(job)
+
+    def _write_outputs(self, job, n_files):
+        """
+        write the json for the first n_files files, if not already written
+        """
+        object_location = job.input_location.object_locations[0]
+        output = job.output_location
+
+        for f_name in object_location.object_names[job.n_written : n_files]:
+            json_name = (
+                f"{object_location.namespace_name}_{object_location.bucket_name}"
+                f"_{f_name}.json"
+            )
+            d_json = synthetic_transcription(f_name, self.words_per_file)
+
+            with self.fs.open(
+                f"{output.bucket_name}@{output.namespace_name}/{output.prefix}/{json_name}",
+                "w",
+            ) as f:
+                json.dump(d_json, f)
+
+        job.n_written = max(job.n_written, n_files)
+
+    def cancel_transcription_job(self, transcription_job_id):
+        self.injector("cancel_transcription_job")
+
+        job = self._get_job(transcription_job_id)
+
+        if job.lifecycle_state in ["ACCEPTED", "IN_PROGRESS"]:
+            job.lifecycle_state = "CANCELED"
+            job.time_finished = time.time()
+            self._save(job)
+
+        return MockResponse(None)
+
+    def get_transcription_job(self, transcription_job_id):
+        self.injector("get_transcription_job")
+
+        job = self._get_job(transcription_job_id)
+        self._advance(job)
+
+        return MockResponse(job)
+
+    def _advance(self, job):
+        # the state of the job depends only on the time since it was accepted
+        if job.lifecycle_state in ["ACCEPTED", "IN_PROGRESS"]:
+            elapsed = time.time() - job.time_accepted
+
+            if elapsed >= self.job_duration and job.will_fail:
+                # the outputs already written stay there
+                job.lifecycle_state = "FAILED"
+                job.time_finished = time.time()
+            elif elapsed >= self.job_duration:
+                self._write_outputs(job, job.total_tasks)
+
+                job.lifecycle_state = "SUCCEEDED"
+                job.percent_complete = 100
+                job.outstanding_tasks = 0
+                job.time_finished = time.time()
+            elif elapsed > 0:
+                job.lifecycle_state = "IN_PROGRESS"
+                job.percent_complete = int(100 * elapsed / self.job_duration)
+                job.time_started = job.time_started or time.time()
+
+                # the files are completed one after the other
+                n_done = int(job.total_tasks * elapsed / self.job_duration)
+                self._write_outputs(job, n_done)
+                job.outstanding_tasks = job.total_tasks - job.n_written
+
+            self._save(job)
+
+    def list_transcription_jobs(
+        self,
+        compartment_id=None,
+        lifecycle_state=None,
+        limit=100,
+        page=None,
+        sort_by="timeCreated",
+        sort_order="DESC",
+        **kwargs,
+    ):
+        """
+        the jobs of the compartment (also the saved ones), sorted on the time
+        page is the offset in the list, as a string
+        """
+        self.injector("list_transcription_jobs")
+
+        if self.jobs_dir is not None:
+            for f_name in sorted(os.listdir(self.jobs_dir)):
+                if f_name.endswith(".json"):
+                    self._get_job(f_name[: -len(".json")])
+
+        jobs = [
+            job
+            for job in self.jobs.values()
+            if compartment_id is None or job.compartment_id == compartment_id
+        ]
+        for job in jobs:
+            self._advance(job)
+
+        if lifecycle_state is not None:
+            jobs = [job for job in jobs if job.lifecycle_state == lifecycle_state]
+
+        if sort_by == "displayName":
+            jobs.sort(key=lambda job: job.display_name, reverse=sort_order == "DESC")
+        else:
+            jobs.sort(key=lambda job: job.time_accepted, reverse=sort_order == "DESC")
+
+        start = int(page or 0)
+        end = start + limit
+        next_page = str(end) if end < len(jobs) else None
+
+        return MockResponse(SimpleNamespace(items=jobs[start:end]), next_page)
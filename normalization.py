@@ -0,0 +1,239 @@
+#
+# Text normalization before computing WER
+# a profile is a pipeline of steps, tables and regex are compiled once
+# texts are processed in batch: all the column is joined in one string
+#
+import hashlib
+import re
+import string
+
+# typographic quotes and dashes, mapped before the other steps
+QUOTES = {"’": "'", "‘": "'", "“": '"', "”": '"', "–": "-", "—": "-"}
+QUOTES_REGEX = re.compile("|".join(QUOTES))
+
+# the texts in a batch are joined with this separator
+SEPARATOR = "\n"
+# other whitespace becomes a space, then multiple spaces are collapsed
+WHITESPACE = "\t\r\f\v"
+SPACES_REGEX = re.compile(r"  +")
+
+NUMBER_REGEX = re.compile(r"\d+")
+
+ONES = (
+    "zero one two three four five six seven eight nine ten eleven twelve "
+    "thirteen fourteen fifteen sixteen seventeen eighteen nineteen"
+).split()
+TENS = "_ _ twenty thirty forty fifty sixty seventy eighty ninety".split()
+SCALES = [(10**9, "billion"), (10**6, "million"), (1000, "thousand"), (100, "hundred")]
+
+
+def number_to_words_en(number):
+    """
+    number expansion hook for English: "42" -> "forty two"
+    """
+    n = int(number)
+
+    if n < 20:
+        return ONES[n]
+    if n < 100:
+        return TENS[n // 10] + ("" if n % 10 == 0 else " " + ONES[n % 10])
+
+    for value, name in SCALES:
+        if n >= value:
+            words = number_to_words_en(n // value) + " " + name
+            if n % value:
+                words += " " + number_to_words_en(n % value)
+
+            return words
+
+
+class NormalizationProfile:
+    """
+    steps, in order:
+    quotes -> abbreviations -> numbers -> case -> remove chars -> spaces
+
+    name: shown in the UI; the caches use fingerprint, computed from the
+    configuration, so it changes whenever a rule (or the hook) is edited
+    case: "upper", "lower" or None
+    remove_chars: chars removed (punctuation), keep_chars: chars not removed
+    replace_with: what the removed chars become, a space to not join words
+    abbreviations: dict, ex: {"dr.": "doctor"}, matched as whole words
+    number_hook: function "42" -> "forty two", None to keep the digits
+    normalize_references: if False only the predictions are normalized
+    """
+
+    def __init__(
+        self,
+        name,
+        case=None,
+        remove_chars=string.punctuation,
+        keep_chars="",
+        replace_with=" ",
+        abbreviations=None,
+        number_hook=None,
+        normalize_references=True,
+    ):
+        self.name = name
+        self.case = case
+        self.normalize_references = normalize_references
+
+        removed = [c for c in remove_chars if c not in keep_chars]
+
+        # str.translate is slow on non ASCII texts: ASCII chars are removed
+        # from the UTF-8 bytes (never part of a multibyte char), the others
+        # with a regex
+        ascii_removed = "".join(c for c in removed if ord(c) < 128)
+        self.replace_with = replace_with
+        if replace_with:
+            table = ascii_removed + WHITESPACE
+            self.bytes_table = bytes.maketrans(
+                table.encode(), replace_with.encode() * len(table)
+            )
+            self.bytes_delete = b""
+        else:
+            self.bytes_table = bytes.maketrans(
+                WHITESPACE.encode(), b" " * len(WHITESPACE)
+            )
+            self.bytes_delete = ascii_removed.encode()
+
+        other_removed = [c for c in removed if ord(c) >= 128]
+        self.remove_regex = None
+        if other_removed:
+            self.remove_regex = re.compile("|".join(map(re.escape, other_removed)))
+
+        self.abbreviations = None
+        if abbreviations:
+            # longest first, case insensitive
+            alternatives = sorted(abbreviations, key=len, reverse=True)
+            self.abbreviations = {k.lower(): v for k, v in abbreviations.items()}
+            self.abbreviations_regex = re.compile(
+                r"(?<!\w)(" + "|".join(re.escape(a) for a in alternatives) + r")(?!\w)",
+                re.IGNORECASE,
+            )
+
+        self.number_hook = number_hook
+        self.fingerprint = self.compute_fingerprint(removed, abbreviations, number_hook)
+
+    def compute_fingerprint(self, removed, abbreviations, number_hook):
+        """
+        hash of everything that changes the output of normalize
+        """
+        hook = None
+        if number_hook is not None:
+            code = getattr(number_hook, "__code__", None)
+            hook = (
+                number_hook.__module__,
+                number_hook.__qualname__,
+                code.co_code.hex() if code is not None else None,
+                code.co_consts if code is not None else None,
+            )
+
+        config = (
+            sorted(QUOTES.items()),
+            self.case,
+            "".join(sorted(removed)),
+            self.replace_with,
+            sorted((abbreviations or {}).items()),
+            hook,
+        )
+
+        return f"{self.name}-{hashlib.sha1(repr(config).encode()).hexdigest()[:12]}"
+
+    def normalize_text(self, text):
+        """
+        all the steps on one string (possibly many texts joined)
+        """
+        text = QUOTES_REGEX.sub(lambda m: QUOTES[m.group(0)], text)
+
+        if self.abbreviations is not None:
+            text = self.abbreviations_regex.sub(
+                lambda m: self.abbreviations[m.group(0).lower()], text
+            )
+
+        if self.number_hook is not None:
+            text = NUMBER_REGEX.sub(lambda m: self.number_hook(m.group(0)), text)
+
+        if self.case == "upper":
+            text = text.upper()
+        elif self.case == "lower":
+            text = text.lower()
+
+        if self.remove_regex is not None:
+            text = self.remove_regex.sub(self.replace_with, text)
+        text = (
+            text.encode("utf-8")
+            .translate(self.bytes_table, self.bytes_delete)
+            .decode("utf-8")
+        )
+
+        return SPACES_REGEX.sub(" ", text)
+
+    def normalize(self, texts):
+        """
+        normalize a list of texts, in one batch
+        """
+        if len(texts) == 0:
+            return []
+
+        joined = SEPARATOR.join(text.replace(SEPARATOR, " ") for text in texts)
+
+        return [
+            text.strip(" ") for text in self.normalize_text(joined).split(SEPARATOR)
+        ]
+
+
+# per language profiles, the keys are the language codes of OCI Speech
+PROFILES = {
+    # LibriSpeech references: all uppercase, no punctuation
+    # (only the predictions are normalized, as in the first version of demo3)
+    "librispeech": NormalizationProfile(
+        "librispeech", case="upper", replace_with="", normalize_references=False
+    ),
+    "en-GB": NormalizationProfile(
+        "en-GB",
+        case="lower",
+        keep_chars="'",
+        abbreviations={
+            "mr.": "mister",
+            "mrs.": "missus",
+            "dr.": "doctor",
+            "st.": "saint",
+            "e.g.": "for example",
+            "i.e.": "that is",
+        },
+        number_hook=number_to_words_en,
+    ),
+    # apostrophe of the elisions (l'uomo, l'homme) is kept
+    "it-IT": NormalizationProfile(
+        "it-IT",
+        case="lower",
+        keep_chars="'",
+        abbreviations={"sig.": "signor", "dott.": "dottor", "ecc.": "eccetera"},
+    ),
+    "es-ES": NormalizationProfile(
+        "es-ES",
+        case="lower",
+        remove_chars=string.punctuation + "¿¡",
+        abbreviations={"sr.": "señor", "sra.": "señora", "etc.": "etcétera"},
+    ),
+    "fr-FR": NormalizationProfile(
+        "fr-FR",
+        case="lower",
+        remove_chars=string.punctuation + "«»",
+        keep_chars="'",
+        abbreviations={"m.": "monsieur", "mme": "madame", "etc.": "et cetera"},
+    ),
+    "de-DE": NormalizationProfile(
+        "de-DE",
+        case="lower",
+        remove_chars=string.punctuation + "„",
+        abbreviations={"z.b.": "zum beispiel", "usw.": "und so weiter"},
+    ),
+}
+
+
+def get_profile(name):
+    if name not in PROFILES:
+        raise ValueError(f"Unknown normalization profile: {name}")
+
+    return PROFILES[name]
@@ -0,0 +1,199 @@
+#
+# Output sinks for the transcriptions: CSV, Parquet, JSONL
+# records are buffered and appended in batches, as results arrive
+#
+import csv
+import json
+from os.path import splitext
+
+from functools import lru_cache
+
+from config import SINK_BATCH_SIZE
+
+# pandas and pyarrow are imported only when needed
+# (a CSV or JSONL sink doesn't need them)
+
+
+@lru_cache(maxsize=None)
+def parquet_schema():
+    """
+    tokens are saved in Parquet as a list for every file
+    """
+    import pyarrow as pa
+
+    token_type = pa.struct(
+        [
+            ("token", pa.string()),
+            ("start_time", pa.float32()),
+            ("end_time", pa.float32()),
+            ("confidence", pa.float32()),
+            ("type", pa.string()),
+        ]
+    )
+
+    return pa.schema(
+        [
+            ("file_name", pa.string()),
+            ("txt", pa.string()),
+            ("confidence", pa.float32()),
+            ("tokens", pa.list_(token_type)),
+        ]
+    )
+
+
+def to_dict(record):
+    """
+    record: (utterance row, token rows), see transcription_store
+    """
+    (file_name, txt, confidence, _), token_rows = record
+
+    return {
+        "file_name": file_name,
+        "txt": txt,
+        "confidence": confidence,
+        "tokens": [
+            {
+                "token": token,
+                "start_time": start_time,
+                "end_time": end_time,
+                "confidence": token_confidence,
+                "type": token_type,
+            }
+            for _, token, start_time, end_time, token_confidence, token_type in token_rows
+        ],
+    }
+
+
+class OutputSink:
+    """
+    base class: write() buffers, every batch_size records the batch is written
+    use it as a context manager, or call close() at the end
+    """
+
+    def __init__(self, file_name, batch_size=SINK_BATCH_SIZE):
+        self.file_name = file_name
+        self.batch_size = batch_size
+
+        self.batch = []
+        self.n_written = 0
+
+    def write(self, record):
+        self.batch.append(to_dict(record))
+
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.batch) > 0:
+            self.write_batch(self.batch)
+            self.n_written += len(self.batch)
+            self.batch = []
+
+    def write_batch(self, batch):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CSVSink(OutputSink):
+    """
+    file_name, txt: the same format of result.csv
+    """
+
+    def __init__(self, file_name, batch_size=SINK_BATCH_SIZE):
+        super().__init__(file_name, batch_size)
+
+        self.f = open(file_name, "w", newline="")
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(["file_name", "txt"])
+
+    def write_batch(self, batch):
+        self.writer.writerows([(d["file_name"], d["txt"]) for d in batch])
+        self.f.flush()
+
+    def close(self):
+        super().close()
+        self.f.close()
+
+
+class ParquetSink(OutputSink):
+    """
+    one row group for every batch, with confidence and tokens
+    """
+
+    def __init__(self, file_name, batch_size=SINK_BATCH_SIZE):
+        import pyarrow.parquet as pq
+
+        super().__init__(file_name, batch_size)
+
+        self.schema = parquet_schema()
+        self.writer = pq.ParquetWriter(file_name, self.schema)
+
+    def write_batch(self, batch):
+        import pyarrow as pa
+
+        self.writer.write_table(pa.Table.from_pylist(batch, schema=self.schema))
+
+    def close(self):
+        super().close()
+        self.writer.close()
+
+
+class JSONLSink(OutputSink):
+    """
+    one json for every line, with confidence and tokens
+    """
+
+    def __init__(self, file_name, batch_size=SINK_BATCH_SIZE):
+        super().__init__(file_name, batch_size)
+
+        self.f = open(file_name, "w")
+
+    def write_batch(self, batch):
+        self.f.writelines(json.dumps(d) + "\n" for d in batch)
+        self.f.flush()
+
+    def close(self):
+        super().close()
+        self.f.close()
+
+
+SINKS = {".csv": CSVSink, ".parquet": ParquetSink, ".jsonl": JSONLSink}
+
+
+def open_sink(file_name, batch_size=SINK_BATCH_SIZE):
+    """
+    the sink is chosen from the extension of file_name
+    """
+    ext = splitext(file_name)[1].lower()
+
+    if ext not in SINKS:
+        raise ValueError(f"Unsupported output format: {file_name}")
+
+    return SINKS[ext](file_name, batch_size)
+
+
+def load_results(file_name, columns=("file_name", "txt")):
+    """
+    read back the output of a sink (CSV, Parquet or JSONL) as a DataFrame
+    """
+    import pandas as pd
+
+    ext = splitext(file_name)[1].lower()
+    # as written, never inferred: "0001" is a file name, "" a transcription
+    dtype = {"file_name": str, "txt": str}
+
+    if ext == ".parquet":
+        # only the columns needed are read
+        return pd.read_parquet(file_name, columns=list(columns))
+    if ext == ".jsonl":
+        return pd.read_json(file_name, lines=True, dtype=dtype)[list(columns)]
+
+    return pd.read_csv(file_name, dtype=dtype, keep_default_na=False)
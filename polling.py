@@ -0,0 +1,83 @@
+#
+# Adaptive polling of the status of the transcription jobs
+#
+import random
+
+from config import (
+    POLL_MIN_INTERVAL,
+    POLL_MAX_INTERVAL,
+    POLL_BACKOFF_FACTOR,
+    POLL_JITTER,
+    POLL_ETA_FRACTION,
+    POLL_ETA_INTERVAL,
+    JOB_OVERHEAD,
+    JOB_TIME_RATIO,
+)
+
+
+def estimate_job_duration(audio_duration):
+    """
+    expected duration (sec.) of a job, given the total audio duration (sec.)
+    """
+    return JOB_OVERHEAD + audio_duration * JOB_TIME_RATIO
+
+
+class PollingSchedule:
+    """
+    gives the interval before the next poll
+
+    without eta: first polls are fast, then the interval grows
+    exponentially up to max_interval, with a random jitter
+
+    if eta (expected duration of the job) is known: one early poll, for the
+    jobs failing at once, then no polls until eta_fraction * eta; from there
+    the job can end at any moment, we poll every eta_interval
+    """
+
+    def __init__(
+        self,
+        min_interval=POLL_MIN_INTERVAL,
+        max_interval=POLL_MAX_INTERVAL,
+        factor=POLL_BACKOFF_FACTOR,
+        jitter=POLL_JITTER,
+        eta=None,
+        eta_fraction=POLL_ETA_FRACTION,
+        eta_interval=POLL_ETA_INTERVAL,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.jitter = jitter
+        self.eta_interval = eta_interval
+
+        # when the job can end
+        self.window_start = eta * eta_fraction if eta is not None else None
+
+        self.n_polls = 0
+        self.in_window = False
+
+    def next_interval(self, elapsed):
+        """
+        elapsed: sec. since the job was started
+        """
+        if self.window_start is not None and not self.in_window:
+            # the job is not expected to end: wake up when the window starts
+            interval = max(self.window_start - elapsed, 0)
+
+            if self.n_polls == 0 and interval > self.min_interval:
+                interval = self.min_interval
+            else:
+                self.in_window = True
+        else:
+            if self.window_start is not None:
+                interval = self.eta_interval
+            else:
+                interval = min(
+                    self.min_interval * self.factor**self.n_polls, self.max_interval
+                )
+
+            interval *= 1 + random.uniform(-self.jitter, self.jitter)
+
+        self.n_polls += 1
+
+        return interval
@@ -0,0 +1,301 @@
+#
+# Preprocessing of audio files before upload:
+# downmix to mono, resample to SAMPLE_RATE, save as FLAC
+# files are processed in blocks, memory used doesn't depend on file length
+#
+import os
+from os import path
+from os.path import basename, splitext
+import shutil
+import json
+
+import numpy as np
+import soundfile as sf
+
+from utils import probe_audio, get_pool_executor
+from transcription_store import original_json_name
+
+from config import (
+    SAMPLE_RATE,
+    PREPROCESS_BLOCK_SIZE,
+    PREPROCESS_WORKERS,
+)
+
+
+class StreamingResampler:
+    """
+    resamples a signal given block by block
+    windowed sinc interpolation (Kaiser window), with low pass when downsampling
+
+    keeps between blocks only the samples needed for the next outputs
+    """
+
+    def __init__(self, in_rate, out_rate, half_width=16, beta=8.0):
+        # sample rates are integers, positions are computed exactly
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        # cutoff, relative to the input Nyquist frequency
+        self.cutoff = min(1.0, out_rate / in_rate)
+        # half length of the filter, in input samples
+        self.width = int(np.ceil(half_width / self.cutoff))
+        self.beta = beta
+
+        # history, starts with zeros before the first sample
+        self.buffer = np.zeros(self.width, dtype=np.float64)
+        # index (in the input signal) of buffer[0]
+        self.buffer_start = -self.width
+        # number of output samples produced
+        self.n_out = 0
+        # number of input samples received
+        self.n_in = 0
+
+    def _weights(self, dist):
+        window = np.zeros_like(dist)
+        inside = np.abs(dist) < self.width
+        window[inside] = np.i0(
+            self.beta * np.sqrt(1 - (dist[inside] / self.width) ** 2)
+        ) / np.i0(self.beta)
+
+        return self.cutoff * np.sinc(self.cutoff * dist) * window
+
+    def process(self, block, final=False):
+        """
+        block: 1d array of input samples
+        final: True for the last block
+        return the output samples that can be computed
+        """
+        self.buffer = np.concatenate([self.buffer, block])
+        self.n_in += len(block)
+
+        if final:
+            # zeros after the last sample, then compute up to the end
+            self.buffer = np.concatenate([self.buffer, np.zeros(self.width)])
+            limit = self.n_in
+        else:
+            # every output needs width samples on the right
+            limit = self.n_in - self.width
+
+        # output k is at position k * in_rate / out_rate of the input
+        # we compute the outputs with position < limit
+        n_last = max(-(-limit * self.out_rate // self.in_rate), self.n_out)
+        k = np.arange(self.n_out, n_last, dtype=np.int64)
+
+        if len(k) == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        t = k * (self.in_rate / self.out_rate)
+
+        # for every output, the input samples around it
+        base = k * self.in_rate // self.out_rate
+        idx = base[:, None] + np.arange(-self.width + 1, self.width + 1)[None, :]
+        weights = self._weights(t[:, None] - idx)
+
+        out = np.sum(self.buffer[idx - self.buffer_start] * weights, axis=1)
+
+        # drop the samples not needed anymore
+        self.n_out = n_last
+        keep_from = self.n_out * self.in_rate // self.out_rate - self.width + 1
+        if keep_from > self.buffer_start:
+            self.buffer = self.buffer[keep_from - self.buffer_start :]
+            self.buffer_start = keep_from
+
+        return out.astype(np.float32)
+
+
+def needs_conversion(f_name, sample_rate=SAMPLE_RATE):
+    info = probe_audio(f_name)
+
+    return info["sample_rate"] != sample_rate or info["channels"] != 1
+
+
+def convert_audio(src, dst, sample_rate=SAMPLE_RATE, block_size=PREPROCESS_BLOCK_SIZE):
+    """
+    convert src to a mono FLAC file dst, with the given sample rate
+    dst can be the same file as src
+    """
+    info = probe_audio(src)
+
+    if info["sample_rate"] != sample_rate:
+        resampler = StreamingResampler(info["sample_rate"], sample_rate)
+    else:
+        resampler = None
+
+    # write to a tmp file, then rename
+    tmp_dst = dst + ".tmp"
+
+    with sf.SoundFile(
+        tmp_dst, "w", samplerate=sample_rate, channels=1, format="FLAC"
+    ) as f_out:
+        for block in sf.blocks(
+            src, blocksize=block_size, dtype="float32", always_2d=True
+        ):
+            # downmix to mono
+            mono = block.mean(axis=1)
+
+            if resampler is not None:
+                mono = resampler.process(mono)
+
+            f_out.write(np.clip(mono, -1.0, 1.0))
+
+        if resampler is not None:
+            f_out.write(np.clip(resampler.process(np.zeros(0), final=True), -1, 1))
+
+    os.replace(tmp_dst, dst)
+
+    return dst
+
+
+def plan_names(list_files, dst_dir, sample_rate=SAMPLE_RATE):
+    """
+    the name of every file after preprocessing, before any file is written
+    the files ok keep their name, the converted ones become FLAC (x.wav -> x.flac);
+    if that name is taken (ex: a.wav and a.flac, or a file already in dst_dir)
+    the whole name is kept (a.wav -> a.wav.flac)
+
+    return a dict src -> (dst name, convert), dst name None if not readable
+    """
+    plan = {}
+    to_rename = []
+
+    for src in list_files:
+        try:
+            convert = needs_conversion(src, sample_rate)
+        except Exception as e:
+            print(f"Error preprocessing {src}: {e}")
+            plan[src] = (None, False)
+            continue
+
+        flac_name = splitext(basename(src))[0] + ".flac"
+        # converted in place (a flac), or copied: same name
+        if not convert or flac_name == basename(src):
+            plan[src] = (basename(src), convert)
+        else:
+            to_rename.append(src)
+
+    taken = {dst_name for dst_name, _ in plan.values()}
+    sources = {path.abspath(src) for src in list_files}
+    if path.isdir(dst_dir):
+        # the files already there, not replaced by this batch
+        taken |= {
+            f_name
+            for f_name in os.listdir(dst_dir)
+            if path.abspath(path.join(dst_dir, f_name)) not in sources
+        }
+
+    for src in to_rename:
+        dst_name = splitext(basename(src))[0] + ".flac"
+        if dst_name in taken:
+            dst_name = basename(src) + ".flac"
+            print(f"{basename(src)}: name taken, converted to {dst_name}")
+
+        if dst_name in taken:
+            print(f"Error preprocessing {src}: {dst_name} already exists")
+            plan[src] = (None, False)
+            continue
+
+        taken.add(dst_name)
+        plan[src] = (dst_name, True)
+
+    return plan
+
+
+def preprocess_file(src, dst, convert, sample_rate=SAMPLE_RATE):
+    """
+    files ok are copied, the others converted to FLAC
+    return (src, dst, converted), dst is None if there was an error
+    """
+    try:
+        if convert:
+            convert_audio(src, dst, sample_rate)
+
+            return src, dst, True
+
+        if path.abspath(dst) != path.abspath(src):
+            # copy2 keeps mtime, used to avoid recomputing hashes
+            shutil.copy2(src, dst)
+
+        return src, dst, False
+    except Exception as e:
+        print(f"Error preprocessing {src}: {e}")
+
+        return src, None, False
+
+
+def preprocess_files(
+    list_files,
+    dst_dir,
+    sample_rate=SAMPLE_RATE,
+    max_workers=PREPROCESS_WORKERS,
+    map_file=None,
+):
+    """
+    preprocess the files, in parallel (processes, threads in the UI)
+    map_file: if provided, the names changed (see name_map) are saved there
+    return the list of (src, dst, converted)
+    """
+    os.makedirs(dst_dir, exist_ok=True)
+
+    print()
+    print(f"*** Preprocessing {len(list_files)} audio files ***")
+
+    plan = plan_names(list_files, dst_dir, sample_rate)
+
+    to_do = [src for src in list_files if plan[src][0] is not None]
+
+    with get_pool_executor(max_workers) as executor:
+        done = executor.map(
+            preprocess_file,
+            to_do,
+            [path.join(dst_dir, plan[src][0]) for src in to_do],
+            [plan[src][1] for src in to_do],
+            [sample_rate] * len(to_do),
+        )
+        done = {src: result for src, result in zip(to_do, done)}
+
+    # in the order of list_files
+    results = [done.get(src, (src, None, False)) for src in list_files]
+
+    n_converted = sum(1 for _, _, converted in results if converted)
+    n_errors = sum(1 for _, dst, _ in results if dst is None)
+
+    print(f"Converted {n_converted} files to mono, {sample_rate} Hz, FLAC.")
+    if n_errors:
+        print(f"Failed to preprocess {n_errors} files.")
+    print()
+
+    if map_file is not None:
+        with open(map_file, "w") as f:
+            json.dump(name_map(results), f, indent=2)
+
+    return results
+
+
+def name_map(results):
+    """
+    new name -> original name, only for the files renamed
+    """
+    return {
+        basename(dst): basename(src)
+        for src, dst, _ in results
+        if dst is not None and basename(dst) != basename(src)
+    }
+
+
+def restore_names(local_json_dir, input_bucket, names, on_rename=None):
+    """
+    rename the json of the files converted, to the original file names
+    (file_name in the results and the csv as without preprocessing)
+    on_rename: if provided, called with the new name, before every rename
+    """
+    for json_name in sorted(os.listdir(local_json_dir)):
+        new_name = original_json_name(json_name, input_bucket, names)
+
+        if new_name != json_name:
+            # first: after a crash the old json is renamed again
+            if on_rename is not None:
+                on_rename(new_name)
+
+            os.replace(
+                path.join(local_json_dir, json_name),
+                path.join(local_json_dir, new_name),
+            )
@@ -0,0 +1,131 @@
+#
+# Get the transcriptions of a job file by file,
+# as soon as each output lands in the output bucket
+#
+import json
+from os import path
+from os.path import basename
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import list_json_in_oss, read_json_from_oss, retry_with_backoff
+from polling import PollingSchedule
+from tracing import tracer
+
+from config import JSON_EXT, DOWNLOAD_WORKERS, STREAM_MAX_INTERVAL
+
+# states in which the job is still running
+RUNNING_STATES = ["ACCEPTED", "IN_PROGRESS"]
+
+
+class JobResultStream:
+    """
+    watches the output prefix of a job and returns the new json files
+
+    iterate on it to get (file_name, dict) until the job ends,
+    or call fetch_new() to check only once
+    if local_json_dir is provided, the json are also saved there
+    skip_names: if provided, these files are not read (ex: already local)
+    """
+
+    def __init__(
+        self,
+        speech_client,
+        fs,
+        job_id,
+        json_ext=JSON_EXT,
+        local_json_dir=None,
+        progress_callback=None,
+        max_workers=DOWNLOAD_WORKERS,
+        skip_names=None,
+    ):
+        self.speech_client = speech_client
+        self.fs = fs
+        self.job_id = job_id
+        self.json_ext = json_ext
+        self.local_json_dir = local_json_dir
+        self.progress_callback = progress_callback
+        self.max_workers = max_workers
+
+        self.status = "ACCEPTED"
+        self.output_bucket = None
+        self.output_prefix = None
+        self.seen = set()
+        self.skip_names = set(skip_names or [])
+
+    def refresh_status(self):
+        current_job = self.speech_client.get_job(self.job_id)
+
+        self.status = current_job.data.lifecycle_state
+        self.output_bucket = current_job.data.output_location.bucket_name
+        self.output_prefix = current_job.data.output_location.prefix
+
+        if self.progress_callback is not None:
+            self.progress_callback(self.status, current_job.data.percent_complete or 0)
+
+        return self.status
+
+    def read_json(self, f_name):
+        if self.local_json_dir is None:
+            return read_json_from_oss(self.fs, f_name)
+
+        local_path = path.join(self.local_json_dir, basename(f_name))
+        self.fs.get(f_name, local_path)
+
+        with open(local_path) as f:
+            return json.load(f)
+
+    def fetch_new(self):
+        """
+        return the list of (file_name, dict) for the json not seen before
+        """
+        if self.output_prefix is None:
+            self.refresh_status()
+
+        # otherwise the listing could come from the fs cache
+        self.fs.invalidate_cache()
+
+        list_json = list_json_in_oss(
+            self.fs, self.json_ext, self.output_prefix, self.output_bucket
+        )
+        new_json = [
+            f_name
+            for f_name in list_json
+            if f_name not in self.seen and basename(f_name) not in self.skip_names
+        ]
+
+        results = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(tracer.wrap(retry_with_backoff), self.read_json, f_name)
+                for f_name in new_json
+            ]
+
+            for f_name, future in zip(new_json, futures):
+                try:
+                    results.append((basename(f_name), future.result()))
+                    self.seen.add(f_name)
+                except Exception as e:
+                    print(f"Error reading {basename(f_name)}: {e}")
+
+        return results
+
+    def __iter__(self):
+        schedule = PollingSchedule(max_interval=STREAM_MAX_INTERVAL)
+
+        t_start = time.time()
+        while True:
+            # status first: if the job has ended, this is the last listing
+            status = self.refresh_status()
+
+            for result in self.fetch_new():
+                yield result
+
+            if status not in RUNNING_STATES:
+                break
+
+            time.sleep(schedule.next_interval(time.time() - t_start))
+
+        print()
+        print(f"JOB final status is: {self.status}")
+        print()
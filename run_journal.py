@@ -0,0 +1,164 @@
+#
+# Journal of a batch run, to resume it after a crash
+# append only: one json event for every line, written as soon as
+# a phase (or a file) is done; the state is rebuilt reading the events
+#
+import os
+from os import path
+import glob
+import json
+import time
+
+# the params that must be the same to resume a run
+RESUME_PARAMS = [
+    "job_prefix",
+    "input_bucket",
+    "output_bucket",
+    "language_code",
+    "preprocess",
+    "vad",
+    # with different shards the jobs re-attached would not match
+    "num_shards",
+    "shard_by",
+]
+
+
+class RunJournal:
+    """
+    phases recorded: start (params), prepared (audio dir), uploaded (file names),
+    shards, submitted and done (for every job), downloaded (for every json),
+    completed
+
+    resume: if True the events already in journal_file are loaded,
+    otherwise a new journal is started
+    """
+
+    def __init__(self, journal_file, resume=False):
+        self.journal_file = journal_file
+
+        self.params = None
+        self.audio_dir = None
+        self.uploaded = None
+        self.shards = None
+        # shard index -> dict with job_id, output_prefix, status
+        self.jobs = {}
+        self.downloaded = set()
+        self.completed = False
+
+        if resume and path.exists(journal_file):
+            self.load()
+            self.f = open(journal_file, "a")
+        else:
+            self.f = open(journal_file, "w")
+
+    def load(self):
+        with open(self.journal_file) as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # last line partially written, before a crash
+                    continue
+
+                self.apply(event)
+
+    def apply(self, event):
+        # update the state with an event (when written and when loaded)
+        name = event["event"]
+
+        if name == "start":
+            self.params = event["params"]
+        elif name == "prepared":
+            self.audio_dir = event["audio_dir"]
+        elif name == "uploaded":
+            self.uploaded = event["file_names"]
+        elif name == "shards":
+            self.shards = event["shards"]
+        elif name == "submitted":
+            self.jobs[event["shard"]] = {
+                "job_id": event["job_id"],
+                "output_prefix": event["output_prefix"],
+                "status": None,
+                # for the timeout, also after a restart
+                "time_submitted": event["time"],
+            }
+        elif name == "done":
+            self.jobs[event["shard"]]["status"] = event["status"]
+        elif name == "downloaded":
+            self.downloaded.add(event["file_name"])
+        elif name == "completed":
+            self.completed = True
+
+    def record(self, name, sync=True, **data):
+        """
+        append the event, flushed at once: the journal must survive a crash
+        sync: if True also written to disk (fsync), not done for every file
+        """
+        event = {"event": name, "time": time.time(), **data}
+
+        self.f.write(json.dumps(event) + "\n")
+        self.f.flush()
+        if sync:
+            os.fsync(self.f.fileno())
+
+        self.apply(event)
+
+    def close(self):
+        self.f.close()
+
+    #
+    # phases
+    #
+    def start(self, params):
+        self.record("start", params=params)
+
+    def check_params(self, params):
+        """
+        return the list of params different from the journal (empty if ok)
+        """
+        return [
+            name
+            for name in RESUME_PARAMS
+            if self.params is not None and self.params.get(name) != params.get(name)
+        ]
+
+    def set_prepared(self, audio_dir):
+        self.record("prepared", audio_dir=audio_dir)
+
+    def set_uploaded(self, file_names):
+        self.record("uploaded", file_names=list(file_names))
+
+    def set_shards(self, shards):
+        self.record("shards", shards=shards)
+
+    def job_submitted(self, shard, job_id, output_prefix):
+        self.record(
+            "submitted", shard=shard, job_id=job_id, output_prefix=output_prefix
+        )
+
+    def job_done(self, shard, status):
+        self.record("done", shard=shard, status=status)
+
+    def file_downloaded(self, file_name):
+        self.record("downloaded", sync=False, file_name=file_name)
+
+    def file_merged(self, file_name):
+        # synced: the json it replaces are removed right after
+        self.record("downloaded", file_name=file_name)
+
+    def complete(self):
+        self.record("completed")
+
+    def remove_partial_downloads(self, local_json_dir, json_ext):
+        """
+        remove the json not recorded as downloaded (ex: interrupted by a crash)
+        return the number of files removed
+        """
+        n_removed = 0
+
+        for f_name in glob.glob(path.join(local_json_dir, f"*.{json_ext}")):
+            if path.basename(f_name) not in self.downloaded:
+                os.remove(f_name)
+                n_removed += 1
+
+        return n_removed
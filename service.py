@@ -0,0 +1,103 @@
+#
+# Transcription service: runs the workers until stopped (Ctrl-C)
+# the requests are added to the queue with enqueue.py
+# with the env variable OCI_SPEECH_MOCK=1 runs offline, against the mocks
+#
+import argparse
+import time
+
+from speech_client import SpeechClient
+from job_registry import JobRegistry
+from work_queue import WorkQueue
+from transcription_service import TranscriptionService
+from utils import get_ocifs
+
+from config import (
+    SERVICE_DB,
+    SERVICE_INPUT_BUCKET,
+    SERVICE_OUTPUT_BUCKET,
+    SERVICE_RESULTS_DIR,
+    SERVICE_WORKERS,
+)
+
+
+def parser_add_args(parser):
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=SERVICE_WORKERS,
+        help="Number of workers (max jobs in flight)",
+    )
+    parser.add_argument(
+        "--input_bucket",
+        type=str,
+        default=SERVICE_INPUT_BUCKET,
+        help="Input bucket, shared by all the requests",
+    )
+    parser.add_argument(
+        "--output_bucket",
+        type=str,
+        default=SERVICE_OUTPUT_BUCKET,
+        help="Output bucket, shared by all the requests",
+    )
+    parser.add_argument(
+        "--results_dir",
+        type=str,
+        default=SERVICE_RESULTS_DIR,
+        help="Local dir for the json, one sub dir for every tenant and request",
+    )
+    parser.add_argument(
+        "--db",
+        type=str,
+        default=SERVICE_DB,
+        help="The work queue",
+    )
+    parser.add_argument(
+        "--stats_interval",
+        type=float,
+        default=30,
+        help="Print the number of requests in every state every N sec.",
+    )
+
+    return parser
+
+
+def print_stats(queue):
+    stats = queue.stats()
+
+    print(
+        "Requests: "
+        + ", ".join(f"{status}: {n}" for status, n in sorted(stats.items()))
+    )
+
+
+#
+# Main
+#
+parser = argparse.ArgumentParser()
+parser = parser_add_args(parser)
+args = parser.parse_args()
+
+queue = WorkQueue(args.db)
+speech_client = SpeechClient(job_registry=JobRegistry())
+
+service = TranscriptionService(
+    queue,
+    speech_client,
+    get_ocifs(),
+    input_bucket=args.input_bucket,
+    output_bucket=args.output_bucket,
+    results_dir=args.results_dir,
+    n_workers=args.workers,
+)
+service.start()
+
+try:
+    while True:
+        print_stats(queue)
+        time.sleep(args.stats_interval)
+except KeyboardInterrupt:
+    print()
+    print("Stopping, the jobs running are re-attached at the next start...")
+    service.stop()
+    print_stats(queue)
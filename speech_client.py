@@ -2,21 +2,24 @@
 # class to simplify OCI Speech API
 #
 import time
-import oci
-
-from oci.ai_speech.models import (
-    TranscriptionModelDetails,
-    ObjectLocation,
-    ObjectListInlineInputLocation,
-    OutputLocation,
-    CreateTranscriptionJobDetails,
-)
+import json
+from os import path
+
+# oci is imported only when a request is created
+# (slow to import, not needed with the mocks)
+
+from polling import PollingSchedule, estimate_job_duration
+from tracing import tracer
+from client_registry import registry
+from utils import retry_with_backoff, is_transient_error
 
 from config import (
     DEBUG,
-    SLEEP_TIME,
+    JOB_TIMEOUT,
     COMPARTMENT_ID,
     NAMESPACE,
+    MODEL_DOMAIN,
+    JSON_EXT,
     SAMPLE_RATE,
     AUDIO_FORMAT_SUPPORTED,
 )
@@ -24,10 +27,21 @@ from config import (
 
 class SpeechClient:
     ai_client = None
+    cache = None
+    job_registry = None
 
-    def __init__(self):
-        # we assume api key here... TODO: generalize to RP
-        self.ai_client = oci.ai_speech.AIServiceSpeechClient(oci.config.from_file())
+    def __init__(self, cache=None, ai_client=None, job_registry=None):
+        if ai_client is not None:
+            # for example a mock client, for tests
+            self.ai_client = ai_client
+        else:
+            # shared by all the SpeechClient (or the mock, see client_registry)
+            self.ai_client = registry.get_speech_client()
+
+        # optional TranscriptionCache
+        self.cache = cache
+        # optional JobRegistry, every job created is recorded
+        self.job_registry = job_registry
 
     def create_transcription_job_details(
         self,
@@ -38,9 +52,17 @@ class SpeechClient:
         display_name,
         language_code,
     ):
+        from oci.ai_speech.models import (
+            TranscriptionModelDetails,
+            ObjectLocation,
+            ObjectListInlineInputLocation,
+            OutputLocation,
+            CreateTranscriptionJobDetails,
+        )
+
         # prepare the request
         MODE_DETAILS = TranscriptionModelDetails(
-            domain="GENERIC", language_code=language_code
+            domain=MODEL_DOMAIN, language_code=language_code
         )
         OBJECT_LOCATION = ObjectLocation(
             namespace_name=NAMESPACE,
@@ -66,29 +88,150 @@ class SpeechClient:
 
         return transcription_job_details
 
-    def create_transcription_job(self, transcription_job_details):
-        transcription_job = self.ai_client.create_transcription_job(
-            create_transcription_job_details=transcription_job_details
+    def get_cached_transcriptions(self, local_dir, file_names, language_code):
+        """
+        look up the audio files in the cache
+        return a dict file_name -> json for the hits
+        and the list of file names to send to the service
+        """
+        hits = {}
+        misses = []
+
+        for f_name in file_names:
+            d_json = None
+
+            if self.cache is not None:
+                audio_hash = self.cache.audio_hash(path.join(local_dir, f_name))
+                d_json = self.cache.get(audio_hash, language_code, MODEL_DOMAIN)
+
+            if d_json is not None:
+                hits[f_name] = d_json
+            else:
+                misses.append(f_name)
+
+        print(
+            f"Transcriptions found in cache: {len(hits)}, to transcribe: {len(misses)}"
         )
 
+        return hits, misses
+
+    def cache_transcriptions(
+        self, local_dir, json_dir, input_bucket, file_names, language_code
+    ):
+        """
+        add to the cache the json produced by a job
+        for the audio files in file_names
+        """
+        if self.cache is None:
+            return
+
+        for f_name in file_names:
+            # the name given by OCI Speech to the output
+            json_name = f"{NAMESPACE}_{input_bucket}_{f_name}.{JSON_EXT}"
+            json_path = path.join(json_dir, json_name)
+
+            if not path.exists(json_path):
+                continue
+
+            with open(json_path) as f:
+                d_json = json.load(f)
+
+            audio_hash = self.cache.audio_hash(path.join(local_dir, f_name))
+            self.cache.put(audio_hash, language_code, MODEL_DOMAIN, d_json)
+
+        self.cache.evict()
+
+    def create_transcription_job(self, transcription_job_details):
+        with tracer.span("create_transcription_job") as span:
+            transcription_job = self.ai_client.create_transcription_job(
+                create_transcription_job_details=transcription_job_details
+            )
+            tracer.count("api_calls_total", service="speech", operation="create_job")
+            span.set(job_id=transcription_job.data.id)
+
+        if self.job_registry is not None:
+            self.job_registry.add(transcription_job.data, transcription_job_details)
+
         return transcription_job
 
-    def wait_for_job_completion(self, job_id):
+    def get_job(self, job_id):
+        """
+        the current state of the job (also saved in the registry)
+        transient errors are retried, as the SDK does: a failed poll
+        doesn't stop the wait for the job
+        """
+
+        def get_transcription_job(job_id):
+            tracer.count("api_calls_total", service="speech", operation="get_job")
+            return self.ai_client.get_transcription_job(job_id)
+
+        current_job = retry_with_backoff(
+            get_transcription_job, job_id, retryable=is_transient_error
+        )
+
+        if self.job_registry is not None:
+            self.job_registry.update([current_job.data])
+
+        return current_job
+
+    def cancel_job(self, job_id):
+        try:
+            self.ai_client.cancel_transcription_job(job_id)
+            tracer.count("api_calls_total", service="speech", operation="cancel_job")
+            print(f"JOB {job_id} canceled.")
+        except Exception as e:
+            print(f"Error canceling JOB {job_id}: {e}")
+
+    @tracer.traced()
+    def wait_for_job_completion(
+        self, job_id, audio_duration=None, timeout=JOB_TIMEOUT, cancel_event=None
+    ):
         """
         wait for the transcription job to complete
         and return the final status
+
+        polls are fast at the beginning, then less frequent (see PollingSchedule)
+        audio_duration: total duration (sec.) of the audio, to estimate the ETA
+        timeout: after timeout sec. the job is canceled
+        cancel_event: a threading.Event, if set the job is canceled
         """
         status = "ACCEPTED"
 
+        if audio_duration is not None:
+            eta = estimate_job_duration(audio_duration)
+            print(f"Expected job duration: {round(eta)} s.")
+        else:
+            eta = None
+        schedule = PollingSchedule(eta=eta)
+
         # here we start a loop until the job completes
-        i = 1
+        t_start = time.time()
         while status in ["ACCEPTED", "IN_PROGRESS"]:
-            print(f"Waiting for job to complete, elapsed: {i*SLEEP_TIME} s....")
-            time.sleep(SLEEP_TIME)
+            elapsed = time.time() - t_start
+
+            if elapsed >= timeout:
+                print(f"Timeout after {round(elapsed)} s.")
+                self.cancel_job(job_id)
+                status = "CANCELED"
+                break
+
+            interval = min(schedule.next_interval(elapsed), timeout - elapsed)
 
-            current_job = self.ai_client.get_transcription_job(job_id)
+            if cancel_event is not None:
+                # returns True if the event is set while waiting
+                if cancel_event.wait(interval):
+                    self.cancel_job(job_id)
+                    status = "CANCELED"
+                    break
+            else:
+                time.sleep(interval)
+
+            current_job = self.get_job(job_id)
             status = current_job.data.lifecycle_state
-            i += 1
+
+            print(
+                f"Waiting for job to complete, elapsed: {round(time.time() - t_start)} s...."
+            )
 
         # final status
         print()
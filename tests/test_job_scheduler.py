@@ -0,0 +1,116 @@
+#
+# Tests of the job scheduler: shards, failed jobs on resume, timeout
+#
+import pytest
+
+from job_scheduler import JobScheduler, shard_files
+from mock_oci import MockAIServiceSpeechClient, MockFileSystem
+from run_journal import RunJournal
+from speech_client import SpeechClient
+
+# the mock jobs are short, poll often
+POLL_ARGS = {"min_interval": 0.05, "max_interval": 0.05, "jitter": 0}
+
+FILE_NAMES = ["a.wav", "b.wav", "c.wav", "d.wav", "e.wav"]
+
+
+@pytest.fixture
+def ai_client(tmp_path):
+    fs = MockFileSystem(str(tmp_path / "oss"))
+    return MockAIServiceSpeechClient(fs, job_duration=0.1)
+
+
+def run(scheduler, shards):
+    return scheduler.run(
+        "speech_input", "speech_output", shards, "test", "test", "en-GB"
+    )
+
+
+def test_shard_files():
+    shards = shard_files(FILE_NAMES, n_shards=2)
+    assert shards == [["a.wav", "c.wav", "e.wav"], ["b.wav", "d.wav"]]
+
+    assert len(shard_files(FILE_NAMES, max_files=2)) == 3
+    # never empty shards
+    assert len(shard_files(FILE_NAMES, n_shards=10)) == len(FILE_NAMES)
+
+    durations = {"a.wav": 10, "b.wav": 1, "c.wav": 1, "d.wav": 1, "e.wav": 6}
+    shards = shard_files(FILE_NAMES, n_shards=2, durations=durations)
+    assert sorted(shards) == [["a.wav"], ["b.wav", "c.wav", "d.wav", "e.wav"]]
+
+
+def test_all_succeeded(ai_client):
+    scheduler = JobScheduler(
+        SpeechClient(ai_client=ai_client), max_in_flight=2, **POLL_ARGS
+    )
+
+    results = run(scheduler, shard_files(FILE_NAMES, n_shards=3))
+
+    assert [shard["status"] for shard in results] == ["SUCCEEDED"] * 3
+    assert scheduler.all_succeeded()
+    assert scheduler.failed_shards() == []
+    assert ai_client.n_jobs == 3
+
+
+def test_failed_shards_resubmitted_on_resume(tmp_path, ai_client):
+    journal_file = str(tmp_path / "journal.jsonl")
+    shards = shard_files(FILE_NAMES, n_shards=2)
+
+    ai_client.job_failure_rate = 1.0
+    journal = RunJournal(journal_file)
+    scheduler = JobScheduler(
+        SpeechClient(ai_client=ai_client), journal=journal, **POLL_ARGS
+    )
+    run(scheduler, shards)
+    journal.close()
+
+    assert scheduler.failed_shards() == [0, 1]
+    assert not scheduler.all_succeeded()
+
+    ai_client.job_failure_rate = 0.0
+    journal = RunJournal(journal_file, resume=True)
+    scheduler = JobScheduler(
+        SpeechClient(ai_client=ai_client), journal=journal, **POLL_ARGS
+    )
+    run(scheduler, shards)
+    journal.close()
+
+    assert scheduler.all_succeeded()
+    # one new job for every shard failed
+    assert ai_client.n_jobs == 4
+
+
+def test_succeeded_shards_not_resubmitted(tmp_path, ai_client):
+    journal_file = str(tmp_path / "journal.jsonl")
+    shards = shard_files(FILE_NAMES, n_shards=2)
+
+    journal = RunJournal(journal_file)
+    run(
+        JobScheduler(SpeechClient(ai_client=ai_client), journal=journal, **POLL_ARGS),
+        shards,
+    )
+    journal.close()
+
+    journal = RunJournal(journal_file, resume=True)
+    scheduler = JobScheduler(
+        SpeechClient(ai_client=ai_client), journal=journal, **POLL_ARGS
+    )
+    run(scheduler, shards)
+    journal.close()
+
+    assert scheduler.all_succeeded()
+    assert ai_client.n_jobs == 2
+
+
+def test_timeout_cancels_the_job(ai_client):
+    ai_client.job_duration = 10
+    scheduler = JobScheduler(
+        SpeechClient(ai_client=ai_client), timeout=0.3, **POLL_ARGS
+    )
+
+    results = run(scheduler, [FILE_NAMES])
+
+    assert results[0]["status"] == "CANCELED"
+    assert scheduler.failed_shards() == [0]
+    (job,) = ai_client.jobs.values()
+    assert job.lifecycle_state == "CANCELED"
@@ -0,0 +1,87 @@
+#
+# Tests of the output sinks: the same records back from every format
+#
+import json
+
+import pyarrow.parquet as pq
+import pytest
+
+from output_sinks import load_results, open_sink
+
+# (utterance row, token rows), as in transcription_store
+RECORDS = [
+    (("0001.wav", "", 0.0, None), []),
+    (
+        ("b.wav", "hello, world", 0.9, None),
+        [
+            (1, "hello", 0.0, 0.5, 0.95, "WORD"),
+            (1, ",", 0.5, 0.5, 1.0, "PUNCTUATION"),
+            (1, "world", 0.6, 1.0, 0.85, "WORD"),
+        ],
+    ),
+    (("2.wav", '"quoted"\nnew line', 0.5, None), []),
+]
+
+
+@pytest.mark.parametrize("ext", ["csv", "jsonl", "parquet"])
+def test_round_trip(tmp_path, ext):
+    file_name = str(tmp_path / f"result.{ext}")
+
+    # batches smaller than the records: more than one write
+    with open_sink(file_name, batch_size=2) as sink:
+        for record in RECORDS:
+            sink.write(record)
+
+    assert sink.n_written == len(RECORDS)
+
+    df = load_results(file_name)
+
+    assert df["file_name"].tolist() == ["0001.wav", "b.wav", "2.wav"]
+    assert df["txt"].tolist() == ["", "hello, world", '"quoted"\nnew line']
+
+
+@pytest.mark.parametrize("ext", ["csv", "jsonl"])
+def test_numeric_names(tmp_path, ext):
+    # names and texts are never converted to numbers
+    file_name = str(tmp_path / f"result.{ext}")
+
+    with open_sink(file_name) as sink:
+        sink.write((("0001", "42", 1.0, None), []))
+
+    df = load_results(file_name)
+
+    assert df["file_name"].tolist() == ["0001"]
+    assert df["txt"].tolist() == ["42"]
+
+
+def test_tokens(tmp_path):
+    jsonl_name = str(tmp_path / "result.jsonl")
+    parquet_name = str(tmp_path / "result.parquet")
+
+    for file_name in [jsonl_name, parquet_name]:
+        with open_sink(file_name) as sink:
+            for record in RECORDS:
+                sink.write(record)
+
+    with open(jsonl_name) as f:
+        from_jsonl = [json.loads(line)["tokens"] for line in f]
+    from_parquet = pq.read_table(parquet_name).column("tokens").to_pylist()
+
+    assert [len(tokens) for tokens in from_jsonl] == [0, 3, 0]
+    assert from_jsonl[1][0] == {
+        "token": "hello",
+        "start_time": 0.0,
+        "end_time": 0.5,
+        "confidence": 0.95,
+        "type": "WORD",
+    }
+
+    for jsonl_tokens, parquet_tokens in zip(from_jsonl, from_parquet):
+        assert [t["token"] for t in jsonl_tokens] == [
+            t["token"] for t in parquet_tokens
+        ]
+
+
+def test_unsupported_format(tmp_path):
+    with pytest.raises(ValueError):
+        open_sink(str(tmp_path / "result.xlsx"))
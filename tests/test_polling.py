@@ -0,0 +1,68 @@
+#
+# Tests of the adaptive polling schedule
+#
+import pytest
+
+from polling import PollingSchedule, estimate_job_duration
+
+from config import JOB_OVERHEAD, JOB_TIME_RATIO
+
+
+def intervals(schedule, n, elapsed=0.0):
+    # the intervals of n polls, as the wait loops use them
+    result = []
+    for _ in range(n):
+        interval = schedule.next_interval(elapsed)
+        result.append(interval)
+        elapsed += interval
+
+    return result
+
+
+def test_estimate_job_duration():
+    assert estimate_job_duration(0) == JOB_OVERHEAD
+    assert estimate_job_duration(600) == pytest.approx(
+        JOB_OVERHEAD + 600 * JOB_TIME_RATIO
+    )
+
+
+def test_without_eta_grows_up_to_max():
+    schedule = PollingSchedule(min_interval=1, max_interval=5, factor=2, jitter=0)
+
+    assert intervals(schedule, 6) == [1, 2, 4, 5, 5, 5]
+
+
+def test_with_eta_sleeps_until_the_window():
+    schedule = PollingSchedule(
+        min_interval=5, jitter=0, eta=100, eta_fraction=0.7, eta_interval=6
+    )
+
+    # one early poll, then at 0.7 * eta, then every eta_interval
+    assert intervals(schedule, 4) == pytest.approx([5, 65, 6, 6])
+
+
+def test_with_short_eta_no_early_poll():
+    schedule = PollingSchedule(
+        min_interval=5, jitter=0, eta=5, eta_fraction=0.7, eta_interval=2
+    )
+
+    assert intervals(schedule, 3) == pytest.approx([3.5, 2, 2])
+
+
+def test_window_start_rounding():
+    # elapsed can be a little less than the window start (float clocks):
+    # no tiny intervals, the window is entered
+    schedule = PollingSchedule(
+        min_interval=5, jitter=0, eta=100, eta_fraction=0.7, eta_interval=6
+    )
+    schedule.next_interval(0)
+    schedule.next_interval(5)
+
+    assert schedule.next_interval(70 - 1e-12) == 6
+
+
+def test_jitter_bounds():
+    schedule = PollingSchedule(min_interval=10, max_interval=10, jitter=0.1)
+
+    for interval in intervals(schedule, 100):
+        assert 9 <= interval <= 11
@@ -0,0 +1,99 @@
+#
+# Tests of the preprocessing: streaming resampler, conversion, names
+#
+import numpy as np
+import pytest
+import soundfile as sf
+
+from preprocess import StreamingResampler, convert_audio, plan_names
+
+
+def resample(signal, in_rate, out_rate, block_sizes):
+    """
+    resample signal given in blocks of the given sizes (repeated)
+    """
+    resampler = StreamingResampler(in_rate, out_rate)
+    outputs = []
+
+    start = 0
+    i = 0
+    while start < len(signal):
+        size = block_sizes[i % len(block_sizes)]
+        outputs.append(resampler.process(signal[start : start + size]))
+        start += size
+        i += 1
+    outputs.append(resampler.process(np.zeros(0), final=True))
+
+    return np.concatenate(outputs)
+
+
+def sine(freq, rate, n):
+    return np.sin(2 * np.pi * freq * np.arange(n) / rate)
+
+
+@pytest.mark.parametrize("in_rate,out_rate", [(44100, 16000), (8000, 16000)])
+def test_blocks_same_as_one_shot(in_rate, out_rate):
+    signal = np.random.default_rng(0).uniform(-0.5, 0.5, 10000)
+
+    one_shot = resample(signal, in_rate, out_rate, [len(signal)])
+    # blocks shorter than the filter, and empty ones
+    blocks = resample(signal, in_rate, out_rate, [1, 7, 0, 100, 3000])
+
+    np.testing.assert_allclose(blocks, one_shot, atol=1e-6)
+
+
+@pytest.mark.parametrize(
+    "in_rate,out_rate,n",
+    [(44100, 16000, 44100), (48000, 16000, 1001), (8000, 16000, 5)],
+)
+def test_output_length(in_rate, out_rate, n):
+    out = resample(np.zeros(n), in_rate, out_rate, [4096])
+
+    assert len(out) == -(-n * out_rate // in_rate)
+
+
+@pytest.mark.parametrize("in_rate,out_rate", [(44100, 16000), (8000, 16000)])
+def test_sine_preserved(in_rate, out_rate):
+    n = in_rate
+    out = resample(0.5 * sine(440, in_rate, n), in_rate, out_rate, [4096])
+    expected = 0.5 * sine(440, out_rate, len(out))
+
+    # far from the edges (zeros before and after the signal)
+    inner = slice(100, -100)
+    assert np.max(np.abs(out[inner] - expected[inner])) < 1e-3
+
+
+def test_aliasing_removed():
+    # above the Nyquist frequency of the output
+    out = resample(0.5 * sine(10000, 44100, 44100), 44100, 16000, [4096])
+
+    assert np.max(np.abs(out[100:-100])) < 1e-2
+
+
+def test_convert_audio(tmp_path):
+    src = str(tmp_path / "a.wav")
+    signal = 0.5 * sine(440, 44100, 22050)
+    sf.write(src, np.stack([signal, signal], axis=1), 44100)
+
+    dst = convert_audio(src, str(tmp_path / "a.flac"), block_size=1000)
+
+    info = sf.info(dst)
+    assert info.format == "FLAC"
+    assert info.samplerate == 16000
+    assert info.channels == 1
+    assert info.frames == 8000
+
+
+def test_plan_names(tmp_path):
+    for f_name, rate in [("a.wav", 44100), ("a.flac", 16000), ("b.wav", 16000)]:
+        sf.write(str(tmp_path / f_name), np.zeros(100), rate)
+    (tmp_path / "bad.wav").write_bytes(b"not audio")
+
+    list_files = [str(tmp_path / f_name) for f_name in ["a.wav", "a.flac", "b.wav"]]
+    plan = plan_names(list_files + [str(tmp_path / "bad.wav")], str(tmp_path / "out"))
+
+    # a.flac is taken by the file ok
+    assert plan[list_files[0]] == ("a.wav.flac", True)
+    assert plan[list_files[1]] == ("a.flac", False)
+    assert plan[list_files[2]] == ("b.wav", False)
+    assert plan[str(tmp_path / "bad.wav")] == (None, False)
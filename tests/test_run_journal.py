@@ -0,0 +1,112 @@
+#
+# Tests of the run journal: state rebuilt on resume, params mismatch
+#
+from run_journal import RunJournal
+
+PARAMS = {
+    "job_prefix": "test",
+    "input_bucket": "speech_input",
+    "output_bucket": "speech_output",
+    "language_code": "en-GB",
+    "preprocess": None,
+    "vad": None,
+    "num_shards": 2,
+    "shard_by": "count",
+}
+
+
+def write_run(journal_file):
+    journal = RunJournal(journal_file)
+    journal.start(PARAMS)
+    journal.set_prepared("wav")
+    journal.set_uploaded(["a.wav", "b.wav"])
+    journal.set_shards([["a.wav"], ["b.wav"]])
+    journal.job_submitted(0, "job0", "prefix0")
+    journal.job_submitted(1, "job1", "prefix1")
+    journal.job_done(0, "SUCCEEDED")
+    journal.file_downloaded("a.json")
+    journal.close()
+
+
+def test_resume(tmp_path):
+    journal_file = str(tmp_path / "journal.jsonl")
+    write_run(journal_file)
+
+    journal = RunJournal(journal_file, resume=True)
+
+    assert journal.params == PARAMS
+    assert journal.audio_dir == "wav"
+    assert journal.uploaded == ["a.wav", "b.wav"]
+    assert journal.shards == [["a.wav"], ["b.wav"]]
+    assert journal.jobs[0]["status"] == "SUCCEEDED"
+    assert journal.jobs[1]["job_id"] == "job1"
+    assert journal.jobs[1]["status"] is None
+    assert journal.jobs[1]["time_submitted"] > 0
+    assert journal.downloaded == {"a.json"}
+    assert not journal.completed
+
+    # the new events are appended
+    journal.job_done(1, "FAILED")
+    journal.complete()
+    journal.close()
+
+    journal = RunJournal(journal_file, resume=True)
+    assert journal.jobs[1]["status"] == "FAILED"
+    assert journal.completed
+    journal.close()
+
+
+def test_without_resume_starts_again(tmp_path):
+    journal_file = str(tmp_path / "journal.jsonl")
+    write_run(journal_file)
+
+    journal = RunJournal(journal_file)
+
+    assert journal.params is None
+    assert journal.jobs == {}
+    journal.close()
+
+
+def test_partial_last_line(tmp_path):
+    journal_file = str(tmp_path / "journal.jsonl")
+    write_run(journal_file)
+
+    # a crash while writing the last event
+    with open(journal_file, "a") as f:
+        f.write('{"event": "downloaded", "file_na')
+
+    journal = RunJournal(journal_file, resume=True)
+
+    assert journal.downloaded == {"a.json"}
+    journal.close()
+
+
+def test_check_params(tmp_path):
+    journal_file = str(tmp_path / "journal.jsonl")
+    write_run(journal_file)
+
+    journal = RunJournal(journal_file, resume=True)
+
+    assert journal.check_params(dict(PARAMS)) == []
+    assert journal.check_params({**PARAMS, "num_shards": 1}) == ["num_shards"]
+    assert journal.check_params({**PARAMS, "shard_by": "duration", "vad": "yes"}) == [
+        "vad",
+        "shard_by",
+    ]
+    journal.close()
+
+
+def test_remove_partial_downloads(tmp_path):
+    journal_file = str(tmp_path / "journal.jsonl")
+    write_run(journal_file)
+
+    json_dir = tmp_path / "json"
+    json_dir.mkdir()
+    for name in ["a.json", "b.json"]:
+        (json_dir / name).write_text("{}")
+
+    journal = RunJournal(journal_file, resume=True)
+
+    assert journal.remove_partial_downloads(str(json_dir), "json") == 1
+    assert sorted(p.name for p in json_dir.iterdir()) == ["a.json"]
+    journal.close()
@@ -0,0 +1,172 @@
+#
+# Tests of the transcription service, with the mocks: retries without
+# leaking jobs or objects
+#
+import functools
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import transcription_service
+from config import NAMESPACE, SERVICE_INPUT_BUCKET
+from mock_oci import MockAIServiceSpeechClient, MockFileSystem
+from polling import PollingSchedule
+from speech_client import SpeechClient
+from transcription_service import TranscriptionService
+from work_queue import WorkQueue
+
+FILE_NAMES = ["a.wav", "b.wav"]
+
+
+@pytest.fixture
+def audio_dir(tmp_path):
+    audio_dir = tmp_path / "audio"
+    audio_dir.mkdir()
+    for f_name in FILE_NAMES:
+        sf.write(str(audio_dir / f_name), np.zeros(1600), 16000)
+    return str(audio_dir)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.db"), max_attempts=2)
+    yield queue
+    queue.close()
+
+
+@pytest.fixture
+def fs(tmp_path):
+    return MockFileSystem(str(tmp_path / "oss"))
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch, queue, fs):
+    # the mock jobs last 0.1 sec., no need to wait longer between polls
+    monkeypatch.setattr(
+        transcription_service,
+        "PollingSchedule",
+        functools.partial(
+            PollingSchedule,
+            min_interval=0.05,
+            max_interval=0.05,
+            eta_fraction=0,
+            eta_interval=0.05,
+        ),
+    )
+    ai_client = MockAIServiceSpeechClient(fs, job_duration=0.1)
+
+    return TranscriptionService(
+        queue,
+        SpeechClient(ai_client=ai_client),
+        fs,
+        results_dir=str(tmp_path / "results"),
+        n_workers=1,
+    )
+
+
+def input_objects(fs):
+    return fs.glob(f"{SERVICE_INPUT_BUCKET}@{NAMESPACE}/*")
+
+
+def run_next(service):
+    request = service.queue.claim("w")
+    service.run_request(request, "w")
+    return service.queue.get(request["request_id"])
+
+
+def test_success(service, fs, audio_dir):
+    request_id = service.queue.enqueue("t1", audio_dir, FILE_NAMES, "en-GB")
+
+    request = run_next(service)
+
+    assert request["status"] == "SUCCEEDED"
+    assert request["n_results"] == len(FILE_NAMES)
+    assert len(os.listdir(request["result_dir"])) == len(FILE_NAMES)
+    assert request_id in request["result_dir"]
+    # the input objects are deleted
+    assert input_objects(fs) == []
+
+
+def test_poll_failure_reattaches_the_job(service, fs, audio_dir, monkeypatch):
+    service.queue.enqueue("t1", audio_dir, FILE_NAMES, "en-GB")
+    get_job = service.speech_client.get_job
+
+    def failing_get_job(job_id):
+        monkeypatch.setattr(service.speech_client, "get_job", get_job)
+        raise RuntimeError("poll failed")
+
+    monkeypatch.setattr(service.speech_client, "get_job", failing_get_job)
+
+    request = run_next(service)
+    assert request["status"] == "QUEUED"
+    assert request["job_id"] is not None
+    # kept for the job
+    assert len(input_objects(fs)) == len(FILE_NAMES)
+
+    request = run_next(service)
+    assert request["status"] == "SUCCEEDED"
+    # no second job
+    assert service.speech_client.ai_client.n_jobs == 1
+    assert input_objects(fs) == []
+
+
+def test_submit_failure_deletes_the_objects(service, fs, audio_dir, monkeypatch):
+    service.queue.enqueue("t1", audio_dir, FILE_NAMES, "en-GB")
+
+    def failing_create(job_details):
+        raise RuntimeError("submit failed")
+
+    monkeypatch.setattr(
+        service.speech_client, "create_transcription_job", failing_create
+    )
+
+    request = run_next(service)
+    assert request["status"] == "QUEUED"
+    assert request["job_id"] is None
+    assert input_objects(fs) == []
+
+
+def test_partial_upload_is_retried(service, fs, audio_dir):
+    # a file missing: a job with only the other one would succeed
+    service.queue.enqueue("t1", audio_dir, FILE_NAMES + ["missing.wav"], "en-GB")
+
+    request = run_next(service)
+    assert request["status"] == "QUEUED"
+    assert "Uploaded 2/3" in request["error"]
+    assert service.speech_client.ai_client.n_jobs == 0
+    assert input_objects(fs) == []
+
+    request = run_next(service)
+    assert request["status"] == "FAILED"
+
+
+def test_lease_lost_at_submit_cancels_the_job(service, fs, audio_dir, monkeypatch):
+    request_id = service.queue.enqueue("t1", audio_dir, FILE_NAMES, "en-GB")
+    # another worker has taken the request during the upload
+    monkeypatch.setattr(service.queue, "set_job", lambda *args: False)
+
+    run_next(service)
+
+    ai_client = service.speech_client.ai_client
+    assert ai_client.n_jobs == 1
+    (job,) = ai_client.jobs.values()
+    assert job.lifecycle_state == "CANCELED"
+    # left to the new owner
+    assert service.queue.get(request_id)["status"] == "RUNNING"
+
+
+def test_deadline_cancels_the_job(service, fs, audio_dir):
+    service.timeout = 0
+    service.queue.enqueue("t1", audio_dir, FILE_NAMES, "en-GB")
+
+    request = run_next(service)
+    assert request["status"] == "QUEUED"
+    assert "CANCELED" in request["error"]
+    # the job canceled is not re-attached
+    assert request["job_id"] is None
+    assert input_objects(fs) == []
+
+    (job,) = service.speech_client.ai_client.jobs.values()
+    assert job.lifecycle_state == "CANCELED"
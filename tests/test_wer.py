@@ -0,0 +1,85 @@
+#
+# Tests of the WER and CER engine, against a plain Levenshtein distance
+#
+import random
+
+import pytest
+
+from wer import compute_cer, compute_scores, compute_wer, score_utterance, summarize
+
+
+def edit_distance(ref, hyp):
+    # the textbook dynamic programming, one row at a time
+    row = list(range(len(hyp) + 1))
+    for i in range(1, len(ref) + 1):
+        prev, row[0] = row[0], i
+        for j in range(1, len(hyp) + 1):
+            prev, row[j] = row[j], min(
+                row[j] + 1, row[j - 1] + 1, prev + (ref[i - 1] != hyp[j - 1])
+            )
+
+    return row[-1]
+
+
+def test_score_utterance():
+    score = score_utterance("the cat sat on the mat", "the cat sit on mat")
+
+    assert score["substitutions"] == 1
+    assert score["deletions"] == 1
+    assert score["insertions"] == 0
+    assert score["ref_len"] == 6
+    assert score["hits"] == 4
+    assert score["error_rate"] == pytest.approx(2 / 6)
+
+
+def test_empty():
+    assert score_utterance("", "")["error_rate"] == 0
+    assert score_utterance("", "hello")["error_rate"] == 1
+    assert score_utterance("hello world", "")["deletions"] == 2
+
+
+def test_wer_and_cer():
+    assert compute_wer(["a b c"], ["a b c"]) == 0
+    assert compute_wer(["a x c", "d"], ["a b c", "d e"]) == pytest.approx(2 / 5)
+    assert compute_cer(["abd"], ["abc"]) == pytest.approx(1 / 3)
+
+
+def test_random_against_levenshtein():
+    rng = random.Random(42)
+    words = ["a", "b", "c", "d"]
+    references = [
+        " ".join(rng.choices(words, k=rng.randint(0, 12))) for _ in range(200)
+    ]
+    predictions = [
+        " ".join(rng.choices(words, k=rng.randint(0, 12))) for _ in range(200)
+    ]
+
+    scores = compute_scores(predictions, references, max_workers=1)
+
+    for reference, prediction, score in zip(references, predictions, scores):
+        ref, hyp = reference.split(), prediction.split()
+        n_errors = score["substitutions"] + score["deletions"] + score["insertions"]
+
+        assert n_errors == edit_distance(ref, hyp)
+        assert score["hits"] + score["substitutions"] + score["deletions"] == len(ref)
+        assert score["hits"] + score["substitutions"] + score["insertions"] == len(hyp)
+
+
+def test_parallel_same_scores():
+    rng = random.Random(7)
+    words = ["x", "y", "z"]
+    references = [" ".join(rng.choices(words, k=rng.randint(1, 8))) for _ in range(50)]
+    predictions = [" ".join(rng.choices(words, k=rng.randint(1, 8))) for _ in range(50)]
+
+    serial = compute_scores(predictions, references, max_workers=1)
+    parallel = compute_scores(
+        predictions, references, max_workers=2, parallel_min=1, chunk_size=7
+    )
+
+    assert parallel == serial
+    assert summarize(parallel) == summarize(serial)
+
+
+def test_different_lengths():
+    with pytest.raises(ValueError):
+        compute_scores(["a"], ["a", "b"])
@@ -0,0 +1,140 @@
+#
+# Tests of the work queue: backpressure, leases, retries, heartbeat
+#
+import time
+
+import pytest
+
+from transcription_service import LeaseHeartbeat, LeaseLostError
+from work_queue import QueueFullError, WorkQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(
+        str(tmp_path / "queue.db"),
+        max_pending=4,
+        max_pending_per_tenant=3,
+        max_running_per_tenant=1,
+        max_attempts=2,
+        lease=0.5,
+    )
+    yield queue
+    queue.close()
+
+
+def enqueue(queue, tenant="t1"):
+    return queue.enqueue(tenant, "/audio", ["a.wav", "b.wav"], "en-GB")
+
+
+def test_enqueue(queue):
+    request_id = enqueue(queue)
+    request = queue.get(request_id)
+
+    assert request["status"] == "QUEUED"
+    assert request["file_names"] == ["a.wav", "b.wav"]
+    assert request["attempts"] == 0
+
+    with pytest.raises(ValueError):
+        queue.enqueue("bad tenant/..", "/audio", ["a.wav"], "en-GB")
+    with pytest.raises(ValueError):
+        queue.enqueue("t1", "/audio", [], "en-GB")
+
+
+def test_backpressure(queue):
+    for _ in range(3):
+        enqueue(queue, "t1")
+
+    with pytest.raises(QueueFullError):
+        enqueue(queue, "t1")
+
+    enqueue(queue, "t2")
+    with pytest.raises(QueueFullError):
+        enqueue(queue, "t3")
+
+
+def test_claim_oldest_and_tenant_limit(queue):
+    first = enqueue(queue, "t1")
+    enqueue(queue, "t1")
+    other = enqueue(queue, "t2")
+
+    assert queue.claim("w1")["request_id"] == first
+    # t1 has already max_running_per_tenant requests running
+    assert queue.claim("w2")["request_id"] == other
+    assert queue.claim("w3") is None
+
+
+def test_lease_expires(queue):
+    request_id = enqueue(queue)
+    queue.claim("w1")
+
+    assert queue.claim("w2") is None
+    time.sleep(0.6)
+
+    request = queue.claim("w2")
+    assert request["request_id"] == request_id
+    assert request["attempts"] == 2
+
+    # the first worker can't change it anymore
+    assert not queue.renew(request_id, "w1")
+    assert queue.renew(request_id, "w2")
+
+
+def test_fail_keeps_or_clears_the_job(queue):
+    request_id = enqueue(queue)
+    request = queue.claim("w1")
+    queue.set_job(request_id, "w1", "job1", "prefix", ["r_a.wav"], 123.0)
+
+    # a poll failed: the job is re-attached by the next attempt
+    assert queue.fail(request_id, "w1", "poll", request["attempts"], keep_job=True)
+    request = queue.get(request_id)
+    assert request["status"] == "QUEUED"
+    assert request["job_id"] == "job1"
+    assert request["deadline"] == 123.0
+
+    # the last attempt: FAILED, the job is cleared
+    request = queue.claim("w1")
+    assert queue.fail(request_id, "w1", "failed", request["attempts"])
+    request = queue.get(request_id)
+    assert request["status"] == "FAILED"
+    assert request["job_id"] is None
+    assert request["deadline"] is None
+    assert request["error"] == "failed"
+
+
+def test_release_doesnt_count_the_attempt(queue):
+    request_id = enqueue(queue)
+    queue.claim("w1")
+    queue.release(request_id, "w1")
+
+    request = queue.get(request_id)
+    assert request["status"] == "QUEUED"
+    assert request["attempts"] == 0
+
+
+def test_heartbeat_keeps_the_lease(queue):
+    request_id = enqueue(queue)
+    queue.claim("w1")
+
+    with LeaseHeartbeat(queue, request_id, "w1", interval=0.1) as heartbeat:
+        # longer than the lease: without heartbeat it would be taken
+        time.sleep(1.0)
+
+        assert queue.claim("w2") is None
+        heartbeat.check()
+
+
+def test_heartbeat_lost(queue):
+    request_id = enqueue(queue)
+    queue.claim("w1")
+
+    with LeaseHeartbeat(queue, request_id, "w1", interval=0.8) as heartbeat:
+        # the lease expires before the first beat
+        time.sleep(0.6)
+        assert queue.claim("w2")["request_id"] == request_id
+        heartbeat.check()
+
+        time.sleep(0.4)
+
+        with pytest.raises(LeaseLostError):
+            heartbeat.check()
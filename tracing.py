@@ -0,0 +1,294 @@
+#
+# Tracing and metrics: spans, counters, histograms
+# exported as a JSON log (one span per line) and as Prometheus text
+# when disabled, every call returns immediately
+#
+import bisect
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+from itertools import count
+
+from config import TRACING_ENV_VAR, HISTOGRAM_BUCKETS
+
+
+class _NullSpan:
+    # used when tracing is disabled
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    a timed stage or call, nested spans have a parent_id
+    the duration is also observed in the histogram <name>_seconds
+    """
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+        self.span_id = next(tracer.ids)
+        self.parent_id = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.parent_id = self.tracer.current_span_id()
+        self.tracer.stack().append(self)
+
+        self.start = time.time()
+        self.t_start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.t_start
+        self.tracer.stack().pop()
+
+        self.tracer.end_span(
+            {
+                "name": self.name,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "thread": threading.current_thread().name,
+                "start": self.start,
+                "duration": duration,
+                "status": "ok" if exc_type is None else "error",
+                "attrs": self.attrs,
+            }
+        )
+
+        return False
+
+
+class Tracer:
+    """
+    collects spans, counters and histograms, thread safe
+    metrics have labels, passed as keyword arguments
+    """
+
+    def __init__(self, enabled=False, buckets=HISTOGRAM_BUCKETS):
+        self.enabled = enabled
+        self.buckets = sorted(buckets)
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.ids = count(1)
+
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.spans = []
+            # (name, labels) -> value
+            self.counters = defaultdict(float)
+            # (name, labels) -> [count per bucket (+Inf last), sum, count]
+            self.histograms = {}
+
+    def stack(self):
+        # the spans open in this thread
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+
+        return self.local.stack
+
+    def current_span_id(self):
+        """
+        the innermost span open in this thread, or the parent passed
+        to the thread by wrap()
+        """
+        stack = self.stack()
+        if stack:
+            return stack[-1].span_id
+
+        return getattr(self.local, "parent_id", None)
+
+    def wrap(self, func):
+        """
+        for a callable run in another thread (ex: submitted to a pool):
+        its spans get as parent the span open here, when wrap is called
+        """
+        if not self.enabled:
+            return func
+
+        parent_id = self.current_span_id()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # the threads of a pool are reused: restore at the end
+            previous = getattr(self.local, "parent_id", None)
+            self.local.parent_id = parent_id
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.local.parent_id = previous
+
+        return wrapper
+
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return NULL_SPAN
+
+        return Span(self, name, attrs)
+
+    def end_span(self, record):
+        with self.lock:
+            self.spans.append(record)
+
+        self.observe(f"{record['name']}_seconds", record["duration"])
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+
+        key = (name, tuple(sorted(labels.items())))
+        i = bisect.bisect_left(self.buckets, value)
+
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+            histogram = self.histograms[key]
+            histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def traced(self, name=None):
+        """
+        decorator: the function is run inside a span
+        """
+
+        def decorator(func):
+            span_name = name or func.__name__
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+
+                with Span(self, span_name, {}):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def export_json(self, f_name):
+        """
+        one span for every line, then a line with the metrics
+        """
+        with self.lock:
+            spans = list(self.spans)
+
+        with open(f_name, "w") as f:
+            for record in spans:
+                f.write(json.dumps(record) + "\n")
+
+            f.write(json.dumps({"metrics": self.metrics()}) + "\n")
+
+    def metrics(self):
+        """
+        counters and histograms, as a dict
+        """
+        with self.lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "histograms": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "buckets": dict(zip(self.buckets + ["+Inf"], counts)),
+                        "sum": total,
+                        "count": n,
+                    }
+                    for (name, labels), (counts, total, n) in sorted(
+                        self.histograms.items()
+                    )
+                ],
+            }
+
+    def export_prometheus(self, f_name=None):
+        """
+        Prometheus text format, return the text (and save it, if f_name)
+        """
+
+        def escape(value):
+            # label values can be file or job names
+            return (
+                str(value)
+                .replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n")
+            )
+
+        def format_labels(labels, extra=None):
+            items = list(labels) + ([extra] if extra else [])
+            if not items:
+                return ""
+
+            return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in items) + "}"
+
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (c_name, labels), value in sorted(self.counters.items()):
+                    if c_name == name:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (h_name, labels), (counts, total, n) in sorted(
+                    self.histograms.items()
+                ):
+                    if h_name != name:
+                        continue
+
+                    # Prometheus buckets are cumulative
+                    cumulative = 0
+                    for bound, n_bucket in zip(self.buckets + ["+Inf"], counts):
+                        cumulative += n_bucket
+                        le = format_labels(labels, ("le", bound))
+                        lines.append(f"{name}_bucket{le} {cumulative}")
+
+                    lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                    lines.append(f"{name}_count{format_labels(labels)} {n}")
+
+        text = "\n".join(lines) + "\n"
+
+        if f_name is not None:
+            with open(f_name, "w") as f:
+                f.write(text)
+
+        return text
+
+
+# the tracer used by the whole process
+# enabled if the env variable TRACING_ENV_VAR is "1"
+tracer = Tracer(enabled=os.environ.get(TRACING_ENV_VAR) == "1")
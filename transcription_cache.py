@@ -0,0 +1,157 @@
+#
+# Local cache of transcriptions, in SQLite
+# key is (hash of the audio content, language code, model domain)
+#
+import os
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from config import CACHE_DB, CACHE_MAX_MB, CACHE_MAX_AGE_DAYS
+
+
+def compute_sha256(f_name):
+    sha = hashlib.sha256()
+
+    with open(f_name, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+class TranscriptionCache:
+    """
+    maps (audio hash, language code, domain) to the transcription json
+
+    entries older than max_age_days are removed,
+    if the total size is over max_mb the least recently used are removed
+    """
+
+    def __init__(
+        self,
+        db_file=CACHE_DB,
+        max_mb=CACHE_MAX_MB,
+        max_age_days=CACHE_MAX_AGE_DAYS,
+    ):
+        self.db_file = db_file
+        self.max_bytes = max_mb * 2**20
+        self.max_age = max_age_days * 24 * 3600
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+
+        with self.conn:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS transcriptions (
+                    audio_hash TEXT,
+                    language_code TEXT,
+                    domain TEXT,
+                    json TEXT,
+                    size INTEGER,
+                    created REAL,
+                    last_used REAL,
+                    PRIMARY KEY (audio_hash, language_code, domain))""")
+            # to avoid hashing again files not changed
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS file_hashes (
+                    f_name TEXT PRIMARY KEY,
+                    size INTEGER,
+                    mtime REAL,
+                    audio_hash TEXT)""")
+
+    def audio_hash(self, f_name):
+        """
+        hash of the content of the audio file
+        not recomputed if size and mtime have not changed
+        """
+        f_name = os.path.abspath(f_name)
+        stat = os.stat(f_name)
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, mtime, audio_hash FROM file_hashes WHERE f_name = ?",
+                (f_name,),
+            ).fetchone()
+
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return row[2]
+
+        audio_hash = compute_sha256(f_name)
+
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)",
+                (f_name, stat.st_size, stat.st_mtime, audio_hash),
+            )
+
+        return audio_hash
+
+    def get(self, audio_hash, language_code, domain):
+        """
+        return the transcription json (as dict) or None
+        """
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                """SELECT json, created FROM transcriptions
+                WHERE audio_hash = ? AND language_code = ? AND domain = ?""",
+                (audio_hash, language_code, domain),
+            ).fetchone()
+
+            if row is None or time.time() - row[1] > self.max_age:
+                return None
+
+            self.conn.execute(
+                """UPDATE transcriptions SET last_used = ?
+                WHERE audio_hash = ? AND language_code = ? AND domain = ?""",
+                (time.time(), audio_hash, language_code, domain),
+            )
+
+        return json.loads(row[0])
+
+    def put(self, audio_hash, language_code, domain, d_json):
+        txt = json.dumps(d_json)
+        now = time.time()
+
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO transcriptions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (audio_hash, language_code, domain, txt, len(txt), now, now),
+            )
+
+    def evict(self):
+        """
+        remove expired entries, then the least recently used
+        until the total size is under the limit
+        return the number of entries removed
+        """
+        with self.lock, self.conn:
+            n_removed = self.conn.execute(
+                "DELETE FROM transcriptions WHERE created < ?",
+                (time.time() - self.max_age,),
+            ).rowcount
+
+            total_size = self.conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM transcriptions"
+            ).fetchone()[0]
+
+            if total_size > self.max_bytes:
+                rows = self.conn.execute("""SELECT rowid, size FROM transcriptions
+                    ORDER BY last_used ASC""").fetchall()
+
+                to_remove = []
+                for rowid, size in rows:
+                    if total_size <= self.max_bytes:
+                        break
+                    to_remove.append((rowid,))
+                    total_size -= size
+
+                self.conn.executemany(
+                    "DELETE FROM transcriptions WHERE rowid = ?", to_remove
+                )
+                n_removed += len(to_remove)
+
+        return n_removed
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,370 @@
+#
+# Transcription service: a pool of workers around SpeechClient
+# every worker takes a request from the work queue and runs it:
+# upload (with a prefix of the request), submit, poll, download, cleanup
+# the requests of different tenants share the buckets, never the objects
+#
+import os
+from os import path
+import socket
+import threading
+import time
+
+from polling import PollingSchedule, estimate_job_duration
+from utils import (
+    copy_files_to_oss,
+    copy_json_from_oss,
+    delete_objects,
+    delete_prefix,
+    get_total_duration,
+)
+
+from config import (
+    NAMESPACE,
+    JSON_EXT,
+    JOB_TIMEOUT,
+    SERVICE_INPUT_BUCKET,
+    SERVICE_OUTPUT_BUCKET,
+    SERVICE_JOB_PREFIX,
+    SERVICE_RESULTS_DIR,
+    SERVICE_WORKERS,
+    SERVICE_POLL_INTERVAL,
+    SERVICE_HEARTBEAT,
+)
+
+
+class LeaseLostError(Exception):
+    """
+    the request has been taken by another worker (lease expired)
+    """
+
+    def __init__(self, request_id):
+        super().__init__(f"Lease lost for request {request_id}")
+
+
+class JobFailedError(Exception):
+    """
+    the job ended, not SUCCEEDED: the next attempt submits a new job
+    """
+
+    def __init__(self, job_id, status):
+        super().__init__(f"JOB {job_id} {status}")
+
+
+class LeaseHeartbeat:
+    """
+    renews the lease of a request every interval sec., in a thread:
+    also during long uploads and downloads
+    lost is set if the request has been taken by another worker
+    """
+
+    def __init__(self, queue, request_id, worker, interval=SERVICE_HEARTBEAT):
+        self.queue = queue
+        self.request_id = request_id
+        self.worker = worker
+        self.interval = interval
+
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                if not self.queue.renew(self.request_id, self.worker):
+                    self.lost.set()
+                    return
+            except Exception as e:
+                # ex: database locked, retried at the next beat
+                print(f"Error renewing the lease of {self.request_id}: {e}")
+
+    def check(self):
+        if self.lost.is_set():
+            raise LeaseLostError(self.request_id)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+class TranscriptionService:
+    """
+    queue: the WorkQueue, speech_client: the SpeechClient (shared)
+    fs: the OCIFileSystem (or the mock)
+
+    at most n_workers jobs are in flight: new requests wait in the queue
+    """
+
+    def __init__(
+        self,
+        queue,
+        speech_client,
+        fs,
+        input_bucket=SERVICE_INPUT_BUCKET,
+        output_bucket=SERVICE_OUTPUT_BUCKET,
+        results_dir=SERVICE_RESULTS_DIR,
+        n_workers=SERVICE_WORKERS,
+        poll_interval=SERVICE_POLL_INTERVAL,
+        heartbeat=SERVICE_HEARTBEAT,
+        timeout=JOB_TIMEOUT,
+    ):
+        self.queue = queue
+        self.speech_client = speech_client
+        self.fs = fs
+        self.input_bucket = input_bucket
+        self.output_bucket = output_bucket
+        self.results_dir = results_dir
+        self.n_workers = n_workers
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.timeout = timeout
+
+        # set to stop the workers
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self):
+        # a unique name for every worker, also across services
+        service_id = f"{socket.gethostname()}-{os.getpid()}"
+
+        for i in range(self.n_workers):
+            thread = threading.Thread(
+                target=self.worker_loop, args=(f"{service_id}-{i}",), daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+        print(f"Service started with {self.n_workers} workers.")
+
+    def stop(self):
+        """
+        the workers stop at the next poll, the requests running are given
+        back to the queue: their jobs are re-attached when the service restarts
+        """
+        self.stop_event.set()
+
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+        print("Service stopped.")
+
+    def worker_loop(self, worker):
+        while not self.stop_event.is_set():
+            request = self.queue.claim(worker)
+
+            if request is None:
+                self.stop_event.wait(self.poll_interval)
+                continue
+
+            self.run_request(request, worker)
+
+    def run_request(self, request, worker):
+        """
+        run a request claimed by worker, keeping its lease
+        the errors are handled here: the request is retried or FAILED
+        """
+        try:
+            with LeaseHeartbeat(
+                self.queue, request["request_id"], worker, self.heartbeat
+            ) as heartbeat:
+                self.process(request, worker, heartbeat)
+        except LeaseLostError as e:
+            # the new owner goes on with the request and its job
+            print(e)
+        except Exception as e:
+            print(f"Error in request {request['request_id']}: {e}")
+            self.handle_failure(request, worker, e)
+
+    def handle_failure(self, request, worker, error):
+        """
+        retry (or fail) the request, without leaking jobs or objects:
+        a job still running is re-attached by the next attempt, or canceled
+        after the last one; the objects are deleted if no job reads them
+        """
+        request_id = request["request_id"]
+
+        current = self.queue.get(request_id)
+        if current["status"] != "RUNNING" or current["worker"] != worker:
+            print(f"Request {request_id} no longer owned by {worker}")
+            return
+
+        # the job of this attempt (or of a previous one, re-attached)
+        job_id = current["job_id"]
+        keep_job = job_id is not None and not isinstance(error, JobFailedError)
+
+        if keep_job and self.queue.is_last_attempt(request["attempts"]):
+            self.speech_client.cancel_job(job_id)
+            keep_job = False
+
+        if not keep_job:
+            # also the objects uploaded before a failed submission
+            n_deleted = delete_prefix(
+                self.fs, self.input_bucket, self.object_prefix(request_id)
+            )
+            print(f"Deleted {n_deleted} objects of request {request_id}")
+
+        self.queue.fail(
+            request_id, worker, str(error), request["attempts"], keep_job=keep_job
+        )
+
+    @staticmethod
+    def object_prefix(request_id):
+        # isolation: all the objects of the request have this prefix
+        return f"{request_id}_"
+
+    def process(self, request, worker, heartbeat):
+        request_id = request["request_id"]
+        tenant = request["tenant"]
+        object_prefix = self.object_prefix(request_id)
+
+        print(
+            f"[{worker}] request {request_id} of {tenant}, attempt {request['attempts']}"
+        )
+
+        if request["job_id"] is None:
+            object_names = copy_files_to_oss(
+                self.fs,
+                request["audio_dir"],
+                self.input_bucket,
+                file_names=request["file_names"],
+                dest_prefix=object_prefix,
+            )
+            if len(object_names) != len(request["file_names"]):
+                # a job with only some of the files would succeed: retry
+                raise RuntimeError(
+                    f"Uploaded {len(object_names)}/{len(request['file_names'])} files"
+                )
+
+            # the upload can be long: another worker can have taken the request
+            heartbeat.check()
+
+            job_details = self.speech_client.create_transcription_job_details(
+                self.input_bucket,
+                self.output_bucket,
+                object_names,
+                f"{SERVICE_JOB_PREFIX}/{tenant}/{request_id}",
+                f"{tenant}_{request_id}",
+                request["language_code"],
+            )
+            job = self.speech_client.create_transcription_job(job_details).data
+            job_id = job.id
+            output_prefix = job.output_location.prefix
+            # the timeout counts from the submission, also across re-attaches
+            deadline = time.time() + self.timeout
+
+            if not self.queue.set_job(
+                request_id, worker, job_id, output_prefix, object_names, deadline
+            ):
+                # nobody else knows this job: it would run (and bill) for nothing
+                self.speech_client.cancel_job(job_id)
+                raise LeaseLostError(request_id)
+
+            # to estimate when the job will end
+            audio_duration = get_total_duration(
+                request["audio_dir"], request["file_names"]
+            )
+        else:
+            # a job submitted before a restart (or by a worker died)
+            job_id = request["job_id"]
+            output_prefix = request["output_prefix"]
+            object_names = request["object_names"]
+            # (a request queued before the deadline was saved)
+            deadline = request["deadline"] or time.time() + self.timeout
+
+            # we don't know for how long it has been running
+            audio_duration = None
+
+            print(f"[{worker}] re-attaching to JOB {job_id}")
+
+        status = self.wait_for_job(job_id, heartbeat, deadline, audio_duration)
+
+        if status is None:
+            # stopping, the request goes back to the queue
+            self.queue.release(request_id, worker)
+            return
+
+        if status != "SUCCEEDED":
+            raise JobFailedError(job_id, status)
+
+        result_dir = self.download_results(
+            request_id, tenant, output_prefix, object_prefix
+        )
+        n_results = len(os.listdir(result_dir))
+        if n_results < len(object_names):
+            # the input objects are kept: the next attempt downloads again
+            raise RuntimeError(f"Downloaded {n_results}/{len(object_names)} results")
+        heartbeat.check()
+
+        # only the objects of this request, the bucket is shared
+        delete_objects(self.fs, self.input_bucket, object_names)
+
+        if not self.queue.complete(request_id, worker, result_dir, n_results):
+            raise LeaseLostError(request_id)
+
+        print(f"[{worker}] request {request_id} completed, {n_results} results")
+
+    def wait_for_job(self, job_id, heartbeat, deadline, audio_duration=None):
+        """
+        poll the job (adaptive polling), while the heartbeat keeps the lease
+        deadline: time after which the job is canceled
+        audio_duration: total duration (sec.) of the audio, to estimate the ETA
+        return the final status, None if the service is stopped
+        """
+        if audio_duration is not None:
+            schedule = PollingSchedule(eta=estimate_job_duration(audio_duration))
+        else:
+            schedule = PollingSchedule()
+        status = "ACCEPTED"
+
+        t_start = time.time()
+        while status in ["ACCEPTED", "IN_PROGRESS"]:
+            elapsed = time.time() - t_start
+
+            if time.time() >= deadline:
+                print(f"Timeout for JOB {job_id}")
+                self.speech_client.cancel_job(job_id)
+                return "CANCELED"
+
+            interval = min(schedule.next_interval(elapsed), deadline - time.time())
+
+            # the job is left running, the next worker re-attaches to it
+            if self.stop_event.wait(max(interval, 0)):
+                return None
+
+            # transient errors are retried in get_job
+            status = self.speech_client.get_job(job_id).data.lifecycle_state
+
+            heartbeat.check()
+
+        return status
+
+    def download_results(self, request_id, tenant, output_prefix, object_prefix):
+        """
+        copy the json of the request in results_dir/tenant/request_id
+        with the names they would have without the prefix of the request
+        """
+        result_dir = path.join(self.results_dir, tenant, request_id)
+        os.makedirs(result_dir, exist_ok=True)
+
+        json_names = copy_json_from_oss(
+            self.fs, result_dir, JSON_EXT, output_prefix, self.output_bucket
+        )
+
+        prefixed = f"{NAMESPACE}_{self.input_bucket}_{object_prefix}"
+        for json_name in json_names:
+            if json_name.startswith(prefixed):
+                os.replace(
+                    path.join(result_dir, json_name),
+                    path.join(
+                        result_dir,
+                        f"{NAMESPACE}_{self.input_bucket}_"
+                        + json_name[len(prefixed) :],
+                    ),
+                )
+
+        return result_dir
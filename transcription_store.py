@@ -0,0 +1,239 @@
+#
+# Columnar store (Arrow) of the transcriptions
+# every json is parsed only once, all the consumers read from here
+#
+import glob
+import json
+import os
+from os import path
+from os.path import basename
+
+from functools import lru_cache
+
+from config import NAMESPACE, JSON_EXT
+
+# pyarrow is imported only when the tables are built
+# the schemas are (name, pyarrow type) tuples
+
+# one row for every audio file
+UTTERANCE_FIELDS = (
+    ("file_name", "string"),
+    ("txt", "string"),
+    ("confidence", "float32"),
+    ("n_tokens", "int32"),
+)
+
+# one row for every token
+TOKEN_FIELDS = (
+    ("file_name", "string"),
+    ("token", "string"),
+    ("start_time", "float32"),
+    ("end_time", "float32"),
+    ("confidence", "float32"),
+    ("type", "string"),
+)
+
+
+@lru_cache(maxsize=None)
+def to_schema(fields):
+    """
+    the Arrow schema for fields, built once
+    """
+    import pyarrow as pa
+
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in fields])
+
+
+def get_only_name(json_name, input_bucket, json_ext=JSON_EXT):
+    """
+    the name of the audio file:
+    remove the PREFIX added by OCI Speech and .json
+    """
+    prefix = NAMESPACE + "_" + input_bucket + "_"
+    only_name = basename(json_name)
+
+    if only_name.startswith(prefix):
+        only_name = only_name[len(prefix) :]
+    if only_name.endswith(f".{json_ext}"):
+        only_name = only_name[: -len(json_ext) - 1]
+
+    return only_name
+
+
+def original_json_name(json_name, input_bucket, names, json_ext=JSON_EXT):
+    """
+    the name of the json for the original audio file
+    names: new name -> original name of the files renamed (ex: by preprocess)
+    """
+    only_name = get_only_name(json_name, input_bucket, json_ext)
+
+    if only_name not in names:
+        return json_name
+
+    return f"{NAMESPACE}_{input_bucket}_{names[only_name]}.{json_ext}"
+
+
+def to_seconds(value):
+    # OCI Speech times are strings like "1.28s"
+    return float(value.rstrip("s")) if value is not None else None
+
+
+def to_float(value):
+    return float(value) if value is not None else None
+
+
+def parse_transcription(file_name, d_json):
+    """
+    extract from the OCI Speech json: text, confidence and tokens
+    return (utterance row, list of token rows)
+    """
+    transcription = d_json["transcriptions"][0]
+    tokens = transcription.get("tokens", [])
+
+    utterance = (
+        file_name,
+        transcription["transcription"],
+        to_float(transcription.get("confidence")),
+        len(tokens),
+    )
+    token_rows = [
+        (
+            file_name,
+            token.get("token"),
+            to_seconds(token.get("startTime")),
+            to_seconds(token.get("endTime")),
+            to_float(token.get("confidence")),
+            token.get("type"),
+        )
+        for token in tokens
+    ]
+
+    return utterance, token_rows
+
+
+def to_table(rows, fields):
+    import pyarrow as pa
+
+    schema = to_schema(fields)
+
+    # rows -> columns
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+
+    return pa.Table.from_arrays(
+        [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+        schema=schema,
+    )
+
+
+class TranscriptionStore:
+    """
+    the transcriptions, one record for every json
+
+    add() takes a json already in memory (ex: from the cache or a stream),
+    update_from_dir() parses only the json new or changed since last call
+    the Arrow tables are rebuilt only if something changed
+    """
+
+    def __init__(self, input_bucket, json_ext=JSON_EXT):
+        self.input_bucket = input_bucket
+        self.json_ext = json_ext
+
+        # json_name -> (utterance row, token rows)
+        self.records = {}
+        # json_name -> mtime of the file parsed (None if added from memory)
+        self.mtimes = {}
+
+        self._utterances = None
+        self._tokens = None
+
+    def add(self, json_name, d_json, mtime=None):
+        json_name = basename(json_name)
+        file_name = get_only_name(json_name, self.input_bucket, self.json_ext)
+
+        self.records[json_name] = parse_transcription(file_name, d_json)
+        self.mtimes[json_name] = mtime
+
+        self._utterances = None
+        self._tokens = None
+
+    def add_file(self, f_name):
+        mtime = os.stat(f_name).st_mtime
+
+        with open(f_name) as f:
+            self.add(f_name, json.load(f), mtime)
+
+    def update_from_dir(self, json_dir):
+        """
+        sync with the json in json_dir: parse the new or changed files,
+        remove the records of the files not there anymore
+        return the number of files parsed
+        """
+        list_json = glob.glob(path.join(json_dir, f"*.{self.json_ext}"))
+        names = {basename(f_name) for f_name in list_json}
+
+        for json_name in list(self.records):
+            if json_name not in names:
+                del self.records[json_name]
+                del self.mtimes[json_name]
+
+                self._utterances = None
+                self._tokens = None
+
+        n_parsed = 0
+        for f_name in list_json:
+            json_name = basename(f_name)
+
+            if json_name in self.records:
+                mtime = self.mtimes[json_name]
+
+                # added from memory, or parsed and not changed
+                if mtime is None or mtime == os.stat(f_name).st_mtime:
+                    continue
+
+            try:
+                self.add_file(f_name)
+                n_parsed += 1
+            except Exception as e:
+                print(f"Error parsing {json_name}: {e}")
+
+        return n_parsed
+
+    def __len__(self):
+        return len(self.records)
+
+    def sorted_records(self):
+        return sorted(self.records.values(), key=lambda record: record[0][0])
+
+    def utterances(self):
+        """
+        Arrow table, one row for every file, sorted on file_name
+        """
+        if self._utterances is None:
+            self._utterances = to_table(
+                [utterance for utterance, _ in self.sorted_records()],
+                UTTERANCE_FIELDS,
+            )
+
+        return self._utterances
+
+    def tokens(self):
+        """
+        Arrow table, one row for every token, sorted on file_name
+        """
+        if self._tokens is None:
+            self._tokens = to_table(
+                [row for _, token_rows in self.sorted_records() for row in token_rows],
+                TOKEN_FIELDS,
+            )
+
+        return self._tokens
+
+    def iter_texts(self):
+        """
+        (file_name, txt), sorted on file_name
+        """
+        table = self.utterances()
+
+        return zip(
+            table.column("file_name").to_pylist(), table.column("txt").to_pylist()
+        )
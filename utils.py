@@ -2,14 +2,31 @@ import os
 from os import path
 from os.path import basename
 import glob
+import json
 import time
-from tqdm import tqdm
-import soundfile as sf
-
-import oci
-from ocifs import OCIFileSystem
-
-from config import DEBUG, SLEEP_TIME, NAMESPACE
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+# soundfile and tqdm are imported in the functions that use them:
+# they are slow to import and not needed, for example, for --help
+
+from client_registry import registry
+from tracing import tracer
+
+from config import (
+    DEBUG,
+    SLEEP_TIME,
+    NAMESPACE,
+    JSON_EXT,
+    UPLOAD_WORKERS,
+    DOWNLOAD_WORKERS,
+    PROBE_WORKERS,
+    MULTIPART_THRESHOLD,
+    MULTIPART_PART_SIZE,
+    MAX_RETRIES,
+    RETRY_BACKOFF,
+)
 
 
 def print_debug(txt=None):
@@ -20,14 +37,65 @@ def print_debug(txt=None):
             print("")
 
 
+def probe_audio(f_name):
+    """
+    read only the header of the audio file (the audio is not decoded)
+    return a dict with sample_rate, channels, duration (sec.) and subtype
+    """
+    import soundfile as sf
+
+    info = sf.info(f_name)
+
+    return {
+        "file_name": f_name,
+        "sample_rate": info.samplerate,
+        "channels": info.channels,
+        "duration": info.duration,
+        "subtype": info.subtype,
+    }
+
+
 def check_sample_rate(f_name, sample_rate=16000):
     """
     sample_rate: the expected sampling rate
     return true if the sample_rate is the expected
     """
-    vet, s_rate = sf.read(f_name)
+    return probe_audio(f_name)["sample_rate"] == sample_rate
+
+
+def get_audio_duration(f_name):
+    """
+    duration of the audio file in sec.
+    """
+    return probe_audio(f_name)["duration"]
+
+
+def get_total_duration(audio_dir, file_names):
+    """
+    total duration (sec.) of the audio files, to estimate the job duration
+    """
+    return sum(
+        get_audio_duration(path.join(audio_dir, f_name)) for f_name in file_names
+    )
+
+
+def scan_audio_dir(audio_dir, ext="*", max_workers=PROBE_WORKERS):
+    """
+    probe all the files in audio_dir, in parallel
+    return the list of dict from probe_audio, sorted by file name
+    for the files that can't be read the dict has only file_name and error
+    """
+
+    def safe_probe(f_name):
+        try:
+            return probe_audio(f_name)
+        except Exception as e:
+            return {"file_name": f_name, "error": str(e)}
 
-    return s_rate == sample_rate
+    list_files = sorted(glob.glob(path.join(audio_dir, f"*.{ext}")))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(safe_probe, list_files))
 
 
 # to clean appo local and json dir
@@ -41,89 +109,491 @@ def clean_directory(dir, file_ext="*"):
 
 # check if we can use RP
 def is_rp_ok():
-    rp_ok = None
-    try:
-        rps = oci.auth.signers.get_resource_principals_signer()
+    # the probe is done once, the signer is kept in the registry
+    rp_ok = registry.get_signer() is not None
 
-        # if here, we can use rp
+    if rp_ok:
         print_debug("Using RP for auth...")
-
-        rp_ok = True
-    except:
+    else:
         print_debug("Using API Key for auth...")
 
-        rp_ok = False
+    return rp_ok
 
 
 def get_ocifs():
-    # check if we can use RP
-    if is_rp_ok():
-        fs = OCIFileSystem()
+    """
+    the OCIFileSystem (or the mock) shared by the whole process
+    """
+    return registry.get_ocifs()
+
+
+def is_transient_error(e):
+    """
+    the errors retried by the OCI SDK: 429, 5xx and connection errors
+    """
+    if isinstance(e, FileNotFoundError):
+        return False
+
+    status = getattr(e, "status", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+
+    return True
+
+
+def get_pool_executor(max_workers):
+    """
+    executor for CPU bound work (preprocessing, WER)
+    processes in the scripts; threads if other threads are running
+    (ex: in the Streamlit server), since a fork copies the locks they hold
+    and can deadlock, and with "spawn" the script would run again in
+    every worker (the demos don't have a __main__ guard)
+    """
+    if threading.active_count() > 1:
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context("fork")
+    else:
+        mp_context = None
+
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
+
+
+def retry_with_backoff(
+    func, *args, max_retries=MAX_RETRIES, backoff=RETRY_BACKOFF, retryable=None
+):
+    """
+    call func(*args), retrying on exception
+    wait time is doubled at every attempt
+    retryable: if provided, only the exceptions for which it is True are retried
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return func(*args)
+        except Exception as e:
+            if attempt == max_retries or (retryable is not None and not retryable(e)):
+                raise
+
+            tracer.count("retries_total", function=getattr(func, "__name__", "call"))
+            wait_time = backoff * (2**attempt)
+            print_debug(f"Error: {e}, retrying in {wait_time} s...")
+            time.sleep(wait_time)
+
+
+@tracer.traced()
+def upload_file(
+    fs,
+    f_name,
+    dest_path,
+    multipart_threshold=MULTIPART_THRESHOLD,
+    part_size=MULTIPART_PART_SIZE,
+):
+    """
+    upload a single file to dest_path
+    files bigger than multipart_threshold are streamed in parts
+    return the number of bytes uploaded
+    """
+    f_size = os.path.getsize(f_name)
+
+    if f_size >= multipart_threshold:
+        # the remote file, opened in write mode, does a multipart upload
+        # (one part for each block)
+        with open(f_name, "rb") as f_in, fs.open(
+            dest_path, "wb", block_size=part_size
+        ) as f_out:
+            while True:
+                chunk = f_in.read(part_size)
+                if not chunk:
+                    break
+                f_out.write(chunk)
     else:
-        fs = OCIFileSystem(config="~/.oci/config", profile="DEFAULT")
+        fs.put(f_name, dest_path)
 
-    return fs
+    tracer.count("api_calls_total", service="object_storage", operation="put")
+    tracer.count("bytes_uploaded_total", f_size)
+
+    return f_size
+
+
+def upload_file_with_etag(fs, f_name, dest_path):
+    """
+    upload a single file
+    return the number of bytes uploaded and the etag of the new object
+    """
+    f_size = upload_file(fs, f_name, dest_path)
+
+    return f_size, fs.info(dest_path).get("etag")
 
 
 # to copy files to oss
-def copy_files_to_oss(fs, local_dir, dest_bucket, ext="*"):
+@tracer.traced("upload")
+def copy_files_to_oss(
+    fs,
+    local_dir,
+    dest_bucket,
+    ext="*",
+    max_workers=UPLOAD_WORKERS,
+    manifest=None,
+    file_names=None,
+    dest_prefix="",
+):
     """
     copy all the files
     from local_dir
     with extension ext
     to dest_bucket
-    """
-    n_copied = 0
 
-    list_files = glob.glob(path.join(local_dir, f"*.{ext}"))
+    uploads are done in parallel, using max_workers threads
+    manifest: an UploadManifest, if provided files already in the bucket
+    with the same content are not uploaded again
+    file_names: if provided, copy only these files
+    dest_prefix: added to the name of every object (ex: one prefix per request)
 
-    print()
-    print("*** Copy audio files to transcribe ***")
+    return the list of object names in the bucket (uploaded or unchanged)
+    """
+    from tqdm import tqdm
 
-    file_names = []
-    for f_name in tqdm(list_files):
-        print(f"Copying {f_name}...")
+    list_files = sorted(glob.glob(path.join(local_dir, f"*.{ext}")))
 
-        only_name = basename(f_name)
+    if file_names is not None:
+        file_names = set(file_names)
+        list_files = [f_name for f_name in list_files if basename(f_name) in file_names]
 
-        fs.put(f_name, f"{dest_bucket}@{NAMESPACE}/{only_name}")
-        file_names.append(only_name)
+    print()
+    print("*** Copy audio files to transcribe ***")
 
-        n_copied += 1
+    t_start = time.time()
+    n_bytes = 0
+    uploaded = set()
+    failed = []
+
+    remote_infos = {}
+    if manifest is not None:
+        # what is already in the bucket, with size, etag and md5
+        fs.invalidate_cache()
+        remote_infos = {
+            basename(info["name"]): info
+            for info in fs.ls(f"{dest_bucket}@{NAMESPACE}/", detail=True)
+        }
+
+    # the spans in the workers are children of the span open here
+    retry = tracer.wrap(retry_with_backoff)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        md5s = {}
+        for f_name in list_files:
+            only_name = dest_prefix + basename(f_name)
+            dest_path = f"{dest_bucket}@{NAMESPACE}/{only_name}"
+
+            if manifest is None:
+                future = executor.submit(
+                    retry,
+                    upload_file,
+                    fs,
+                    f_name,
+                    dest_path,
+                    retryable=is_transient_error,
+                )
+            else:
+                md5s[f_name] = manifest.local_md5(f_name)
+
+                if manifest.is_unchanged(
+                    f_name, md5s[f_name], remote_infos.get(only_name)
+                ):
+                    print_debug(f"Skipping {only_name}, unchanged...")
+                    uploaded.add(only_name)
+                    continue
+
+                future = executor.submit(
+                    retry,
+                    upload_file_with_etag,
+                    fs,
+                    f_name,
+                    dest_path,
+                    retryable=is_transient_error,
+                )
+            futures[future] = f_name
+
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            f_name = futures[future]
+            only_name = dest_prefix + basename(f_name)
+
+            try:
+                if manifest is None:
+                    n_bytes += future.result()
+                else:
+                    f_size, etag = future.result()
+                    n_bytes += f_size
+                    manifest.update(f_name, md5s[f_name], etag)
+
+                uploaded.add(only_name)
+            except Exception as e:
+                print(f"Error copying {only_name}: {e}")
+                failed.append(only_name)
+
+    t_ela = time.time() - t_start
+
+    if manifest is not None:
+        manifest.save()
+
+    # keep the original order
+    file_names = [dest_prefix + basename(f_name) for f_name in list_files]
+    file_names = [f_name for f_name in file_names if f_name in uploaded]
 
     print()
-    print(f"Copied {n_copied} files to bucket {dest_bucket}.")
+    print(f"Copied {len(futures) - len(failed)} files to bucket {dest_bucket}.")
+    if manifest is not None:
+        print(f"Skipped {len(list_files) - len(futures)} unchanged files.")
+    print(
+        f"Uploaded {round(n_bytes / 2**20, 1)} MB in {round(t_ela, 1)} sec., "
+        f"{round(n_bytes / 2**20 / max(t_ela, 1e-6), 1)} MB/s"
+    )
+    if failed:
+        print(f"Failed to copy {len(failed)} files: {failed}")
     print()
 
     return file_names
 
 
-def copy_json_from_oss(fs, local_json_dir, json_ext, output_prefix, output_bucket):
+def list_json_in_oss(fs, json_ext, output_prefix, output_bucket):
     # get the list all files in OUTPUT_BUCKET/OUTPUT_PREFIX
-    list_json = fs.glob(f"{output_bucket}@{NAMESPACE}/{output_prefix}/*.{json_ext}")
+    tracer.count("api_calls_total", service="object_storage", operation="list")
+
+    return retry_with_backoff(
+        fs.glob,
+        f"{output_bucket}@{NAMESPACE}/{output_prefix}/*.{json_ext}",
+        retryable=is_transient_error,
+    )
+
+
+@tracer.traced()
+def download_file(fs, f_name, local_path):
+    fs.get(f_name, local_path)
+
+    tracer.count("api_calls_total", service="object_storage", operation="get")
+    tracer.count("bytes_downloaded_total", os.path.getsize(local_path))
+
+
+@tracer.traced("download")
+def copy_json_from_oss(
+    fs,
+    local_json_dir,
+    json_ext,
+    output_prefix,
+    output_bucket,
+    max_workers=DOWNLOAD_WORKERS,
+    skip_names=None,
+    on_download=None,
+):
+    """
+    copy all the json files in output_bucket/output_prefix to local_json_dir
+    downloads are done in parallel, using max_workers threads
+
+    skip_names: if provided, these files are not downloaded (ex: already local)
+    on_download: if provided, called with the name of every file downloaded
+
+    return the list of file names downloaded
+    """
+    from tqdm import tqdm
+
+    list_json = list_json_in_oss(fs, json_ext, output_prefix, output_bucket)
+
+    if skip_names:
+        n_total = len(list_json)
+        list_json = [
+            f_name for f_name in list_json if basename(f_name) not in skip_names
+        ]
+        print(f"Skipping {n_total - len(list_json)} files already downloaded...")
 
     # copy all the files in JSON_DIR
     print(f"Copy JSON result files to: {local_json_dir} local directory...")
     print()
 
     file_names = []
-    for f_name in tqdm(list_json):
-        only_name = basename(f_name)
+    failed = []
 
-        fs.get(f_name, path.join(local_json_dir, only_name))
-        file_names.append(only_name)
+    # the spans in the workers are children of the span open here
+    retry = tracer.wrap(retry_with_backoff)
 
-    return file_names
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for f_name in list_json:
+            only_name = basename(f_name)
+
+            future = executor.submit(
+                retry,
+                download_file,
+                fs,
+                f_name,
+                path.join(local_json_dir, only_name),
+                retryable=is_transient_error,
+            )
+            futures[future] = only_name
+
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            only_name = futures[future]
+
+            try:
+                future.result()
+                file_names.append(only_name)
+
+                if on_download is not None:
+                    on_download(only_name)
+            except Exception as e:
+                print(f"Error copying {only_name}: {e}")
+                failed.append(only_name)
+
+    if failed:
+        print()
+        print(f"Failed to copy {len(failed)} of {len(list_json)} files: {failed}")
+        print()
+
+    return sorted(file_names)
+
+
+@tracer.traced()
+def read_json_from_oss(fs, f_name):
+    with fs.open(f_name, "r") as f:
+        text = f.read()
+
+    tracer.count("api_calls_total", service="object_storage", operation="get")
+    tracer.count("bytes_downloaded_total", len(text))
+
+    return json.loads(text)
+
+
+def iter_json_from_oss(
+    fs, json_ext, output_prefix, output_bucket, max_workers=DOWNLOAD_WORKERS
+):
+    """
+    read the json files in output_bucket/output_prefix, without saving to disk
+    yield (file_name, dict) as soon as each file has been read
+    files that can't be read are reported and skipped
+    """
+    list_json = list_json_in_oss(fs, json_ext, output_prefix, output_bucket)
+
+    # the spans in the workers are children of the span open here
+    retry = tracer.wrap(retry_with_backoff)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                retry,
+                read_json_from_oss,
+                fs,
+                f_name,
+                retryable=is_transient_error,
+            ): f_name
+            for f_name in list_json
+        }
+
+        for future in as_completed(futures):
+            only_name = basename(futures[future])
+
+            try:
+                d_json = future.result()
+            except Exception as e:
+                print(f"Error reading {only_name}: {e}")
+                continue
+
+            yield only_name, d_json
+
+
+def save_json(local_json_dir, input_bucket, file_name, d_json):
+    """
+    save a transcription json with the name OCI Speech would give it
+    return the name of the json
+    """
+    json_name = f"{NAMESPACE}_{input_bucket}_{file_name}.{JSON_EXT}"
+
+    with open(path.join(local_json_dir, json_name), "w") as f:
+        json.dump(d_json, f)
+
+    return json_name
 
 
 # to clean input bucket
+@tracer.traced()
 def clean_bucket(fs, bucket_name):
     # get the list, iterate and delete
-    list_files = fs.ls(f"{bucket_name}@{NAMESPACE}/")
+    list_files = retry_with_backoff(
+        fs.ls, f"{bucket_name}@{NAMESPACE}/", retryable=is_transient_error
+    )
+    tracer.count("api_calls_total", service="object_storage", operation="list")
 
     for f_name in list_files:
         print(f"Deleting: {f_name}")
-        fs.rm(f_name)
+        retry_with_backoff(fs.rm, f_name, retryable=is_transient_error)
+        tracer.count("api_calls_total", service="object_storage", operation="delete")
+
+
+# to delete the objects with a prefix (ex: the files of one request)
+@tracer.traced()
+def delete_prefix(fs, bucket_name, prefix):
+    """
+    delete all the objects whose name starts with prefix
+    return the number of objects deleted
+    """
+    list_files = retry_with_backoff(
+        fs.glob, f"{bucket_name}@{NAMESPACE}/{prefix}*", retryable=is_transient_error
+    )
+    tracer.count("api_calls_total", service="object_storage", operation="list")
+
+    return delete_objects(
+        fs, bucket_name, [f_name.split("/", 1)[1] for f_name in list_files]
+    )
+
+
+# to delete only some objects (ex: the files of one request)
+@tracer.traced()
+def delete_objects(fs, bucket_name, object_names):
+    """
+    delete the objects, the ones already missing are skipped
+    return the number of objects deleted
+    """
+    n_deleted = 0
+
+    for object_name in object_names:
+        try:
+            fs.rm(f"{bucket_name}@{NAMESPACE}/{object_name}")
+            tracer.count(
+                "api_calls_total", service="object_storage", operation="delete"
+            )
+            n_deleted += 1
+        except FileNotFoundError:
+            pass
+
+    return n_deleted
+
+
+def prune_bucket(fs, bucket_name, keep_names, manifest=None):
+    """
+    delete from the bucket only the objects not in keep_names
+    (instead of wiping the whole bucket as clean_bucket does)
+    """
+    keep_names = set(keep_names)
+
+    fs.invalidate_cache()
+    list_files = fs.ls(f"{bucket_name}@{NAMESPACE}/")
+
+    n_deleted = 0
+    for f_name in list_files:
+        only_name = basename(f_name)
+
+        if only_name not in keep_names:
+            print(f"Deleting: {f_name}")
+            fs.rm(f_name)
+            n_deleted += 1
+
+            if manifest is not None:
+                manifest.remove(only_name)
+
+    if manifest is not None:
+        manifest.save()
+
+    print(f"Deleted {n_deleted} stale objects from bucket {bucket_name}.")
 
 
 # to check the lang code
@@ -0,0 +1,296 @@
+#
+# Voice activity detection:
+# trim the silence and split long files in chunks containing speech
+# an offset map is kept, to report the timestamps on the original files
+#
+import os
+from os import path
+from os.path import basename, splitext
+import json
+
+import numpy as np
+import soundfile as sf
+
+from utils import save_json
+
+from config import (
+    NAMESPACE,
+    JSON_EXT,
+    VAD_FRAME_MS,
+    VAD_MARGIN_DB,
+    VAD_SILENCE_DB,
+    VAD_MIN_RANGE_DB,
+    VAD_MIN_SILENCE,
+    VAD_MIN_SPEECH,
+    VAD_PADDING,
+    VAD_MAX_CHUNK,
+    VAD_MAP_NAME,
+)
+
+
+def detect_speech(
+    audio,
+    sample_rate,
+    frame_ms=VAD_FRAME_MS,
+    margin_db=VAD_MARGIN_DB,
+    silence_db=VAD_SILENCE_DB,
+    min_range_db=VAD_MIN_RANGE_DB,
+    min_silence=VAD_MIN_SILENCE,
+    min_speech=VAD_MIN_SPEECH,
+    padding=VAD_PADDING,
+):
+    """
+    energy based VAD
+    audio: 1d (or 2d, downmixed) numpy array
+
+    a frame is speech if its energy is more than margin_db over the noise floor
+    (estimated as the 10th percentile of the frame energies) and over silence_db;
+    with less than min_range_db between loud and quiet frames (continuous
+    speech, or only silence) the floor is meaningless, only silence_db is used
+    return the list of (start, end) of the speech segments, in samples
+    """
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+
+    frame_len = max(1, int(sample_rate * frame_ms / 1000))
+    n_frames = len(audio) // frame_len
+    if n_frames == 0:
+        return []
+
+    frames = audio[: n_frames * frame_len].reshape(n_frames, frame_len)
+    energy_db = 10 * np.log10(np.mean(frames.astype(np.float64) ** 2, axis=1) + 1e-12)
+
+    noise_floor = np.percentile(energy_db, 10)
+    if np.percentile(energy_db, 90) - noise_floor < min_range_db:
+        threshold = silence_db
+    else:
+        threshold = max(noise_floor + margin_db, silence_db)
+    is_speech = energy_db > threshold
+
+    # start and end (in frames) of the runs of speech frames
+    edges = np.diff(np.concatenate([[0], is_speech.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    # merge segments separated by short silences
+    min_gap = min_silence * 1000 / frame_ms
+    segments = []
+    for start, end in zip(starts, ends):
+        if segments and start - segments[-1][1] < min_gap:
+            segments[-1][1] = end
+        else:
+            segments.append([start, end])
+
+    # in samples, with padding, dropping too short segments
+    pad = int(padding * sample_rate)
+    result = []
+    for start, end in segments:
+        if (end - start) * frame_ms / 1000 < min_speech:
+            continue
+
+        start = max(0, start * frame_len - pad)
+        end = min(len(audio), end * frame_len + pad)
+
+        if result and start <= result[-1][1]:
+            result[-1] = (result[-1][0], end)
+        else:
+            result.append((start, end))
+
+    return result
+
+
+def build_chunks(segments, sample_rate, max_chunk=VAD_MAX_CHUNK):
+    """
+    group the speech segments in chunks of at most max_chunk sec.
+    a segment is split only if longer than max_chunk
+    return a list of chunks, every chunk a list of (start, end) in samples
+    """
+    max_len = int(max_chunk * sample_rate)
+
+    chunks = []
+    current = []
+    current_len = 0
+    for start, end in segments:
+        # doesn't fit: starts a new chunk
+        if current and current_len + end - start > max_len:
+            chunks.append(current)
+            current = []
+            current_len = 0
+
+        while end - start > 0:
+            piece_end = min(end, start + max_len - current_len)
+
+            current.append((start, piece_end))
+            current_len += piece_end - start
+            start = piece_end
+
+            if current_len >= max_len:
+                chunks.append(current)
+                current = []
+                current_len = 0
+
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+
+def vad_split_file(src, dst_dir, max_chunk=VAD_MAX_CHUNK):
+    """
+    write in dst_dir the chunks with the speech in src, as FLAC
+    return the offset map: chunk name -> source name and pieces
+    every piece: chunk_start, source_start, duration (sec.)
+    """
+    audio, sample_rate = sf.read(src, dtype="float32")
+    stem = splitext(basename(src))[0]
+
+    segments = detect_speech(audio, sample_rate)
+    if not segments and len(audio) > 0:
+        # better a transcription of silence than a file lost
+        print(f"{basename(src)}: no speech detected, sending the whole file")
+        segments = [(0, len(audio))]
+    chunks = build_chunks(segments, sample_rate, max_chunk)
+
+    offset_map = {}
+    for i, chunk in enumerate(chunks):
+        chunk_name = f"{stem}_chunk{i:03d}.flac"
+
+        pieces = []
+        chunk_start = 0
+        for start, end in chunk:
+            pieces.append(
+                {
+                    "chunk_start": chunk_start / sample_rate,
+                    "source_start": start / sample_rate,
+                    "duration": (end - start) / sample_rate,
+                }
+            )
+            chunk_start += end - start
+
+        sf.write(
+            path.join(dst_dir, chunk_name),
+            np.concatenate([audio[start:end] for start, end in chunk]),
+            sample_rate,
+            format="FLAC",
+        )
+        offset_map[chunk_name] = {"source": basename(src), "pieces": pieces}
+
+    n_speech = sum(end - start for start, end in segments) / sample_rate
+    print(
+        f"{basename(src)}: {round(len(audio) / sample_rate, 1)} s., "
+        f"speech {round(n_speech, 1)} s., {len(chunks)} chunks"
+    )
+
+    return offset_map
+
+
+def vad_split_files(
+    list_files, dst_dir, map_file=VAD_MAP_NAME, max_chunk=VAD_MAX_CHUNK
+):
+    """
+    split all the files, the offset map is saved in map_file
+    return the offset map
+    """
+    os.makedirs(dst_dir, exist_ok=True)
+
+    print()
+    print("*** Removing silence and splitting audio files ***")
+
+    offset_map = {}
+    for f_name in list_files:
+        offset_map.update(vad_split_file(f_name, dst_dir, max_chunk))
+
+    with open(map_file, "w") as f:
+        json.dump(offset_map, f, indent=2)
+    print()
+
+    return offset_map
+
+
+def to_source_time(t, pieces):
+    """
+    t: time (sec.) in the chunk, return the time in the source file
+    """
+    for piece in pieces:
+        if t < piece["chunk_start"] + piece["duration"]:
+            return t - piece["chunk_start"] + piece["source_start"]
+
+    # at the end of the chunk
+    last = pieces[-1]
+    return t - last["chunk_start"] + last["source_start"]
+
+
+def rebase_transcription(d_json, pieces):
+    """
+    change in place startTime, endTime of the tokens
+    from chunk time to source file time (format is "1.234s")
+    """
+    for transcription in d_json.get("transcriptions", []):
+        for token in transcription.get("tokens", []):
+            for key in ["startTime", "endTime"]:
+                if key in token:
+                    t = float(token[key].rstrip("s"))
+                    token[key] = f"{to_source_time(t, pieces):.3f}s"
+
+    return d_json
+
+
+def merge_chunk_transcriptions(local_json_dir, input_bucket, offset_map, on_merge=None):
+    """
+    for every source file, merge the json of its chunks in one json
+    with timestamps on the source file
+    on_merge: if provided, called with the name of every merged json
+
+    the json of the chunks are removed, only after the merged one is saved
+    (and on_merge called): a crash in between loses nothing
+    """
+    # chunks of every source, in order
+    sources = {}
+    for chunk_name in sorted(offset_map):
+        sources.setdefault(offset_map[chunk_name]["source"], []).append(chunk_name)
+
+    for source, chunk_names in sources.items():
+        txts = []
+        tokens = []
+        confidences = []
+        merged = None
+        chunk_paths = []
+
+        for chunk_name in chunk_names:
+            json_name = f"{NAMESPACE}_{input_bucket}_{chunk_name}.{JSON_EXT}"
+            json_path = path.join(local_json_dir, json_name)
+
+            if not path.exists(json_path):
+                continue
+
+            with open(json_path) as f:
+                d_json = rebase_transcription(
+                    json.load(f), offset_map[chunk_name]["pieces"]
+                )
+            chunk_paths.append(json_path)
+
+            transcription = d_json["transcriptions"][0]
+            txts.append(transcription["transcription"])
+            tokens += transcription.get("tokens", [])
+            if "confidence" in transcription:
+                confidences.append(float(transcription["confidence"]))
+
+            if merged is None:
+                merged = d_json
+
+        if merged is None:
+            continue
+
+        merged["transcriptions"][0]["transcription"] = " ".join(txts)
+        merged["transcriptions"][0]["tokens"] = tokens
+        if confidences:
+            merged["transcriptions"][0][
+                "confidence"
+            ] = f"{sum(confidences) / len(confidences):.4f}"
+
+        json_name = save_json(local_json_dir, input_bucket, source, merged)
+        if on_merge is not None:
+            on_merge(json_name)
+
+        for json_path in chunk_paths:
+            os.remove(json_path)
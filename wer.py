@@ -0,0 +1,254 @@
+#
+# WER and CER
+# edit distance computed with NumPy, on batches of utterances at a time
+# per utterance scores with substitutions, deletions, insertions
+#
+import numpy as np
+
+from utils import get_pool_executor
+
+from config import WER_WORKERS, WER_PARALLEL_MIN, WER_CHUNK_SIZE, WER_BATCH_CELLS
+
+
+def tokenize(text, unit="word"):
+    """
+    unit: "word" (split on whitespace) or "char" (CER, spaces included)
+    """
+    if unit == "char":
+        return list(" ".join(text.split()))
+
+    return text.split()
+
+
+def to_ids(ref_tokens, hyp_tokens):
+    # tokens -> int, comparisons are done on arrays of ints
+    vocab = {}
+    ref_ids = [vocab.setdefault(t, len(vocab)) for t in ref_tokens]
+    hyp_ids = [vocab.setdefault(t, len(vocab)) for t in hyp_tokens]
+
+    return ref_ids, hyp_ids
+
+
+def pad(list_ids, length, value):
+    padded = np.full((len(list_ids), length), value, dtype=np.int32)
+    for k, ids in enumerate(list_ids):
+        padded[k, : len(ids)] = ids
+
+    return padded
+
+
+def count_errors(list_ref_ids, list_hyp_ids):
+    """
+    Levenshtein alignment of a batch of utterances, all at the same time
+
+    the DP matrices (batch x ref x hyp) are computed one row at a time,
+    the dependency on the left cell (insertions) is resolved with a running min
+    then the backtrace follows one of the optimal alignments, for all together
+
+    return 4 arrays: hits, substitutions, deletions, insertions
+    """
+    batch = len(list_ref_ids)
+    ref_len = np.array([len(ids) for ids in list_ref_ids])
+    hyp_len = np.array([len(ids) for ids in list_hyp_ids])
+    n, m = int(ref_len.max(initial=0)), int(hyp_len.max(initial=0))
+
+    # different padding values: padding never matches
+    # at least one column, read (and not used) in the backtrace when i or j is 0
+    ref = pad(list_ref_ids, max(n, 1), -1)
+    hyp = pad(list_hyp_ids, max(m, 1), -2)
+
+    d = np.empty((batch, n + 1, m + 1), dtype=np.int32)
+    cols = np.arange(m + 1, dtype=np.int32)
+    d[:, 0] = cols
+
+    row = np.empty((batch, m + 1), dtype=np.int32)
+    for i in range(1, n + 1):
+        # deletion (from above) or match/substitution (from the diagonal)
+        row[:, 0] = i
+        np.minimum(
+            d[:, i - 1, 1:] + 1,
+            d[:, i - 1, :-1] + (hyp[:, :m] != ref[:, i - 1 : i]),
+            out=row[:, 1:],
+        )
+        # insertions: row[j] = min over k <= j of row[k] + (j - k)
+        d[:, i] = np.minimum.accumulate(row - cols, axis=1) + cols
+
+    # backtrace, from (ref_len, hyp_len) of every utterance
+    counts = np.zeros((4, batch), dtype=np.int64)
+    hits, subs, dels, ins = counts
+    idx = np.arange(batch)
+    i, j = ref_len.copy(), hyp_len.copy()
+
+    while True:
+        active = (i > 0) | (j > 0)
+        if not active.any():
+            break
+
+        current = d[idx, i, j]
+        i_prev, j_prev = np.maximum(i - 1, 0), np.maximum(j - 1, 0)
+
+        # on ties: deletion, then match/substitution, then insertion
+        # (mostly the same choice as jiwer, the totals are always the same)
+        cost = ref[idx, i_prev] != hyp[idx, j_prev]
+        up = (i > 0) & (current == d[idx, i_prev, j] + 1)
+        diag = ~up & (i > 0) & (j > 0) & (current == d[idx, i_prev, j_prev] + cost)
+        left = active & ~diag & ~up
+
+        hits += diag & ~cost
+        subs += diag & cost
+        dels += up
+        ins += left
+
+        i -= diag | up
+        j -= diag | left
+
+    return hits, subs, dels, ins
+
+
+def make_batches(list_ref_ids, list_hyp_ids, max_cells):
+    """
+    group the utterances of similar length, to limit padding
+    return lists of indexes, each batch has at most max_cells in the DP matrices
+    """
+    order = sorted(
+        range(len(list_ref_ids)),
+        key=lambda k: (len(list_ref_ids[k]), len(list_hyp_ids[k])),
+    )
+
+    batches = []
+    current = []
+    max_n = max_m = 0
+    for k in order:
+        n = max(max_n, len(list_ref_ids[k]))
+        m = max(max_m, len(list_hyp_ids[k]))
+
+        if current and (len(current) + 1) * (n + 1) * (m + 1) > max_cells:
+            batches.append(current)
+            current = []
+            n, m = len(list_ref_ids[k]), len(list_hyp_ids[k])
+
+        current.append(k)
+        max_n, max_m = n, m
+
+    if current:
+        batches.append(current)
+
+    return batches
+
+
+def _score_batch(batch):
+    """
+    return the list of per utterance scores: a dict with hits, substitutions,
+    deletions, insertions, ref_len and the error rate of the utterance
+    """
+    references, predictions, unit = batch
+
+    list_ref_ids = []
+    list_hyp_ids = []
+    for reference, prediction in zip(references, predictions):
+        ref_ids, hyp_ids = to_ids(tokenize(reference, unit), tokenize(prediction, unit))
+        list_ref_ids.append(ref_ids)
+        list_hyp_ids.append(hyp_ids)
+
+    scores = [None] * len(references)
+    for indexes in make_batches(list_ref_ids, list_hyp_ids, WER_BATCH_CELLS):
+        counts = count_errors(
+            [list_ref_ids[k] for k in indexes], [list_hyp_ids[k] for k in indexes]
+        )
+
+        for k, hits, subs, dels, ins in zip(indexes, *[c.tolist() for c in counts]):
+            ref_len = len(list_ref_ids[k])
+
+            if ref_len > 0:
+                error_rate = (subs + dels + ins) / ref_len
+            else:
+                error_rate = float(ins > 0)
+
+            scores[k] = {
+                "hits": hits,
+                "substitutions": subs,
+                "deletions": dels,
+                "insertions": ins,
+                "ref_len": ref_len,
+                "error_rate": error_rate,
+            }
+
+    return scores
+
+
+def score_utterance(reference, prediction, unit="word"):
+    """
+    the scores of a single utterance (see _score_batch)
+    """
+    return _score_batch(([reference], [prediction], unit))[0]
+
+
+def compute_scores(
+    predictions,
+    references,
+    unit="word",
+    max_workers=WER_WORKERS,
+    parallel_min=WER_PARALLEL_MIN,
+    chunk_size=WER_CHUNK_SIZE,
+):
+    """
+    return the list of per utterance scores (see score_utterance)
+    with more than parallel_min utterances, batches run in a pool of workers
+    """
+    if len(predictions) != len(references):
+        raise ValueError(
+            f"{len(predictions)} predictions and {len(references)} references"
+        )
+
+    if len(references) < parallel_min or max_workers == 1:
+        return _score_batch((references, predictions, unit))
+
+    batches = [
+        (
+            references[i : i + chunk_size],
+            predictions[i : i + chunk_size],
+            unit,
+        )
+        for i in range(0, len(references), chunk_size)
+    ]
+
+    # processes, threads in the UI (see get_pool_executor)
+    scores = []
+    with get_pool_executor(max_workers) as executor:
+        for batch_scores in executor.map(_score_batch, batches):
+            scores += batch_scores
+
+    return scores
+
+
+def summarize(scores):
+    """
+    totals over all the utterances, error_rate is (S + D + I) / N
+    """
+    totals = {
+        key: sum(score[key] for score in scores)
+        for key in ["hits", "substitutions", "deletions", "insertions", "ref_len"]
+    }
+    n_errors = totals["substitutions"] + totals["deletions"] + totals["insertions"]
+
+    if totals["ref_len"] > 0:
+        totals["error_rate"] = n_errors / totals["ref_len"]
+    else:
+        totals["error_rate"] = float(n_errors > 0)
+
+    return totals
+
+
+def compute_wer(predictions, references, **kwargs):
+    """
+    same as evaluate.load("wer").compute(predictions=..., references=...)
+    """
+    return summarize(compute_scores(predictions, references, unit="word", **kwargs))[
+        "error_rate"
+    ]
+
+
+def compute_cer(predictions, references, **kwargs):
+    return summarize(compute_scores(predictions, references, unit="char", **kwargs))[
+        "error_rate"
+    ]
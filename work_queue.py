@@ -0,0 +1,380 @@
+#
+# Persistent queue of the transcription requests, in SQLite
+# shared by the clients (enqueue) and the workers of the service (claim),
+# also in different processes: the state changes are done in transactions
+#
+import json
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+from config import (
+    SERVICE_DB,
+    SERVICE_MAX_PENDING,
+    SERVICE_MAX_PENDING_PER_TENANT,
+    SERVICE_MAX_RUNNING_PER_TENANT,
+    SERVICE_MAX_ATTEMPTS,
+    SERVICE_LEASE,
+)
+
+# QUEUED -> RUNNING -> SUCCEEDED or FAILED (or QUEUED again, to retry)
+PENDING_STATES = ["QUEUED", "RUNNING"]
+
+COLUMNS = [
+    "request_id",
+    "tenant",
+    "status",
+    "audio_dir",
+    "file_names",
+    "language_code",
+    "time_created",
+    "time_updated",
+    "attempts",
+    "worker",
+    "lease_until",
+    "job_id",
+    "output_prefix",
+    "object_names",
+    "deadline",
+    "result_dir",
+    "n_results",
+    "error",
+]
+
+# stored as json text
+JSON_COLUMNS = ["file_names", "object_names"]
+
+# the tenant is used in object and directory names
+TENANT_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class QueueFullError(Exception):
+    """
+    the request is refused: too many requests pending
+    """
+
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class WorkQueue:
+    """
+    one row for every request: the audio files of a tenant to transcribe
+    a worker claims a request with a lease, renewed while it works on it;
+    if the worker dies, the request is taken again when the lease expires
+    (the job already submitted is re-attached)
+    """
+
+    def __init__(
+        self,
+        db_file=SERVICE_DB,
+        max_pending=SERVICE_MAX_PENDING,
+        max_pending_per_tenant=SERVICE_MAX_PENDING_PER_TENANT,
+        max_running_per_tenant=SERVICE_MAX_RUNNING_PER_TENANT,
+        max_attempts=SERVICE_MAX_ATTEMPTS,
+        lease=SERVICE_LEASE,
+    ):
+        self.db_file = db_file
+        self.max_pending = max_pending
+        self.max_pending_per_tenant = max_pending_per_tenant
+        self.max_running_per_tenant = max_running_per_tenant
+        self.max_attempts = max_attempts
+        self.lease = lease
+
+        self.lock = threading.Lock()
+        # autocommit, the transactions are explicit (BEGIN IMMEDIATE)
+        self.conn = sqlite3.connect(
+            db_file, check_same_thread=False, isolation_level=None, timeout=30
+        )
+
+        with self.lock:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS requests (
+                    request_id TEXT PRIMARY KEY,
+                    tenant TEXT,
+                    status TEXT,
+                    audio_dir TEXT,
+                    file_names TEXT,
+                    language_code TEXT,
+                    time_created REAL,
+                    time_updated REAL,
+                    attempts INTEGER,
+                    worker TEXT,
+                    lease_until REAL,
+                    job_id TEXT,
+                    output_prefix TEXT,
+                    object_names TEXT,
+                    deadline REAL,
+                    result_dir TEXT,
+                    n_results INTEGER,
+                    error TEXT)""")
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS requests_status "
+                "ON requests (status, time_created)"
+            )
+
+            # queues created before a column was added
+            names = [row[1] for row in self.conn.execute("PRAGMA table_info(requests)")]
+            if "deadline" not in names:
+                self.conn.execute("ALTER TABLE requests ADD COLUMN deadline REAL")
+
+    def transaction(self, func, *args):
+        """
+        run func(*args) in a write transaction: the other processes wait
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(*args)
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+        return result
+
+    @staticmethod
+    def to_dict(row):
+        request = dict(zip(COLUMNS, row))
+
+        for name in JSON_COLUMNS:
+            if request[name] is not None:
+                request[name] = json.loads(request[name])
+
+        return request
+
+    def count(self, states, tenant=None):
+        query = f"SELECT COUNT(*) FROM requests WHERE status IN ({', '.join('?' * len(states))})"
+        params = list(states)
+
+        if tenant is not None:
+            query += " AND tenant = ?"
+            params.append(tenant)
+
+        return self.conn.execute(query, params).fetchone()[0]
+
+    #
+    # clients
+    #
+    def enqueue(self, tenant, audio_dir, file_names, language_code):
+        """
+        add a request, refused (QueueFullError) if too many are pending
+        return the request_id
+        """
+        if not TENANT_PATTERN.match(tenant):
+            raise ValueError(f"Invalid tenant: {tenant}")
+        if not file_names:
+            raise ValueError("No files to transcribe")
+
+        request_id = f"req-{uuid.uuid4().hex[:12]}"
+
+        def insert():
+            # backpressure, checked in the same transaction of the insert
+            if self.count(PENDING_STATES) >= self.max_pending:
+                raise QueueFullError(f"Queue full: {self.max_pending} requests pending")
+            if self.count(PENDING_STATES, tenant) >= self.max_pending_per_tenant:
+                raise QueueFullError(
+                    f"Queue full for {tenant}: "
+                    f"{self.max_pending_per_tenant} requests pending"
+                )
+
+            now = time.time()
+            self.conn.execute(
+                "INSERT INTO requests (request_id, tenant, status, audio_dir, "
+                "file_names, language_code, time_created, time_updated, attempts) "
+                "VALUES (?, ?, 'QUEUED', ?, ?, ?, ?, ?, 0)",
+                (
+                    request_id,
+                    tenant,
+                    audio_dir,
+                    json.dumps(list(file_names)),
+                    language_code,
+                    now,
+                    now,
+                ),
+            )
+
+        self.transaction(insert)
+
+        return request_id
+
+    def get(self, request_id):
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM requests WHERE request_id = ?",
+                (request_id,),
+            ).fetchone()
+
+        return self.to_dict(row) if row is not None else None
+
+    def get_requests(self, tenant=None, states=None, limit=None):
+        """
+        list of dict, the most recent first
+        """
+        query = f"SELECT {', '.join(COLUMNS)} FROM requests"
+        conditions = []
+        params = []
+
+        if tenant is not None:
+            conditions.append("tenant = ?")
+            params.append(tenant)
+        if states is not None:
+            conditions.append(f"status IN ({', '.join('?' * len(states))})")
+            params += list(states)
+
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY time_created DESC"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+
+        return [self.to_dict(row) for row in rows]
+
+    def stats(self):
+        """
+        number of requests for every status
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) FROM requests GROUP BY status"
+            ).fetchall()
+
+        return dict(rows)
+
+    #
+    # workers
+    #
+    def claim(self, worker):
+        """
+        take the oldest request queued (or with the lease expired)
+        of a tenant under max_running_per_tenant
+        return the request (dict), None if there is nothing to do
+        """
+
+        def take():
+            now = time.time()
+            row = self.conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM requests "
+                "WHERE (status = 'QUEUED' OR (status = 'RUNNING' AND lease_until < ?)) "
+                "AND tenant NOT IN (SELECT tenant FROM requests "
+                "WHERE status = 'RUNNING' AND lease_until >= ? "
+                "GROUP BY tenant HAVING COUNT(*) >= ?) "
+                "ORDER BY time_created LIMIT 1",
+                (now, now, self.max_running_per_tenant),
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            request = self.to_dict(row)
+            request["attempts"] += 1
+            self.conn.execute(
+                "UPDATE requests SET status = 'RUNNING', worker = ?, lease_until = ?, "
+                "attempts = ?, time_updated = ? WHERE request_id = ?",
+                (
+                    worker,
+                    now + self.lease,
+                    request["attempts"],
+                    now,
+                    request["request_id"],
+                ),
+            )
+            request["status"] = "RUNNING"
+            request["worker"] = worker
+
+            return request
+
+        return self.transaction(take)
+
+    def update(self, request_id, worker, **values):
+        """
+        update the request and renew the lease
+        return False if the request is no longer owned by the worker
+        """
+        now = time.time()
+        values.setdefault("lease_until", now + self.lease)
+        values["time_updated"] = now
+
+        for name in JSON_COLUMNS:
+            if name in values and values[name] is not None:
+                values[name] = json.dumps(values[name])
+
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE requests SET "
+                + ", ".join(f"{name} = ?" for name in values)
+                + " WHERE request_id = ? AND worker = ? AND status = 'RUNNING'",
+                list(values.values()) + [request_id, worker],
+            )
+
+        return cursor.rowcount == 1
+
+    def renew(self, request_id, worker):
+        return self.update(request_id, worker)
+
+    def set_job(
+        self, request_id, worker, job_id, output_prefix, object_names, deadline
+    ):
+        """
+        deadline: time after which the job is canceled, kept also when
+        the job is re-attached by another worker
+        """
+        return self.update(
+            request_id,
+            worker,
+            job_id=job_id,
+            output_prefix=output_prefix,
+            object_names=object_names,
+            deadline=deadline,
+        )
+
+    def complete(self, request_id, worker, result_dir, n_results):
+        return self.update(
+            request_id,
+            worker,
+            status="SUCCEEDED",
+            result_dir=result_dir,
+            n_results=n_results,
+            lease_until=None,
+            error=None,
+        )
+
+    def is_last_attempt(self, attempts):
+        return attempts >= self.max_attempts
+
+    def fail(self, request_id, worker, error, attempts, keep_job=False):
+        """
+        the request is queued again or FAILED after max_attempts
+        keep_job: if True the job is re-attached by the next attempt
+        (ex: a poll failed, the job is still running), otherwise
+        a new job is submitted
+        """
+        status = "FAILED" if self.is_last_attempt(attempts) else "QUEUED"
+        values = {"status": status, "error": error, "lease_until": None}
+
+        if not keep_job:
+            values.update(
+                job_id=None, output_prefix=None, object_names=None, deadline=None
+            )
+
+        return self.update(request_id, worker, **values)
+
+    def release(self, request_id, worker):
+        """
+        give back the request (ex: the service is stopped), the job is kept
+        and re-attached by the next worker, the attempt is not counted
+        """
+        with self.lock:
+            self.conn.execute(
+                "UPDATE requests SET status = 'QUEUED', lease_until = NULL, "
+                "attempts = attempts - 1, time_updated = ? "
+                "WHERE request_id = ? AND worker = ? AND status = 'RUNNING'",
+                (time.time(), request_id, worker),
+            )
+
+    def close(self):
+        self.conn.close()